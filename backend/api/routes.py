@@ -1,20 +1,43 @@
 from fastapi import APIRouter, HTTPException, Depends, Request
 from sqlalchemy.orm import Session
 from sqlalchemy.sql import func
-from ..database import get_db
-from ..models import Transaction
+from sqlalchemy.dialects import postgresql, sqlite
+from ..database import get_db, SessionLocal
+from ..models import Transaction, TransactionSnapshot, SNAPSHOT_COLUMNS
 from ..services.user_tracking import user_tracking
-from ..services.whop_service import whop_service
+from ..services.whop_service import whop_service, WHOP_SESSION_CACHE
 from ..services.invoice_service import invoice_service
+from ..services.rate_limiter import checkout_rate_limiter
+from ..services.metrics import webhook_events
+from ..services.http_cache import weak_etag, http_date, parse_http_date, is_not_modified, not_modified
+from ..services.cache import cache
+from ..services.reconciliation import reconciliation_engine, ReconciliationError
+from ..services.bulk_operations import bulk_operations, BulkOperationError
+from ..services.search import transaction_search, SearchError
+from ..services.analytics import funnel_analytics, AnalyticsError
+from ..services.group_commit import checkout_writer
+from ..services.notifications import change_notifier
+from ..services.tracing import tracer
 from pydantic import BaseModel, EmailStr
-from typing import Optional, Dict, Any
-from fastapi.responses import StreamingResponse
+from typing import Optional, Dict, Any, List, Tuple
+from datetime import datetime, timedelta, timezone
+from fastapi.responses import StreamingResponse, Response
+from starlette.concurrency import run_in_threadpool
+import asyncio
 import json
+import math
 import logging
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
+# Cache namespaces derived from transactions; see invalidate_transaction_caches
+CHECKOUT_ACCESS_CACHE = "checkout_access"
+TRANSACTION_CACHE = "transactions"
+
+# Statuses a transaction does not leave on its own; event streams end there
+FINAL_STATUSES = ("completed", "failed", "expired")
+
 
 class TransactionCreate(BaseModel):
     amount: float
@@ -32,7 +55,318 @@ class CheckoutSessionCreate(BaseModel):
     metadata: Optional[Dict[str, Any]] = None
 
 
-@router.post("/create-cerebra-checkout")
+class BulkOperationCreate(BaseModel):
+    operation: str  # mark_failed, expire, retry or reprocess_webhook
+    ids: Optional[List[int]] = None
+    status: Optional[str] = None
+    plan_id: Optional[str] = None
+    user_id: Optional[str] = None
+    created_after: Optional[datetime] = None
+    created_before: Optional[datetime] = None
+    reason: Optional[str] = None  # error message for mark_failed
+
+
+async def checkout_rate_limit(request: Request):
+    """Reject checkout creation with 429 before any database work is done"""
+    user_info = user_tracking.extract_user_info(request)
+    retry_after = checkout_rate_limiter.check(user_info)
+    if retry_after:
+        logger.warning("Checkout rate limit exceeded for %s", user_info["ip_address"], extra={"event": "checkout_rate_limited"})
+        raise HTTPException(
+            status_code=429,
+            detail="Too many checkout attempts. Please try again shortly.",
+            headers={"Retry-After": str(math.ceil(retry_after))}
+        )
+
+
+def find_webhook_transaction(
+    db: Session,
+    webhook_data: Dict[str, Any],
+    session_id: str,
+    status: str = "pending"
+) -> Optional[Transaction]:
+    """Resolve the transaction a Whop webhook refers to.
+
+    The checkout reference we passed through Whop metadata is a unique indexed
+    column, so a webhook carrying it resolves with a single point lookup and is
+    never matched to anyone else's checkout. Webhooks without a reference (for
+    checkouts created before references existed) fall back to the Whop session
+    ID and finally to the most recent transaction in ``status``.
+    """
+    # A checkout paid after it expired from reuse is still that user's payment
+    statuses = (status, "expired") if status == "pending" else (status,)
+    
+    checkout_reference = whop_service.extract_checkout_reference_from_webhook(webhook_data)
+    if checkout_reference:
+        return db.query(Transaction).filter(
+            Transaction.checkout_reference == checkout_reference,
+            Transaction.status.in_(statuses)
+        ).first()
+    
+    if session_id:
+        transaction = db.query(Transaction).filter(
+            Transaction.whop_session_id == session_id,
+            Transaction.status.in_(statuses)
+        ).first()
+        if transaction:
+            return transaction
+    
+    logger.warning("Webhook carries no checkout reference, matching most recent %s transaction", status)
+    return db.query(Transaction).filter(
+        Transaction.status == status
+    ).order_by(Transaction.created_at.desc()).first()
+
+
+def invalidate_transaction_caches(db: Session, transaction: Transaction):
+    """Evict everything cached from this transaction, in every worker, once db commits"""
+    cache.invalidate(db, TRANSACTION_CACHE, transaction.id)
+    cache.invalidate(db, CHECKOUT_ACCESS_CACHE, transaction.user_id)
+    cache.invalidate(db, WHOP_SESSION_CACHE, transaction.whop_session_id)
+
+
+def invalidate_transaction_rows(db: Session, rows):
+    """Bulk form of invalidate_transaction_caches for rows with id, user_id and whop_session_id"""
+    cache.invalidate_many(db, TRANSACTION_CACHE, [row.id for row in rows])
+    cache.invalidate_many(db, CHECKOUT_ACCESS_CACHE, [row.user_id for row in rows])
+    cache.invalidate_many(db, WHOP_SESSION_CACHE, [row.whop_session_id for row in rows])
+
+
+def upsert_pending_checkout(db: Session, values: Dict[str, Any]) -> Tuple[Transaction, bool]:
+    """Open a pending checkout for values["user_id"], or return the one already open.
+
+    Pending rows untouched for CHECKOUT_REUSE_WINDOW (since they were created
+    or last updated, e.g. reopened by a bulk retry) are expired first. The insert
+    is an INSERT ... ON CONFLICT DO NOTHING against the partial unique index on
+    user_id WHERE status = 'pending', so retries and double clicks (even racing
+    ones in different workers) converge on a single row. Returns
+    (transaction, created) after committing.
+    """
+    user_id = values["user_id"]
+    cutoff = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(seconds=whop_service.checkout_reuse_window)
+    stale = db.query(Transaction).filter(
+        Transaction.user_id == user_id,
+        Transaction.status == "pending",
+        func.coalesce(Transaction.updated_at, Transaction.created_at) < cutoff
+    ).all()
+    for transaction in stale:
+        transaction.status = "expired"
+        invalidate_transaction_caches(db, transaction)
+    db.flush()
+    
+    dialect = db.get_bind().dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        insert = sqlite.insert if dialect == "sqlite" else postgresql.insert
+        result = db.execute(
+            insert(Transaction).values(**values).on_conflict_do_nothing(
+                index_elements=[Transaction.user_id],
+                index_where=Transaction.status == "pending"
+            )
+        )
+        created = result.rowcount == 1
+    else:
+        # No portable upsert: fall back to check-then-insert
+        created = not db.query(Transaction.id).filter(
+            Transaction.user_id == user_id,
+            Transaction.status == "pending"
+        ).first()
+        if created:
+            db.add(Transaction(**values))
+            db.flush()
+    
+    # Ours or the one that was already open: there is exactly one either way
+    transaction = db.query(Transaction).filter(
+        Transaction.user_id == user_id,
+        Transaction.status == "pending"
+    ).one()
+    if created:
+        invalidate_transaction_caches(db, transaction)
+    db.commit()
+    if created:
+        funnel_analytics.record_checkout(transaction.plan_id, transaction.created_at)
+    return transaction, created
+
+
+def stage_pending_checkouts(db: Session, batch: List[Dict[str, Any]]) -> List[Tuple[Transaction, bool]]:
+    """Set-based upsert_pending_checkout for a group commit batch, without committing.
+
+    Same semantics in a fixed number of statements however large the batch:
+    one UPDATE expires stale rows, one multi-row INSERT ... ON CONFLICT DO
+    NOTHING RETURNING opens the missing checkouts (its RETURNING tells which
+    users got a new row), one SELECT loads each user's pending row. Two
+    checkouts of the same user in a batch share the row the first one opened.
+    """
+    dialect = db.get_bind().dialect.name
+    if dialect not in ("sqlite", "postgresql"):
+        # No upsert to batch: stage them one by one
+        results = []
+        for values in batch:
+            user_id = values["user_id"]
+            created = not db.query(Transaction.id).filter(
+                Transaction.user_id == user_id,
+                Transaction.status == "pending"
+            ).first()
+            if created:
+                db.add(Transaction(**values))
+                db.flush()
+            transaction = db.query(Transaction).filter(
+                Transaction.user_id == user_id,
+                Transaction.status == "pending"
+            ).one()
+            if created:
+                invalidate_transaction_caches(db, transaction)
+            results.append((transaction, created))
+        return results
+
+    user_ids = list(dict.fromkeys(values["user_id"] for values in batch))
+    cutoff = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(seconds=whop_service.checkout_reuse_window)
+    stale = db.query(Transaction.id, Transaction.user_id, Transaction.whop_session_id).filter(
+        Transaction.user_id.in_(user_ids),
+        Transaction.status == "pending",
+        func.coalesce(Transaction.updated_at, Transaction.created_at) < cutoff
+    ).all()
+    if stale:
+        db.query(Transaction).filter(
+            Transaction.id.in_([row.id for row in stale]),
+            Transaction.status == "pending"
+        ).update({"status": "expired"}, synchronize_session=False)
+        invalidate_transaction_rows(db, stale)
+
+    # A multi-row VALUES needs the same columns in every row: one INSERT per column set
+    first, by_columns = set(), {}
+    for values in batch:
+        if values["user_id"] not in first:
+            first.add(values["user_id"])
+            by_columns.setdefault(tuple(sorted(values)), []).append(values)
+    insert = sqlite.insert if dialect == "sqlite" else postgresql.insert
+    inserted = set()
+    for rows in by_columns.values():
+        inserted.update(db.execute(
+            insert(Transaction).values(rows).on_conflict_do_nothing(
+                index_elements=[Transaction.user_id],
+                index_where=Transaction.status == "pending"
+            ).returning(Transaction.id)
+        ).scalars())
+
+    pending = {
+        transaction.user_id: transaction
+        for transaction in db.query(Transaction).filter(
+            Transaction.user_id.in_(user_ids),
+            Transaction.status == "pending"
+        )
+    }
+    invalidate_transaction_rows(db, [transaction for transaction in pending.values() if transaction.id in inserted])
+
+    results = []
+    for values in batch:
+        transaction = pending[values["user_id"]]
+        # Only the first checkout of a user in the batch counts as the one that opened the row
+        results.append((transaction, transaction.id in inserted))
+        inserted.discard(transaction.id)
+    return results
+
+
+async def open_pending_checkout(db: Session, values: Dict[str, Any]) -> Tuple[Transaction, bool]:
+    """upsert_pending_checkout, committed together with concurrent checkouts when CHECKOUT_GROUP_COMMIT is on"""
+    if not checkout_writer.enabled:
+        return upsert_pending_checkout(db, values)
+    # Nothing to keep in the request's session: hand its pooled connection back while we wait,
+    # or a burst of waiting requests would leave the writer none to commit with
+    db.rollback()
+    transaction, created = await checkout_writer.submit(stage_pending_checkouts, values)
+    if created:
+        funnel_analytics.record_checkout(transaction.plan_id, transaction.created_at)
+    return transaction, created
+
+
+def transaction_cache_headers(transaction_id: int, updated_at, created_at, status: str) -> Dict[str, str]:
+    """Validators for any representation of a transaction; every ORM update bumps updated_at"""
+    changed_at = updated_at or created_at
+    headers = {
+        "ETag": weak_etag(transaction_id, changed_at, status),
+        # Clients may keep the response but must revalidate before reusing it
+        "Cache-Control": "private, no-cache",
+    }
+    if changed_at is not None:
+        headers["Last-Modified"] = http_date(changed_at)
+    return headers
+
+
+def transaction_snapshot(db: Session, transaction_id: int) -> Optional[Dict[str, Any]]:
+    """Validators and TransactionSnapshot of a transaction, read through the cache.
+
+    Detail, status, receipt and invoice requests for the same few IDs are
+    answered from the cache until a write path invalidates the ID. None
+    (cached too) when the ID does not exist; creating that row invalidates it
+    like any other write.
+    """
+    def load_snapshot():
+        row = db.query(*SNAPSHOT_COLUMNS).filter(Transaction.id == transaction_id).first()
+        if row is None:
+            return None
+        transaction = TransactionSnapshot.from_row(row)
+        return {
+            "headers": transaction_cache_headers(
+                transaction.id, transaction.updated_at, transaction.created_at, transaction.status
+            ),
+            "transaction": transaction
+        }
+    
+    return cache.get_or_load(TRANSACTION_CACHE, transaction_id, load_snapshot)
+
+
+def load_snapshots(query) -> List[TransactionSnapshot]:
+    """TransactionSnapshots of a query selecting SNAPSHOT_COLUMNS"""
+    return [TransactionSnapshot.from_row(row) for row in query]
+
+
+def load_transaction_snapshot(transaction_id: int) -> Optional[Dict[str, Any]]:
+    """transaction_snapshot in a short-lived session, for requests that wait between reads"""
+    db = SessionLocal()
+    try:
+        return transaction_snapshot(db, transaction_id)
+    finally:
+        db.close()
+
+
+def transaction_statuses(transaction_ids) -> Dict[str, Optional[str]]:
+    """Current status of each transaction ID, for waiters the invalidation bus can't wake"""
+    ids = sorted({int(transaction_id) for transaction_id in transaction_ids})
+    statuses = {}
+    db = SessionLocal()
+    try:
+        # Keeps IN (...) lists well under SQLite's bound-parameter limit
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            for row in db.query(Transaction.id, Transaction.status).filter(Transaction.id.in_(chunk)):
+                statuses[str(row.id)] = row.status
+    finally:
+        db.close()
+    return statuses
+
+
+change_notifier.register_probe(TRANSACTION_CACHE, transaction_statuses)
+
+
+def status_event(snapshot: Dict[str, Any], changed: bool) -> Dict[str, Any]:
+    transaction = snapshot["transaction"]
+    return {
+        "transaction_id": transaction.id,
+        "status": transaction.status,
+        # Also sent over the event stream, which is serialized with json.dumps
+        "completed_at": transaction.completed_at.isoformat() if transaction.completed_at else None,
+        "changed": changed,
+    }
+
+
+def snapshot_not_modified(request: Request, snapshot: Dict[str, Any]) -> Optional[Response]:
+    """304 for a conditional request whose validators match the snapshot"""
+    headers = snapshot["headers"]
+    if is_not_modified(request, headers["ETag"], parse_http_date(headers.get("Last-Modified"))):
+        return not_modified(headers)
+    return None
+
+
+@router.post("/create-cerebra-checkout", dependencies=[Depends(checkout_rate_limit)])
 async def create_cerebra_checkout(
     checkout_data: CheckoutSessionCreate,
     request: Request,
@@ -58,18 +392,22 @@ async def create_cerebra_checkout(
         if existing_transaction:
             raise HTTPException(status_code=400, detail="User has already purchased this plan")
         
+        # Correlation key echoed back to us in the webhook's metadata
+        checkout_reference = whop_service.generate_checkout_reference()
+        
         # Generate checkout URL with tracking
         checkout_url = whop_service.get_checkout_url(
             user_id=user_id,
             metadata={
                 "tier": "premium",
                 "source": "cerebra_app",
-                **(checkout_data.metadata or {})
+                **(checkout_data.metadata or {}),
+                whop_service.CHECKOUT_REFERENCE_KEY: checkout_reference
             }
         )
         
-        # Create transaction record
-        db_transaction = Transaction(
+        # Create the transaction record, or hand back this user's open checkout
+        db_transaction, created = await open_pending_checkout(db, dict(
             plan_id=checkout_data.plan_id,
             checkout_link=whop_service.checkout_link,
             amount=checkout_data.amount,
@@ -78,6 +416,7 @@ async def create_cerebra_checkout(
             user_id=user_id,
             session_id=user_info["session_id"],
             whop_checkout_url=checkout_url,
+            checkout_reference=checkout_reference,
             ip_address=user_info["ip_address"],
             user_agent=user_info["user_agent"],
             status='pending',
@@ -86,27 +425,23 @@ async def create_cerebra_checkout(
                 "user_fingerprint": user_info["user_fingerprint"],
                 "tracking_data": user_info
             })
-        )
-        
-        db.add(db_transaction)
-        db.commit()
-        db.refresh(db_transaction)
+        ))
         
         return {
-            "checkout_url": checkout_url,
+            "checkout_url": db_transaction.whop_checkout_url,
             "transaction_id": db_transaction.id,
             "user_id": user_id,
-            "status": "created"
+            "status": "created" if created else "reused"
         }
         
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Checkout creation failed: {str(e)}")
+        logger.exception("Checkout creation failed: %s", e, extra={"event": "checkout_error"})
         raise HTTPException(status_code=500, detail=f"Failed to create checkout: {str(e)}")
 
 
-@router.post("/transactions/")
+@router.post("/transactions/", dependencies=[Depends(checkout_rate_limit)])
 async def create_transaction(
     transaction: TransactionCreate, 
     request: Request,
@@ -123,8 +458,8 @@ async def create_transaction(
             name=transaction.customer_name
         )
         
-        # Create transaction record with user tracking
-        db_transaction = Transaction(
+        # Create transaction record with user tracking (or reuse this user's open one)
+        db_transaction, _ = await open_pending_checkout(db, dict(
             plan_id=transaction.plan_id,
             checkout_link="plan_oPKqUgfiFWUVO",  # Your checkout link
             amount=transaction.amount,
@@ -140,11 +475,7 @@ async def create_transaction(
                 "user_fingerprint": user_info["user_fingerprint"],
                 "tracking_data": user_info
             })
-        )
-        
-        db.add(db_transaction)
-        db.commit()
-        db.refresh(db_transaction)
+        ))
         
         return {
             "id": db_transaction.id,
@@ -158,17 +489,23 @@ async def create_transaction(
         }
         
     except Exception as e:
-        logger.error(f"Transaction creation failed: {str(e)}")
+        logger.exception("Transaction creation failed: %s", e, extra={"event": "checkout_error"})
         raise HTTPException(status_code=500, detail=f"Failed to create transaction: {str(e)}")
 
 
 @router.get("/transactions/{transaction_id}")
-def read_transaction(transaction_id: int, db: Session = Depends(get_db)):
+def read_transaction(transaction_id: int, request: Request, response: Response, db: Session = Depends(get_db)):
     """Get transaction details"""
-    transaction = db.query(Transaction).filter(Transaction.id == transaction_id).first()
-    if transaction is None:
+    snapshot = transaction_snapshot(db, transaction_id)
+    if snapshot is None:
         raise HTTPException(status_code=404, detail="Transaction not found")
     
+    cached = snapshot_not_modified(request, snapshot)
+    if cached:
+        return cached
+    
+    response.headers.update(snapshot["headers"])
+    transaction = snapshot["transaction"]
     return {
         "id": transaction.id,
         "plan_id": transaction.plan_id,
@@ -185,6 +522,86 @@ def read_transaction(transaction_id: int, db: Session = Depends(get_db)):
     }
 
 
+@router.get("/transactions/{transaction_id}/wait")
+async def wait_for_transaction(transaction_id: int, status: str = "pending", timeout: Optional[float] = None):
+    """Long-poll until the transaction's status is no longer ``status`` (the one the client last saw)
+    
+    Answers at once if it already differs, otherwise when a write to the
+    transaction changes it, or with changed=false after ``timeout`` seconds
+    (capped at PAYMENT_WAIT_TIMEOUT). The wait holds no database connection.
+    """
+    loop = asyncio.get_running_loop()
+    limit = change_notifier.wait_timeout
+    deadline = loop.time() + max(min(timeout if timeout is not None else limit, limit), 0)
+    while True:
+        # Subscribe before reading so a change in between still wakes us
+        future = change_notifier.subscribe(TRANSACTION_CACHE, transaction_id)
+        try:
+            snapshot = await run_in_threadpool(load_transaction_snapshot, transaction_id)
+            if snapshot is None:
+                raise HTTPException(status_code=404, detail="Transaction not found")
+            if snapshot["transaction"].status != status:
+                return status_event(snapshot, True)
+            change_notifier.seen(TRANSACTION_CACHE, transaction_id, snapshot["transaction"].status)
+            if not await change_notifier.wait(future, deadline - loop.time()):
+                return status_event(snapshot, False)
+        finally:
+            change_notifier.unsubscribe(TRANSACTION_CACHE, transaction_id, future)
+
+
+@router.get("/transactions/{transaction_id}/events")
+async def transaction_events(transaction_id: int):
+    """Server-sent events: the transaction's status now and after every change, until it is final
+    
+    Comment lines keep idle connections alive, and the status is re-read
+    after each one; the stream ends with a ``timeout`` event after
+    PAYMENT_EVENTS_TIMEOUT seconds and browsers' EventSource reconnects by
+    itself.
+    """
+    if await run_in_threadpool(load_transaction_snapshot, transaction_id) is None:
+        raise HTTPException(status_code=404, detail="Transaction not found")
+
+    async def stream():
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + change_notifier.stream_timeout
+        last_status = None
+        future = change_notifier.subscribe(TRANSACTION_CACHE, transaction_id)
+        try:
+            changed = True
+            while True:
+                if changed:
+                    # Re-subscribe before re-reading, then read only because something was written
+                    change_notifier.unsubscribe(TRANSACTION_CACHE, transaction_id, future)
+                    future = change_notifier.subscribe(TRANSACTION_CACHE, transaction_id)
+                    snapshot = await run_in_threadpool(load_transaction_snapshot, transaction_id)
+                    if snapshot is None:
+                        return
+                    status = snapshot["transaction"].status
+                    change_notifier.seen(TRANSACTION_CACHE, transaction_id, status)
+                    if status != last_status:
+                        yield f"event: status\ndata: {json.dumps(status_event(snapshot, last_status is not None))}\n\n"
+                        last_status = status
+                    if status in FINAL_STATUSES:
+                        return
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    yield "event: timeout\ndata: {}\n\n"
+                    return
+                changed = await change_notifier.wait(future, min(remaining, change_notifier.heartbeat_interval))
+                if not changed:
+                    yield ": keep-alive\n\n"
+                    # Re-read anyway, in case a notification was lost
+                    changed = True
+        finally:
+            change_notifier.unsubscribe(TRANSACTION_CACHE, transaction_id, future)
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        # Don't let nginx buffer the stream
+        "X-Accel-Buffering": "no",
+    })
+
+
 @router.get("/transactions/")
 def list_transactions(
     skip: int = 0, 
@@ -193,12 +610,12 @@ def list_transactions(
     db: Session = Depends(get_db)
 ):
     """List transactions with optional filtering"""
-    query = db.query(Transaction)
+    query = db.query(*SNAPSHOT_COLUMNS)
     
     if status:
         query = query.filter(Transaction.status == status)
     
-    transactions = query.offset(skip).limit(limit).all()
+    transactions = load_snapshots(query.offset(skip).limit(limit))
     
     return [
         {
@@ -221,7 +638,7 @@ def list_transactions(
 @router.get("/transactions/user/{user_id}")
 def get_user_transactions(user_id: str, db: Session = Depends(get_db)):
     """Get all transactions for a specific user"""
-    transactions = db.query(Transaction).filter(Transaction.user_id == user_id).all()
+    transactions = load_snapshots(db.query(*SNAPSHOT_COLUMNS).filter(Transaction.user_id == user_id))
     
     return [
         {
@@ -243,7 +660,7 @@ def get_user_transactions(user_id: str, db: Session = Depends(get_db)):
 @router.get("/transactions/session/{session_id}")
 def get_session_transactions(session_id: str, db: Session = Depends(get_db)):
     """Get all transactions for a specific session"""
-    transactions = db.query(Transaction).filter(Transaction.session_id == session_id).all()
+    transactions = load_snapshots(db.query(*SNAPSHOT_COLUMNS).filter(Transaction.session_id == session_id))
     
     return [
         {
@@ -314,7 +731,7 @@ async def validate_whop_session(
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Session validation failed: {str(e)}")
+        logger.error("Session validation failed: %s", e)
         raise HTTPException(status_code=500, detail="Session validation failed")
 
 
@@ -326,45 +743,59 @@ async def check_checkout_access(
 ):
     """Check if a user has access to create checkout sessions"""
     try:
-        user_info = user_tracking.extract_user_info(request)
-        
-        # Check for recent pending transactions from this user
-        recent_pending = db.query(Transaction).filter(
-            Transaction.user_id == user_id,
-            Transaction.status == "pending"
-        ).count()
+        def load_access():
+            # Check for recent pending transactions from this user
+            recent_pending = db.query(Transaction).filter(
+                Transaction.user_id == user_id,
+                Transaction.status == "pending"
+            ).count()
+            
+            # Check for completed transactions (prevent duplicate purchases)
+            completed_transactions = db.query(Transaction).filter(
+                Transaction.user_id == user_id,
+                Transaction.status == "completed"
+            ).count()
+            
+            return {
+                "can_checkout": recent_pending == 0 and completed_transactions == 0,
+                "pending_transactions": recent_pending,
+                "completed_transactions": completed_transactions,
+                "message": (
+                    "Access granted" if recent_pending == 0 and completed_transactions == 0
+                    else "Pending transaction exists" if recent_pending > 0
+                    else "Already purchased"
+                )
+            }
         
-        # Check for completed transactions (prevent duplicate purchases)
-        completed_transactions = db.query(Transaction).filter(
-            Transaction.user_id == user_id,
-            Transaction.status == "completed"
-        ).count()
-        
-        return {
-            "can_checkout": recent_pending == 0 and completed_transactions == 0,
-            "pending_transactions": recent_pending,
-            "completed_transactions": completed_transactions,
-            "message": (
-                "Access granted" if recent_pending == 0 and completed_transactions == 0
-                else "Pending transaction exists" if recent_pending > 0
-                else "Already purchased"
-            )
-        }
+        # Evicted by checkout creation and webhooks for this user
+        return cache.get_or_load(CHECKOUT_ACCESS_CACHE, user_id, load_access)
         
     except Exception as e:
-        logger.error(f"Checkout access check failed: {str(e)}")
+        logger.error("Checkout access check failed: %s", e)
         raise HTTPException(status_code=500, detail="Access check failed")
 
 
 @router.get("/admin/payment-status/{transaction_id}")
-async def check_payment_status(transaction_id: int, db: Session = Depends(get_db)):
+async def check_payment_status(
+    transaction_id: int,
+    request: Request,
+    response: Response,
+    db: Session = Depends(get_db)
+):
     """Check payment status for a specific transaction (admin endpoint)"""
     try:
-        transaction = db.query(Transaction).filter(Transaction.id == transaction_id).first()
+        # Served from the cache until a webhook or checkout write evicts this ID
+        snapshot = transaction_snapshot(db, transaction_id)
         
-        if not transaction:
+        if not snapshot:
             raise HTTPException(status_code=404, detail="Transaction not found")
         
+        cached = snapshot_not_modified(request, snapshot)
+        if cached:
+            return cached
+        
+        response.headers.update(snapshot["headers"])
+        transaction = snapshot["transaction"]
         result = {
             "transaction_id": transaction.id,
             "current_status": transaction.status,
@@ -382,44 +813,52 @@ async def check_payment_status(transaction_id: int, db: Session = Depends(get_db
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Payment status check failed: {str(e)}")
+        logger.error("Payment status check failed: %s", e)
         raise HTTPException(status_code=500, detail="Status check failed")
 
 
 @router.get("/invoice/{transaction_id}")
-async def get_invoice_data(transaction_id: int, db: Session = Depends(get_db)):
+async def get_invoice_data(
+    transaction_id: int,
+    request: Request,
+    response: Response,
+    db: Session = Depends(get_db)
+):
     """Get invoice/receipt data for a completed transaction"""
     try:
-        transaction = db.query(Transaction).filter(
-            Transaction.id == transaction_id,
-            Transaction.status == "completed"
-        ).first()
-        
-        if not transaction:
+        # The snapshot carries the receipt fields and is evicted by the webhook that completes the transaction
+        snapshot = transaction_snapshot(db, transaction_id)
+        if snapshot is None or snapshot["transaction"].status != "completed":
             raise HTTPException(status_code=404, detail="Completed transaction not found")
         
-        receipt_data = invoice_service.get_receipt_data(transaction)
-        return receipt_data
+        cached = snapshot_not_modified(request, snapshot)
+        if cached:
+            return cached
+        
+        response.headers.update(snapshot["headers"])
+        return invoice_service.get_receipt_data(snapshot["transaction"])
         
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Invoice data retrieval failed: {str(e)}")
+        logger.error("Invoice data retrieval failed: %s", e)
         raise HTTPException(status_code=500, detail="Failed to get invoice data")
 
 
 @router.get("/invoice/{transaction_id}/download")
-async def download_invoice_pdf(transaction_id: int, db: Session = Depends(get_db)):
+async def download_invoice_pdf(transaction_id: int, request: Request, db: Session = Depends(get_db)):
     """Download PDF invoice for a completed transaction"""
     try:
-        transaction = db.query(Transaction).filter(
-            Transaction.id == transaction_id,
-            Transaction.status == "completed"
-        ).first()
-        
-        if not transaction:
+        snapshot = transaction_snapshot(db, transaction_id)
+        if snapshot is None or snapshot["transaction"].status != "completed":
             raise HTTPException(status_code=404, detail="Completed transaction not found")
         
+        cached = snapshot_not_modified(request, snapshot)
+        if cached:
+            return cached
+        
+        transaction = snapshot["transaction"]
+        
         # Generate PDF
         pdf_buffer = invoice_service.generate_invoice_pdf(transaction)
         
@@ -428,17 +867,133 @@ async def download_invoice_pdf(transaction_id: int, db: Session = Depends(get_db
             pdf_buffer,
             media_type="application/pdf",
             headers={
-                "Content-Disposition": f"attachment; filename=cerebra-invoice-{transaction.id:06d}.pdf"
+                "Content-Disposition": f"attachment; filename=cerebra-invoice-{transaction.id:06d}.pdf",
+                **snapshot["headers"]
             }
         )
         
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"PDF generation failed: {str(e)}")
+        logger.error("PDF generation failed: %s", e)
         raise HTTPException(status_code=500, detail="Failed to generate PDF invoice")
 
 
+@router.post("/admin/reconcile")
+async def reconcile_payments(dry_run: bool = False, full: bool = False):
+    """Correct transactions from Whop's payment records, e.g. after missed webhooks (admin endpoint)"""
+    try:
+        return await reconciliation_engine.run(
+            SessionLocal,
+            dry_run=dry_run,
+            full=full,
+            invalidate=invalidate_transaction_caches
+        )
+    except ReconciliationError as e:
+        logger.warning("Reconciliation not run: %s", e)
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        logger.error("Reconciliation failed: %s", e)
+        raise HTTPException(status_code=500, detail="Reconciliation failed")
+
+
+@router.get("/admin/reconcile")
+def reconciliation_status():
+    """High-water mark and summary of the last reconciliation run (admin endpoint)"""
+    return reconciliation_engine.status(SessionLocal)
+
+
+@router.post("/admin/bulk", status_code=202)
+async def start_bulk_operation(operation: BulkOperationCreate):
+    """Mark failed, expire, retry or reprocess many transactions as chunked set-based UPDATEs (admin endpoint)"""
+    try:
+        return bulk_operations.start(
+            SessionLocal,
+            operation.operation,
+            ids=operation.ids,
+            criteria={
+                "status": operation.status,
+                "plan_id": operation.plan_id,
+                "user_id": operation.user_id,
+                "created_after": operation.created_after,
+                "created_before": operation.created_before,
+            },
+            reason=operation.reason,
+            invalidate=invalidate_transaction_rows
+        )
+    except BulkOperationError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error("Bulk operation could not start: %s", e)
+        raise HTTPException(status_code=500, detail="Failed to start bulk operation")
+
+
+@router.get("/admin/bulk")
+def list_bulk_operations(limit: int = 20):
+    """Most recent bulk operations with their progress (admin endpoint)"""
+    return bulk_operations.recent(SessionLocal, limit=min(max(limit, 1), 100))
+
+
+@router.get("/admin/bulk/{job_id}")
+def get_bulk_operation(job_id: str):
+    """Progress and affected count of one bulk operation (admin endpoint)"""
+    job = bulk_operations.get(SessionLocal, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Bulk operation not found")
+    return job
+
+
+@router.get("/admin/cache")
+def cache_statistics():
+    """Entries, evictions and per-namespace hit ratios of this worker's cache"""
+    return cache.snapshot_stats()
+
+
+@router.get("/admin/traces")
+def recent_traces(trace_id: Optional[str] = None):
+    """Slow, failed and sampled request traces kept by this worker, newest first (admin endpoint)"""
+    traces = tracer.recent_traces(trace_id)
+    if trace_id and not traces:
+        raise HTTPException(status_code=404, detail="Trace not kept by this worker")
+    return traces
+
+
+@router.get("/admin/search")
+def search_transactions(q: str, limit: int = 20, offset: int = 0, db: Session = Depends(get_db)):
+    """Ranked search by partial email, name, user ID or Whop payment ID (admin endpoint)"""
+    try:
+        return transaction_search.search(db, q, limit=min(max(limit, 1), 100), offset=max(offset, 0))
+    except SearchError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error("Transaction search failed: %s", e)
+        raise HTTPException(status_code=500, detail="Search failed")
+
+
+@router.get("/admin/analytics")
+def conversion_analytics(hours: int = 24, plan_id: Optional[str] = None):
+    """Hourly checkout-to-payment conversion and time-to-pay quantiles per plan (admin endpoint)"""
+    try:
+        return funnel_analytics.report(hours=min(max(hours, 1), 24 * 90), plan_id=plan_id)
+    except AnalyticsError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        logger.error("Analytics report failed: %s", e)
+        raise HTTPException(status_code=500, detail="Failed to build analytics report")
+
+
+@router.post("/admin/analytics/recompute")
+def recompute_analytics(hours: Optional[int] = None):
+    """Rebuild the analytics buckets from transaction history, all of it unless ``hours`` is given (admin endpoint)"""
+    try:
+        return funnel_analytics.recompute(hours=max(hours, 1) if hours is not None else None)
+    except AnalyticsError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        logger.error("Analytics recompute failed: %s", e)
+        raise HTTPException(status_code=500, detail="Failed to recompute analytics")
+
+
 @router.post("/admin/test-webhook")
 async def test_webhook_processing(db: Session = Depends(get_db)):
     """Test endpoint to manually update most recent pending transaction"""
@@ -461,6 +1016,7 @@ async def test_webhook_processing(db: Session = Depends(get_db)):
         extra_data["test_update"] = True
         transaction.extra_data = json.dumps(extra_data)
         
+        invalidate_transaction_caches(db, transaction)
         db.commit()
         
         return {
@@ -470,7 +1026,7 @@ async def test_webhook_processing(db: Session = Depends(get_db)):
         }
         
     except Exception as e:
-        logger.error(f"Test webhook failed: {str(e)}")
+        logger.error("Test webhook failed: %s", e)
         raise HTTPException(status_code=500, detail="Test failed")
 
 
@@ -506,28 +1062,18 @@ async def whop_webhook(
         # Extract session ID from webhook
         session_id = whop_service.extract_session_id_from_webhook(webhook_data)
         
-        logger.info(f"Received Whop webhook: {event_type}")
+        logger.info("Received Whop webhook: %s", event_type, extra={"event": "webhook_received", "event_type": event_type})
+        webhook_events.inc(event_type or "unknown")
+        # Ended below; if the handler raises, the request's trace closes it
+        branch_span = tracer.start_span(f"webhook.{event_type or 'unknown'}")
         
         if event_type == "payment_succeeded":
             # Extract real payment data from Whop webhook
             payment_data = data.get("payment", {}) or data
             customer_data = payment_data.get("customer", {}) or data.get("customer", {})
             
-            # Find transaction by user tracking or most recent pending
-            transaction = None
-            
-            # Try to find by session ID if available
-            if session_id:
-                transaction = db.query(Transaction).filter(
-                    Transaction.whop_session_id == session_id,
-                    Transaction.status == "pending"
-                ).first()
-            
-            # Fallback: find most recent pending transaction
-            if not transaction:
-                transaction = db.query(Transaction).filter(
-                    Transaction.status == "pending"
-                ).order_by(Transaction.created_at.desc()).first()
+            # Find the transaction this checkout was created for
+            transaction = find_webhook_transaction(db, webhook_data, session_id)
             
             if transaction:
                 # Update with real Whop data
@@ -552,71 +1098,78 @@ async def whop_webhook(
                 extra_data["whop_payment_id"] = payment_data.get("id")
                 extra_data["whop_invoice_id"] = payment_data.get("invoice_id")
                 transaction.extra_data = json.dumps(extra_data)
+                transaction.whop_payment_id = payment_data.get("id") or transaction.whop_payment_id
                 
+                invalidate_transaction_caches(db, transaction)
                 db.commit()
-                logger.info(f"Payment succeeded: Transaction {transaction.id} for {transaction.customer_name} - ${transaction.amount}")
+                logger.info(
+                    "Payment succeeded: Transaction %s for %s - $%s", transaction.id, transaction.customer_name,
+                    transaction.amount, extra={"event": "payment_succeeded", "transaction_id": transaction.id}
+                )
+                funnel_analytics.record_outcome(
+                    transaction.plan_id, transaction.created_at, "completed",
+                    amount=transaction.amount, completed_at=transaction.completed_at
+                )
             else:
-                logger.warning("No pending transaction found for payment_succeeded event")
+                logger.warning("No pending transaction found for payment_succeeded event", extra={"event": "webhook_unmatched"})
         
         elif event_type == "payment_failed":
-            # Find transaction by session ID or most recent pending
-            transaction = None
-            
-            if session_id:
-                transaction = db.query(Transaction).filter(
-                    Transaction.whop_session_id == session_id,
-                    Transaction.status == "pending"
-                ).first()
-            
-            if not transaction:
-                transaction = db.query(Transaction).filter(
-                    Transaction.status == "pending"
-                ).order_by(Transaction.created_at.desc()).first()
+            # Find the transaction this checkout was created for
+            transaction = find_webhook_transaction(db, webhook_data, session_id)
             
             if transaction:
                 transaction.status = "failed"
                 transaction.webhook_received = True
                 transaction.error_message = data.get("failure_reason", "Payment failed")
+                transaction.whop_payment_id = data.get("id") or transaction.whop_payment_id
                 
                 # Store webhook data for audit
                 extra_data = json.loads(transaction.extra_data or "{}")
                 extra_data["webhook_data"] = webhook_data
                 transaction.extra_data = json.dumps(extra_data)
                 
+                invalidate_transaction_caches(db, transaction)
                 db.commit()
-                logger.info(f"❌ Payment failed: Transaction {transaction.id} for user {transaction.user_id}")
+                logger.info(
+                    "❌ Payment failed: Transaction %s for user %s", transaction.id, transaction.user_id,
+                    extra={"event": "payment_failed", "transaction_id": transaction.id}
+                )
+                funnel_analytics.record_outcome(transaction.plan_id, transaction.created_at, "failed")
             else:
-                logger.warning(f"⚠️ No pending transaction found for payment_failed event")
+                logger.warning("⚠️ No pending transaction found for payment_failed event", extra={"event": "webhook_unmatched"})
         
         elif event_type == "payment_pending":
-            # Handle pending payments (useful for tracking)
-            logger.info(f"💰 Payment pending: {data}")
+            # Handle pending payments (useful for tracking); the payload itself is stored nowhere, so log its ID only
+            logger.info("💰 Payment pending: %s", data.get("id"), extra={"event": "payment_pending"})
         
         elif event_type == "membership_went_valid":
             # Handle successful membership activation
-            transaction = db.query(Transaction).filter(
-                Transaction.status == "completed"
-            ).order_by(Transaction.created_at.desc()).first()
+            transaction = find_webhook_transaction(db, webhook_data, session_id, status="completed")
             
             if transaction:
                 # Update extra data to include membership info
                 extra_data = json.loads(transaction.extra_data or "{}")
                 extra_data["membership_data"] = webhook_data
                 transaction.extra_data = json.dumps(extra_data)
+                invalidate_transaction_caches(db, transaction)
                 db.commit()
-                logger.info(f"🎉 Membership activated for transaction {transaction.id}")
+                logger.info(
+                    "🎉 Membership activated for transaction %s", transaction.id,
+                    extra={"event": "membership_valid", "transaction_id": transaction.id}
+                )
         
         elif event_type == "membership_went_invalid":
             # Handle membership cancellation/expiry
-            logger.info(f"⚠️ Membership went invalid: {data}")
+            logger.info("⚠️ Membership went invalid: %s", data.get("id"), extra={"event": "membership_invalid"})
         
         else:
-            logger.info(f"📝 Unhandled webhook event: {event_type}")
+            logger.info("📝 Unhandled webhook event: %s", event_type, extra={"event": "webhook_unhandled"})
         
+        branch_span.end()
         return {"status": "received", "event": event_type}
         
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Webhook processing failed: {str(e)}")
+        logger.exception("Webhook processing failed: %s", e, extra={"event": "webhook_error"})
         raise HTTPException(status_code=500, detail="Webhook processing failed")
\ No newline at end of file
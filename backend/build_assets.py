@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Static asset build step for /static.
+
+Copies frontend/public into frontend/dist with a content hash in every file
+name (app.js -> app.3f9c2a71b0de.js), writes gzip and, when the optional
+``brotli`` package is installed, brotli precompressed siblings next to each
+compressible file, and records the logical -> hashed names in manifest.json.
+The app serves frontend/dist instead of frontend/public whenever the manifest
+exists, and templates resolve hashed names with ``asset_url('js/index.js')``:
+
+    python backend/build_assets.py
+    python backend/build_assets.py --source frontend/public --output frontend/dist
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import shutil
+import sys
+import time
+from pathlib import Path
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+# Logical -> hashed names, next to the built files; read by services/static_assets.py
+MANIFEST_FILE = "manifest.json"
+
+# Text formats worth precompressing; images and fonts are already compressed
+COMPRESSIBLE = {".js", ".mjs", ".css", ".html", ".svg", ".json", ".map", ".txt", ".xml", ".ico", ".wasm"}
+
+# Below this a compressed copy rarely saves a packet
+MIN_COMPRESS_SIZE = 256
+
+
+def hashed_name(relative: Path, content: bytes) -> Path:
+    digest = hashlib.sha256(content).hexdigest()[:12]
+    return relative.with_name(f"{relative.stem}.{digest}{relative.suffix}")
+
+
+def write_compressed(target: Path, content: bytes, stats: dict):
+    """Write .gz / .br siblings, keeping only those smaller than the original"""
+    if target.suffix.lower() not in COMPRESSIBLE or len(content) < MIN_COMPRESS_SIZE:
+        return
+    # mtime=0 keeps builds byte-for-byte reproducible
+    encoded = {".gz": gzip.compress(content, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        encoded[".br"] = brotli.compress(content, quality=11)
+    for extension, data in encoded.items():
+        if len(data) < len(content):
+            target.with_name(target.name + extension).write_bytes(data)
+            stats["compressed_bytes"][extension] += len(data)
+
+
+def build(source: Path, output: Path) -> dict:
+    """Build fingerprinted, precompressed assets and return build stats"""
+    if not source.is_dir():
+        raise FileNotFoundError(f"Asset source directory {source} does not exist")
+
+    start = time.perf_counter()
+    staging = output.with_name(output.name + ".tmp")
+    if staging.exists():
+        shutil.rmtree(staging)
+
+    manifest = {}
+    stats = {"files": 0, "original_bytes": 0, "compressed_bytes": {".gz": 0, ".br": 0}}
+    for path in sorted(p for p in source.rglob("*") if p.is_file()):
+        relative = path.relative_to(source)
+        content = path.read_bytes()
+        fingerprinted = hashed_name(relative, content)
+        manifest[relative.as_posix()] = fingerprinted.as_posix()
+
+        # The unhashed copy keeps hand-written links (e.g. /static/index.html) working
+        for name in (relative, fingerprinted):
+            target = staging / name
+            target.parent.mkdir(parents=True, exist_ok=True)
+            target.write_bytes(content)
+            write_compressed(target, content, stats)
+        stats["files"] += 1
+        stats["original_bytes"] += len(content)
+
+    (staging / MANIFEST_FILE).write_text(json.dumps(manifest, indent=2, sort_keys=True))
+
+    # Swap the finished build in so a running server never sees a half-written directory
+    if output.exists():
+        shutil.rmtree(output)
+    staging.rename(output)
+
+    stats["manifest"] = manifest
+    stats["seconds"] = round(time.perf_counter() - start, 3)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--source", default=str(PROJECT_ROOT / "frontend" / "public"))
+    parser.add_argument("--output", default=str(PROJECT_ROOT / "frontend" / "dist"))
+    args = parser.parse_args()
+
+    try:
+        stats = build(Path(args.source), Path(args.output))
+    except FileNotFoundError as e:
+        print(f"❌ {str(e)}")
+        sys.exit(1)
+
+    for logical, fingerprinted in stats["manifest"].items():
+        print(f"  {logical} -> {fingerprinted}")
+    print(f"✅ Built {stats['files']} assets ({stats['original_bytes']:,} bytes) into {args.output} "
+          f"in {stats['seconds']}s; gzip {stats['compressed_bytes']['.gz']:,} bytes, "
+          f"brotli {stats['compressed_bytes']['.br']:,} bytes")
+    if brotli is None:
+        print("ℹ️  Install 'brotli' to also produce .br files")
+
+
+if __name__ == "__main__":
+    main()
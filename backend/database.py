@@ -1,12 +1,14 @@
+import os
 from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
-# SQLite file will be created next to the backend folder
-DATABASE_URL = "sqlite:///./test.db"
+# SQLite file will be created next to the backend folder unless DATABASE_URL is set
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./test.db")
 
 # For sqlite we need check_same_thread False when using from different threads
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+connect_args = {"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {}
+engine = create_engine(DATABASE_URL, connect_args=connect_args)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
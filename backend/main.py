@@ -1,9 +1,10 @@
 from fastapi import FastAPI, Request, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse, RedirectResponse
+from fastapi.responses import HTMLResponse, RedirectResponse, Response
 from fastapi.templating import Jinja2Templates
+from jinja2 import FileSystemBytecodeCache
 from pathlib import Path
+import os
 
 # Import helpers and router in a flexible way so main.py can be run as:
 #  - uvicorn main:app (from backend/)
@@ -12,15 +13,46 @@ try:
     # when run as package from project root
     from backend.database import init_db
     from backend.api.routes import router as api_router
-    from backend.database import get_db
+    from backend.database import get_db, engine
+    from backend.models import Transaction, TransactionSnapshot, SNAPSHOT_COLUMNS
+    from backend.services.user_tracking import user_tracking, SessionCookieMiddleware
+    from backend.services.metrics import metrics, MetricsMiddleware, instrument_engine
+    from backend.services.sql_profiler import sql_profiler, SqlProfilerMiddleware
+    from backend.services.http_cache import StaticPage
+    from backend.services.static_assets import asset_manifest, PrecompressedStaticFiles, MANIFEST_FILE
+    from backend.services.cache import cache
+    from backend.services.whop_service import whop_service
+    from backend.services.idempotency import IdempotencyMiddleware
+    from backend.services.search import transaction_search
+    from backend.services.analytics import funnel_analytics
+    from backend.services.group_commit import checkout_writer
+    from backend.services.structured_logging import logging_setup
+    from backend.services.tracing import tracer, TracingMiddleware
 except Exception:
     # when run from backend directory
     from .database import init_db
     from .api.routes import router as api_router
-    from .database import get_db
+    from .database import get_db, engine
+    from .models import Transaction, TransactionSnapshot, SNAPSHOT_COLUMNS
+    from .services.user_tracking import user_tracking, SessionCookieMiddleware
+    from .services.metrics import metrics, MetricsMiddleware, instrument_engine
+    from .services.sql_profiler import sql_profiler, SqlProfilerMiddleware
+    from .services.http_cache import StaticPage
+    from .services.static_assets import asset_manifest, PrecompressedStaticFiles, MANIFEST_FILE
+    from .services.cache import cache
+    from .services.whop_service import whop_service
+    from .services.idempotency import IdempotencyMiddleware
+    from .services.search import transaction_search
+    from .services.analytics import funnel_analytics
+    from .services.group_commit import checkout_writer
+    from .services.structured_logging import logging_setup
+    from .services.tracing import tracer, TracingMiddleware
 
 app = FastAPI()
 
+# Retried POSTs carrying an Idempotency-Key get the first response back
+app.add_middleware(IdempotencyMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -29,44 +61,113 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# One signed session cookie per browser, shared by the pages and the API
+app.add_middleware(SessionCookieMiddleware)
+
+# Prometheus instrumentation (disable with METRICS_ENABLED=false)
+if metrics.enabled:
+    app.add_middleware(MetricsMiddleware)
+    instrument_engine(engine)
+
+# Per-request SQL profiling (SQL_PROFILER_ENABLED=true, then X-SQL-Profile: 1 or sampling)
+if sql_profiler.enabled:
+    app.add_middleware(SqlProfilerMiddleware)
+    sql_profiler.instrument_engine(engine)
+
+# Request tracing with tail sampling (TRACING_ENABLED=true; slow or failed requests are exported)
+if tracer.enabled:
+    app.add_middleware(TracingMiddleware)
+    tracer.instrument_engine(engine)
+
 
 @app.on_event("startup")
 def startup():
+    # application logs go through a bounded queue to a writer thread
+    logging_setup.start()
     # ensure tables exist
     init_db()
+    # follow cache invalidations committed by other workers
+    cache.attach(engine)
+    # full-text search index for the admin dashboard (a missing one is built in the background)
+    transaction_search.install(engine)
+    # conversion funnel counters are flushed to the database periodically
+    funnel_analytics.attach(engine)
+    # render pages whose output never changes once, off the request path
+    prerender_static_pages()
 
 
 @app.on_event("shutdown")
-def shutdown():
-    pass
+async def shutdown():
+    # release pooled Whop API connections
+    await whop_service.close()
+    # commit checkouts still waiting for a group commit
+    await checkout_writer.close()
+    # persist funnel counts not flushed yet
+    funnel_analytics.flush()
+    # export traces still queued
+    tracer.close()
+    # write out queued log records
+    logging_setup.stop()
 
 
 app.include_router(api_router, prefix="/api")
 
-# Mount frontend static files (serves JS/CSS under /static)
+
+@app.get("/metrics", include_in_schema=False)
+def prometheus_metrics():
+    """Expose metrics in the Prometheus text format"""
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+
+# Mount frontend static files (serves JS/CSS under /static). The fingerprinted,
+# precompressed build from `python backend/build_assets.py` is preferred when present.
 static_dir = Path(__file__).resolve().parent.parent / "frontend" / "public"
+dist_dir = Path(__file__).resolve().parent.parent / "frontend" / "dist"
+if (dist_dir / MANIFEST_FILE).exists():
+    static_dir = dist_dir
 if static_dir.exists():
-    app.mount("/static", StaticFiles(directory=str(static_dir)), name="static")
+    asset_manifest.load(static_dir)
+    app.mount("/static", PrecompressedStaticFiles(directory=str(static_dir)), name="static")
 
 # Templates directory inside backend package
 templates_dir = Path(__file__).resolve().parent / "templates"
 templates = Jinja2Templates(directory=str(templates_dir))
+if tracer.enabled:
+    tracer.instrument_templates(templates.env)
+
+# Compiled templates are shared by all workers (and survive restarts) through a
+# bytecode cache; entries are keyed by template source checksum so edits invalidate them
+template_cache_dir = os.getenv("TEMPLATE_CACHE_DIR")
+if template_cache_dir:
+    Path(template_cache_dir).mkdir(parents=True, exist_ok=True)
+templates.env.bytecode_cache = FileSystemBytecodeCache(directory=template_cache_dir)
+
+# {{ asset_url('js/index.js') }} -> /static/js/index.<hash>.js once assets are built
+templates.env.globals["asset_url"] = asset_manifest.url
+
+# Pages without per-request data, rendered once at startup: name -> (template, context)
+STATIC_PAGES = {
+    "success": ("success.html", {"message": "Payment completed successfully!"}),
+    "cancel": ("cancel.html", {"message": "Payment was cancelled. You can try again anytime."}),
+}
+static_pages = {}
+
+
+def prerender_static_pages():
+    for name, (template_name, context) in STATIC_PAGES.items():
+        static_pages[name] = StaticPage(templates.get_template(template_name).render(context).encode("utf-8"))
+
+
+def static_page(name: str) -> StaticPage:
+    if name not in static_pages:
+        prerender_static_pages()
+    return static_pages[name]
 
 
 @app.get("/", response_class=HTMLResponse)
 async def index(request: Request, db=Depends(get_db)):
     """Render the main checkout page for the $5 plan with access validation."""
     try:
-        # Import here to avoid circular imports
-        try:
-            # when running as package (project root)
-            from backend.services.user_tracking import user_tracking
-            from backend.models import Transaction
-        except Exception:
-            # when running from backend directory
-            from .services.user_tracking import user_tracking
-            from .models import Transaction
-        
         # Extract user info for tracking
         user_info = user_tracking.extract_user_info(request)
         user_fingerprint = user_info["user_fingerprint"]
@@ -96,8 +197,10 @@ async def index(request: Request, db=Depends(get_db)):
 
 
 @app.get("/payment/success", response_class=HTMLResponse)
-def payment_success(request: Request, transaction_id: int = None, db=Depends(get_db)):
+def payment_success(request: Request, transaction_id: int = None):
     """Payment success page with real receipt data"""
+    if transaction_id is None:
+        return static_page("success").response(request)
     return templates.TemplateResponse("success.html", {
         "request": request,
         "message": "Payment completed successfully!"
@@ -107,24 +210,17 @@ def payment_success(request: Request, transaction_id: int = None, db=Depends(get
 @app.get("/payment/cancel", response_class=HTMLResponse)
 def payment_cancel(request: Request):
     """Payment cancelled page"""
-    return templates.TemplateResponse("cancel.html", {
-        "request": request,
-        "message": "Payment was cancelled. You can try again anytime."
-    })
+    return static_page("cancel").response(request)
 
 
 @app.get("/admin", response_class=HTMLResponse)
 def admin_dashboard(request: Request, db=Depends(get_db)):
     """Admin dashboard for transaction management"""
-    try:
-        # when running as package (project root)
-        from backend.models import Transaction
-    except Exception:
-        # when running from backend directory
-        from .models import Transaction
-    
     # Get recent transactions
-    transactions = db.query(Transaction).order_by(Transaction.created_at.desc()).limit(50).all()
+    transactions = [
+        TransactionSnapshot.from_row(row)
+        for row in db.query(*SNAPSHOT_COLUMNS).order_by(Transaction.created_at.desc()).limit(50)
+    ]
     
     return templates.TemplateResponse("admin.html", {
         "request": request, 
@@ -135,14 +231,10 @@ def admin_dashboard(request: Request, db=Depends(get_db)):
 @app.get("/transactions/{transaction_id}/success", response_class=HTMLResponse)
 def transaction_success(request: Request, transaction_id: int, db=Depends(get_db)):
     """Legacy transaction success page"""
-    try:
-        # when running as package (project root)
-        from backend.models import Transaction
-    except Exception:
-        # when running from backend directory
-        from .models import Transaction
-
-    transaction = db.query(Transaction).filter(Transaction.id == transaction_id).first()
-    if not transaction:
+    row = db.query(*SNAPSHOT_COLUMNS).filter(Transaction.id == transaction_id).first()
+    if not row:
         return HTMLResponse("<h1>Transaction not found</h1>", status_code=404)
-    return templates.TemplateResponse("success.html", {"request": request, "transaction": transaction})
\ No newline at end of file
+    return templates.TemplateResponse("success.html", {
+        "request": request,
+        "transaction": TransactionSnapshot.from_row(row)
+    })
\ No newline at end of file
@@ -8,6 +8,8 @@ import sqlite3
 import os
 from pathlib import Path
 
+from services.search import SQLITE_FTS_TABLE, SQLITE_SCHEMA
+
 def migrate_database():
     """Add new columns for Whop session tracking"""
     
@@ -38,6 +40,94 @@ def migrate_database():
         if 'whop_checkout_url' not in columns:
             migrations_needed.append("ALTER TABLE transactions ADD COLUMN whop_checkout_url VARCHAR")
         
+        if 'checkout_reference' not in columns:
+            migrations_needed.append("ALTER TABLE transactions ADD COLUMN checkout_reference VARCHAR")
+        
+        if 'whop_payment_id' not in columns:
+            migrations_needed.append("ALTER TABLE transactions ADD COLUMN whop_payment_id VARCHAR")
+        
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+        tables = [row[0] for row in cursor.fetchall()]
+        
+        create_cache_invalidations = (
+            "CREATE TABLE cache_invalidations (id INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT, "
+            "namespace VARCHAR NOT NULL, cache_key VARCHAR NOT NULL, created_at FLOAT NOT NULL)"
+        )
+        if 'cache_invalidations' not in tables:
+            migrations_needed.append(create_cache_invalidations)
+        else:
+            cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'cache_invalidations'")
+            if 'AUTOINCREMENT' not in cursor.fetchone()[0].upper():
+                # Ids must never be reused once pruning empties the table; SQLite can only add
+                # AUTOINCREMENT by rebuilding it (the copy seeds sqlite_sequence with the max id)
+                migrations_needed.extend([
+                    "ALTER TABLE cache_invalidations RENAME TO cache_invalidations_old",
+                    "DROP INDEX IF EXISTS ix_cache_invalidations_created_at",
+                    create_cache_invalidations,
+                    "INSERT INTO cache_invalidations (id, namespace, cache_key, created_at) "
+                    "SELECT id, namespace, cache_key, created_at FROM cache_invalidations_old",
+                    "DROP TABLE cache_invalidations_old",
+                ])
+        
+        if 'reconciliation_state' not in tables:
+            migrations_needed.append(
+                "CREATE TABLE reconciliation_state (name VARCHAR NOT NULL PRIMARY KEY, "
+                "high_water_mark FLOAT, last_run_at DATETIME, last_report TEXT)"
+            )
+        
+        if 'idempotency_keys' not in tables:
+            migrations_needed.append(
+                "CREATE TABLE idempotency_keys (key VARCHAR NOT NULL PRIMARY KEY, request_hash VARCHAR NOT NULL, "
+                "status_code INTEGER, headers TEXT, body BLOB, created_at FLOAT NOT NULL)"
+            )
+        
+        if 'bulk_jobs' not in tables:
+            migrations_needed.append(
+                "CREATE TABLE bulk_jobs (id VARCHAR NOT NULL PRIMARY KEY, operation VARCHAR NOT NULL, selection TEXT, "
+                "status VARCHAR NOT NULL, total INTEGER, processed INTEGER, affected INTEGER, error TEXT, "
+                "created_at DATETIME, finished_at DATETIME, heartbeat_at DATETIME)"
+            )
+        else:
+            cursor.execute("PRAGMA table_info(bulk_jobs)")
+            if 'heartbeat_at' not in [column[1] for column in cursor.fetchall()]:
+                migrations_needed.append("ALTER TABLE bulk_jobs ADD COLUMN heartbeat_at DATETIME")
+        
+        if 'analytics_funnel' not in tables:
+            migrations_needed.append(
+                "CREATE TABLE analytics_funnel (hour INTEGER NOT NULL, plan_id VARCHAR NOT NULL, "
+                "checkouts INTEGER NOT NULL, completed INTEGER NOT NULL, failed INTEGER NOT NULL, "
+                "revenue FLOAT NOT NULL, PRIMARY KEY (hour, plan_id))"
+            )
+        
+        if 'analytics_time_to_pay' not in tables:
+            migrations_needed.append(
+                "CREATE TABLE analytics_time_to_pay (hour INTEGER NOT NULL, plan_id VARCHAR NOT NULL, "
+                "bin INTEGER NOT NULL, count INTEGER NOT NULL, PRIMARY KEY (hour, plan_id, bin))"
+            )
+        
+        if SQLITE_FTS_TABLE not in tables:
+            # Search index; built here so the app doesn't have to build it on a large table at startup
+            try:
+                cursor.execute("CREATE VIRTUAL TABLE temp.fts5_probe USING fts5(value, tokenize='trigram')")
+                cursor.execute("DROP TABLE temp.fts5_probe")
+                migrations_needed.extend(SQLITE_SCHEMA)
+            except sqlite3.OperationalError:
+                print("  - SQLite lacks FTS5 with the trigram tokenizer; search will use unindexed LIKE scans")
+        
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'transactions'")
+        indexes = [row[0] for row in cursor.fetchall()]
+        
+        if 'ux_transactions_pending_user' not in indexes:
+            # Keep each user's newest open checkout; older duplicates can't satisfy the unique index
+            migrations_needed.append(
+                "UPDATE transactions SET status = 'expired' WHERE status = 'pending' AND user_id IS NOT NULL "
+                "AND id NOT IN (SELECT MAX(id) FROM transactions WHERE status = 'pending' "
+                "AND user_id IS NOT NULL GROUP BY user_id)"
+            )
+            migrations_needed.append(
+                "CREATE UNIQUE INDEX ux_transactions_pending_user ON transactions (user_id) WHERE status = 'pending'"
+            )
+        
         if migrations_needed:
             print(f"Running {len(migrations_needed)} migrations...")
             
@@ -52,6 +142,47 @@ def migrate_database():
             except sqlite3.OperationalError:
                 pass  # Index might already exist
             
+            try:
+                cursor.execute("CREATE UNIQUE INDEX ix_transactions_checkout_reference ON transactions (checkout_reference)")
+                print("  - Created unique index on checkout_reference")
+            except sqlite3.OperationalError:
+                pass  # Index might already exist
+            
+            try:
+                cursor.execute("CREATE INDEX ix_transactions_whop_payment_id ON transactions (whop_payment_id)")
+                print("  - Created index on whop_payment_id")
+            except sqlite3.OperationalError:
+                pass  # Index might already exist
+            
+            try:
+                cursor.execute("CREATE INDEX ix_cache_invalidations_created_at ON cache_invalidations (created_at)")
+                print("  - Created index on cache_invalidations.created_at")
+            except sqlite3.OperationalError:
+                pass  # Index might already exist
+            
+            try:
+                cursor.execute("CREATE INDEX ix_idempotency_keys_created_at ON idempotency_keys (created_at)")
+                print("  - Created index on idempotency_keys.created_at")
+            except sqlite3.OperationalError:
+                pass  # Index might already exist
+            
+            try:
+                cursor.execute("CREATE INDEX ix_bulk_jobs_created_at ON bulk_jobs (created_at)")
+                print("  - Created index on bulk_jobs.created_at")
+            except sqlite3.OperationalError:
+                pass  # Index might already exist
+            
+            if 'whop_payment_id' not in columns:
+                # Webhooks stored the payment ID in extra_data before it had a column
+                try:
+                    cursor.execute(
+                        "UPDATE transactions SET whop_payment_id = json_extract(extra_data, '$.whop_payment_id') "
+                        "WHERE whop_payment_id IS NULL AND extra_data LIKE '%whop_payment_id%'"
+                    )
+                    print(f"  - Backfilled whop_payment_id for {cursor.rowcount} transactions")
+                except sqlite3.OperationalError:
+                    print("  - SQLite JSON functions unavailable; run a full reconciliation to fill whop_payment_id")
+            
             conn.commit()
             print("✅ Migration completed successfully!")
             
@@ -1,10 +1,20 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, Boolean, Text
+import json
+
+from sqlalchemy import Column, Integer, String, Float, DateTime, Boolean, Text, LargeBinary, Index, text
 from sqlalchemy.sql import func
 from .database import Base
+from .services.tracing import tracer
 
 
 class Transaction(Base):
     __tablename__ = 'transactions'
+    __table_args__ = (
+        # At most one open checkout per user; create_cerebra_checkout upserts against it
+        Index(
+            'ux_transactions_pending_user', 'user_id', unique=True,
+            sqlite_where=text("status = 'pending'"), postgresql_where=text("status = 'pending'")
+        ),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     plan_id = Column(String, index=True, nullable=False)
@@ -12,7 +22,7 @@ class Transaction(Base):
     amount = Column(Float, nullable=False)
     
     # Payment status and metadata
-    status = Column(String, default='pending', index=True)  # pending, completed, failed, cancelled
+    status = Column(String, default='pending', index=True)  # pending, completed, failed, cancelled, expired
     payment_method = Column(String)
     currency = Column(String, default='USD')
     
@@ -23,6 +33,8 @@ class Transaction(Base):
     session_id = Column(String, index=True)  # Internal session tracking
     whop_session_id = Column(String, index=True)  # Whop checkout session ID (ch_abc123)
     whop_checkout_url = Column(String)  # Whop hosted checkout URL
+    checkout_reference = Column(String, unique=True, index=True)  # Correlation key passed through Whop metadata
+    whop_payment_id = Column(String, index=True)  # Whop payment ID (pay_abc123) once paid or failed
     ip_address = Column(String)  # User's IP address
     user_agent = Column(String)  # Browser information
     
@@ -40,4 +52,155 @@ class Transaction(Base):
     retry_count = Column(Integer, default=0)
 
     def __repr__(self):
-        return f"<Transaction(id={self.id}, plan_id={self.plan_id}, status={self.status}, amount={self.amount})>"
\ No newline at end of file
+        return f"<Transaction(id={self.id}, plan_id={self.plan_id}, status={self.status}, amount={self.amount})>"
+
+
+class TransactionSnapshot:
+    """Read-only copy of a transaction for caches, serializers and the invoice service
+
+    Built from a row tuple of SNAPSHOT_COLUMNS, so no ORM instance, session or
+    identity map stays alive behind it. The receipt fields (Whop payment ID and
+    billing name and email) are parsed out of ``extra_data`` once, here, and the
+    raw JSON is not kept. Instances are immutable and pickle as a flat tuple.
+    """
+
+    # Transaction columns copied as they are, in SNAPSHOT_COLUMNS order
+    FIELDS = (
+        "id", "plan_id", "checkout_link", "amount", "status", "customer_email", "customer_name", "user_id",
+        "session_id", "ip_address", "whop_session_id", "whop_checkout_url", "webhook_received",
+        "created_at", "completed_at", "updated_at",
+    )
+    # Derived from extra_data by from_row()
+    RECEIPT_FIELDS = ("payment_id", "billing_name", "billing_email")
+
+    __slots__ = FIELDS + RECEIPT_FIELDS
+
+    def __init__(self, *values):
+        if len(values) != len(self.__slots__):
+            raise TypeError(f"TransactionSnapshot takes {len(self.__slots__)} values, got {len(values)}")
+        for name, value in zip(self.__slots__, values):
+            object.__setattr__(self, name, value)
+
+    @classmethod
+    def from_row(cls, row) -> "TransactionSnapshot":
+        """Snapshot of a row selected with SNAPSHOT_COLUMNS"""
+        *values, extra_data = row
+        customer_name, customer_email = values[6], values[5]
+        extra = {}
+        if extra_data:
+            # The stored webhook and API payloads run to kilobytes per row
+            with tracer.span("snapshot.parse_extra_data", size=len(extra_data)) as span:
+                try:
+                    extra = json.loads(extra_data)
+                except ValueError as e:
+                    span.record_error(e)
+        customer_data = extra.get("customer_data") or {}
+        return cls(
+            *values,
+            extra.get("whop_payment_id"),
+            customer_name or customer_data.get("name", "Valued Customer"),
+            customer_email or customer_data.get("email", ""),
+        )
+
+    @classmethod
+    def from_transaction(cls, transaction: Transaction) -> "TransactionSnapshot":
+        """Snapshot of an ORM instance that is already loaded"""
+        return cls.from_row(tuple(getattr(transaction, column.key) for column in SNAPSHOT_COLUMNS))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("TransactionSnapshot is read-only")
+
+    def __delattr__(self, name):
+        raise AttributeError("TransactionSnapshot is read-only")
+
+    def __reduce__(self):
+        return self.__class__, tuple(getattr(self, name) for name in self.__slots__)
+
+    def __eq__(self, other):
+        if not isinstance(other, TransactionSnapshot):
+            return NotImplemented
+        return self.__reduce__()[1] == other.__reduce__()[1]
+
+    def __hash__(self):
+        return hash(self.__reduce__()[1])
+
+    def __repr__(self):
+        return f"<TransactionSnapshot(id={self.id}, plan_id={self.plan_id}, status={self.status}, amount={self.amount})>"
+
+
+# Columns TransactionSnapshot.from_row() expects: its FIELDS, then extra_data for the receipt fields
+SNAPSHOT_COLUMNS = tuple(getattr(Transaction, name) for name in TransactionSnapshot.FIELDS) + (Transaction.extra_data,)
+
+
+class CacheInvalidation(Base):
+    """Cache keys evicted by a committed write, replayed by every worker's cache"""
+    __tablename__ = 'cache_invalidations'
+    # Workers read rows with id > the last one they applied; without AUTOINCREMENT SQLite
+    # reuses ids once pruning empties the table and those notifications would be skipped
+    __table_args__ = {'sqlite_autoincrement': True}
+
+    id = Column(Integer, primary_key=True)
+    namespace = Column(String, nullable=False)
+    cache_key = Column(String, nullable=False)
+    created_at = Column(Float, nullable=False, index=True)  # Unix time, used for pruning
+
+
+class ReconciliationState(Base):
+    """Progress of a reconciliation job against the Whop payments API"""
+    __tablename__ = 'reconciliation_state'
+
+    name = Column(String, primary_key=True)
+    high_water_mark = Column(Float)  # created_at (Unix time) of the newest Whop payment reconciled
+    last_run_at = Column(DateTime(timezone=True))
+    last_report = Column(Text)  # JSON summary of the last completed run
+
+
+class IdempotencyKey(Base):
+    """First response to a POST sent with an Idempotency-Key header, replayed to its retries"""
+    __tablename__ = 'idempotency_keys'
+
+    key = Column(String, primary_key=True)  # "<session_id or request-<hash>>:<path>:<Idempotency-Key>", so callers never share keys
+    request_hash = Column(String, nullable=False)  # SHA-256 of method, path and body
+    status_code = Column(Integer)  # NULL while the first request is still running
+    headers = Column(Text)  # JSON list of [name, value] pairs
+    body = Column(LargeBinary)
+    created_at = Column(Float, nullable=False, index=True)  # Unix time, used for expiry
+
+
+class BulkJob(Base):
+    """Progress and outcome of a bulk admin operation over many transactions"""
+    __tablename__ = 'bulk_jobs'
+
+    id = Column(String, primary_key=True)
+    operation = Column(String, nullable=False)  # mark_failed, expire, retry, reprocess_webhook
+    selection = Column(Text)  # JSON of the ids/filter the job was started with
+    status = Column(String, nullable=False)  # running, completed, failed
+    total = Column(Integer, default=0)  # rows matching the selection when the job started
+    processed = Column(Integer, default=0)
+    affected = Column(Integer, default=0)
+    error = Column(Text)
+    created_at = Column(DateTime(timezone=True), index=True)
+    finished_at = Column(DateTime(timezone=True))
+    heartbeat_at = Column(DateTime(timezone=True))  # last progress write; a silent running job lost its worker
+
+
+class AnalyticsFunnel(Base):
+    """Checkouts created in one UTC hour for one plan, and how many of them paid or failed"""
+    __tablename__ = 'analytics_funnel'
+
+    hour = Column(Integer, primary_key=True)  # Unix time of the start of the hour
+    plan_id = Column(String, primary_key=True)
+    checkouts = Column(Integer, nullable=False, default=0)
+    completed = Column(Integer, nullable=False, default=0)
+    failed = Column(Integer, nullable=False, default=0)
+    revenue = Column(Float, nullable=False, default=0.0)
+
+
+class AnalyticsTimeToPay(Base):
+    """Time-to-pay sketch bins (see services.analytics.LatencySketch) for one hour's checkouts of one plan"""
+    __tablename__ = 'analytics_time_to_pay'
+
+    hour = Column(Integer, primary_key=True)
+    plan_id = Column(String, primary_key=True)
+    bin = Column(Integer, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
\ No newline at end of file
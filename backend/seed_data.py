@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+"""
+Synthetic data generator for the transactions table.
+
+Generates production-shaped transactions (status mix, user tracking data and
+the same extra_data webhook payloads the webhook handler stores) and bulk
+loads them into SQLite with executemany, secondary indexes dropped during the
+load and rebuilt afterwards. Used by the benchmarks and for reproducing
+production-scale issues locally:
+
+    python backend/seed_data.py --rows 1m
+    python backend/seed_data.py --rows 10m --database big.db --workers 4
+
+The load runs with the journal and fsync off, so an interrupted run can
+leave the file corrupt: never point --database at a database the app uses.
+"""
+
+import argparse
+import multiprocessing
+import random
+import sqlite3
+import sys
+import time
+from itertools import accumulate
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
+
+# Roughly what a live store looks like: most checkouts convert, a tail is abandoned or fails
+STATUS_MIX = (("completed", 0.70), ("pending", 0.20), ("failed", 0.07), ("cancelled", 0.03))
+
+SIZES = {"10k": 10_000, "100k": 100_000, "1m": 1_000_000, "10m": 10_000_000}
+
+# Scratch file under the git-ignored benchmarks/.data/, never the app's own test.db
+DEFAULT_DATABASE = Path(__file__).resolve().parent.parent / "benchmarks" / ".data" / "seed.db"
+
+COLUMNS = (
+    "id", "plan_id", "checkout_link", "amount", "status", "currency", "customer_email", "customer_name",
+    "user_id", "session_id", "whop_checkout_url", "checkout_reference", "whop_payment_id", "ip_address", "user_agent",
+    "created_at", "completed_at", "extra_data", "webhook_received", "error_message", "retry_count",
+)
+
+FIRST_NAMES = ("Ada", "Alan", "Grace", "Linus", "Margaret", "Dennis", "Barbara", "Ken", "Radia", "Guido",
+               "Frances", "Donald", "Hedy", "John", "Katherine", "Edsger")
+LAST_NAMES = ("Lovelace", "Turing", "Hopper", "Torvalds", "Hamilton", "Ritchie", "Liskov", "Thompson",
+              "Perlman", "Rossum", "Allen", "Knuth", "Lamarr", "Backus", "Johnson", "Dijkstra")
+USER_AGENTS = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0 Safari/537.36",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 14_4) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.4 Safari/605.1.15",
+    "Mozilla/5.0 (iPhone; CPU iPhone OS 17_4 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Mobile/15E148",
+    "Mozilla/5.0 (X11; Linux x86_64; rv:125.0) Gecko/20100101 Firefox/125.0",
+)
+FAILURE_REASONS = ("Card declined", "Insufficient funds", "Expired card", "Authentication failed")
+
+# First row is created at 2025-01-01 00:00:00 UTC, one checkout every ~3 seconds (10M rows ~ 1 year)
+EPOCH_DAY = 20089  # days since 1970-01-01
+SECONDS_PER_ROW = 3
+
+# extra_data fragments mirror what create_cerebra_checkout and whop_webhook store.
+# Each fragment is formatted once per row and spliced, as JSON serialization dominates otherwise.
+TRACKING_JSON = (
+    '"tier": "premium", "source": "cerebra_app", "user_fingerprint": "%s", '
+    '"tracking_data": {"ip_address": "%s", "user_agent": "%s", "session_id": "%s", "user_fingerprint": "%s"}'
+)
+CUSTOMER_JSON = '{"email": "%s", "name": "%s"}'
+PAYMENT_JSON = (
+    '{"id": "%s", "amount": 500, "total": 500, "currency": "usd", "invoice_id": "%s", '
+    '"metadata": {"checkout_reference": "%s"}, "customer": %s}'
+)
+EXTRA_DATA_PENDING = "{%s}"
+EXTRA_DATA_COMPLETED = (
+    '{%s, "webhook_data": {"type": "payment_succeeded", "data": %s}, "payment_data": %s, '
+    '"customer_data": %s, "whop_payment_id": "%s", "whop_invoice_id": "%s"}'
+)
+EXTRA_DATA_FAILED = (
+    '{%s, "webhook_data": {"type": "payment_failed", "data": {"id": "%s", "failure_reason": "%s", '
+    '"metadata": {"checkout_reference": "%s"}}}}'
+)
+
+_CLOCK: List[str] = []
+_DATES = {}
+
+
+def _timestamp(seconds: int) -> str:
+    """Format seconds since EPOCH_DAY as 'YYYY-MM-DD HH:MM:SS' via lookup tables"""
+    if not _CLOCK:
+        _CLOCK.extend(f"{s // 3600:02d}:{s // 60 % 60:02d}:{s % 60:02d}" for s in range(86400))
+    day, second = divmod(seconds, 86400)
+    date = _DATES.get(day)
+    if date is None:
+        date = _DATES[day] = time.strftime("%Y-%m-%d ", time.gmtime((EPOCH_DAY + day) * 86400))
+    return date + _CLOCK[second]
+
+
+def parse_rows(value: str) -> int:
+    """Accept 10k / 1m / 10m shorthands as well as plain integers"""
+    return SIZES.get(value.lower()) or int(value.replace("_", ""))
+
+
+def generate_batch(start_id: int, count: int, seed: int = 42) -> List[Tuple]:
+    """Generate ``count`` transaction tuples (COLUMNS order) starting at ``start_id``
+
+    Batches are deterministic for a given (start_id, seed), so they can be
+    generated in parallel and in any order.
+    """
+    rng = random.Random(seed * 1_000_003 + start_id)
+    statuses = rng.choices([s for s, _ in STATUS_MIX], cum_weights=list(accumulate(w for _, w in STATUS_MIX)), k=count)
+    # Draw every random value for the batch up front
+    tokens = rng.getrandbits(256 * count).to_bytes(32 * count, "little").hex()
+    jitter = rng.choices(range(SECONDS_PER_ROW), k=count)
+    time_to_pay = rng.choices(range(20, 900), k=count)
+
+    rows = []
+    append = rows.append
+    for offset, status in enumerate(statuses):
+        row_id = start_id + offset
+        name = f"{FIRST_NAMES[row_id & 15]} {LAST_NAMES[row_id >> 4 & 15]}"
+        email = f"customer{row_id}@example.com"
+        ip_address = f"10.{row_id >> 16 & 255}.{row_id >> 8 & 255}.{row_id & 255}"
+        user_agent = USER_AGENTS[row_id & 3]
+        session_id = tokens[offset * 64:offset * 64 + 32]
+        fingerprint = tokens[offset * 64 + 32:offset * 64 + 64]
+        reference = f"chk_{row_id:032x}"
+        payment_id = f"pay_{row_id:012x}"
+        created = row_id * SECONDS_PER_ROW + jitter[offset]
+        tracking = TRACKING_JSON % (fingerprint, ip_address, user_agent, session_id, fingerprint)
+
+        completed_at = error_message = None
+        if status == "completed":
+            completed_at = _timestamp(created + time_to_pay[offset])
+            invoice_id = f"inv_{row_id:012x}"
+            customer = CUSTOMER_JSON % (email, name)
+            payment = PAYMENT_JSON % (payment_id, invoice_id, reference, customer)
+            extra_data = EXTRA_DATA_COMPLETED % (tracking, payment, payment, customer, payment_id, invoice_id)
+        elif status == "failed":
+            error_message = FAILURE_REASONS[row_id & 3]
+            extra_data = EXTRA_DATA_FAILED % (tracking, payment_id, error_message, reference)
+        else:
+            extra_data = EXTRA_DATA_PENDING % tracking
+
+        append((
+            row_id, "plan_bench", "plan_bench", 5.0, status, "USD", email, name,
+            f"user_{row_id:08x}", session_id, f"https://whop.com/checkout/plan_bench?checkout_reference={reference}",
+            reference, payment_id if status in ("completed", "failed") else None,
+            ip_address, user_agent, _timestamp(created), completed_at, extra_data,
+            status in ("completed", "failed"), error_message, 0,
+        ))
+    return rows
+
+
+def _generate_batch_args(args: Tuple[int, int, int]) -> List[Tuple]:
+    return generate_batch(*args)
+
+
+def iter_batches(start_id: int, rows: int, batch_size: int, seed: int, workers: int) -> Iterator[List[Tuple]]:
+    """Yield generated batches, fanning generation out to ``workers`` processes"""
+    tasks = [(batch_start, min(batch_size, start_id + rows - batch_start), seed)
+             for batch_start in range(start_id, start_id + rows, batch_size)]
+    if workers <= 1:
+        for task in tasks:
+            yield generate_batch(*task)
+        return
+    with multiprocessing.Pool(workers) as pool:
+        yield from pool.imap(_generate_batch_args, tasks)
+
+
+def create_schema(database: str):
+    """Create the app's tables in ``database`` using the SQLAlchemy models"""
+    from sqlalchemy import create_engine
+    try:
+        from backend.database import Base
+        from backend import models  # noqa: F401 - registers the tables
+    except Exception:
+        sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+        from backend.database import Base
+        from backend import models  # noqa: F401
+
+    engine = create_engine(f"sqlite:///{database}")
+    Base.metadata.create_all(bind=engine)
+    engine.dispose()
+
+
+def bulk_load(database: str, rows: int, batch_size: int = 20_000, seed: int = 42, workers: int = 1,
+              start_id: Optional[int] = None) -> dict:
+    """Append ``rows`` synthetic transactions to ``database`` as fast as SQLite allows
+
+    Secondary indexes are dropped for the duration of the load and rebuilt in
+    one pass at the end, and the load runs as a single unjournaled
+    transaction, so the file should not be in use by the app meanwhile.
+    """
+    Path(database).parent.mkdir(parents=True, exist_ok=True)
+    if not Path(database).exists():
+        # Larger pages suit the ~1 KB extra_data rows; only settable before the first table exists
+        bootstrap = sqlite3.connect(database)
+        bootstrap.execute("PRAGMA page_size = 16384")
+        bootstrap.execute("VACUUM")
+        bootstrap.close()
+    create_schema(database)
+
+    connection = sqlite3.connect(database, isolation_level=None)
+    connection.execute("PRAGMA synchronous = OFF")
+    connection.execute("PRAGMA journal_mode = OFF")
+    connection.execute("PRAGMA cache_size = -262144")  # 256 MiB
+    connection.execute("PRAGMA temp_store = MEMORY")
+    connection.execute(f"PRAGMA threads = {max(workers, 1)}")  # parallel sorter for the index rebuild
+
+    if start_id is None:
+        start_id = (connection.execute("SELECT MAX(id) FROM transactions").fetchone()[0] or 0) + 1
+
+    indexes = connection.execute(
+        "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = 'transactions' AND sql IS NOT NULL"
+    ).fetchall()
+    # Row-at-a-time triggers (the search index) are replaced by one set-based catch-up after the load
+    triggers = connection.execute(
+        "SELECT name, sql FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'transactions'"
+    ).fetchall()
+    has_search_index = connection.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'transactions_fts'"
+    ).fetchone() is not None
+    insert = f"INSERT INTO transactions ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})"
+
+    started = time.perf_counter()
+    connection.execute("BEGIN")
+    for name, _ in indexes:
+        connection.execute(f'DROP INDEX "{name}"')
+    for name, _ in triggers:
+        connection.execute(f'DROP TRIGGER "{name}"')
+    for batch in iter_batches(start_id, rows, batch_size, seed, workers):
+        connection.executemany(insert, batch)
+    loaded = time.perf_counter()
+    for _, sql in indexes:
+        connection.execute(sql)
+    if has_search_index:
+        connection.execute(
+            "INSERT INTO transactions_fts (rowid, customer_email, customer_name, user_id, whop_payment_id) "
+            "SELECT id, customer_email, customer_name, user_id, whop_payment_id FROM transactions WHERE id >= ?",
+            (start_id,)
+        )
+    for _, sql in triggers:
+        connection.execute(sql)
+    connection.execute("COMMIT")
+    connection.execute("ANALYZE")
+    connection.close()
+    finished = time.perf_counter()
+
+    return {
+        "rows": rows,
+        "first_id": start_id,
+        "load_seconds": loaded - started,
+        "index_seconds": finished - loaded,
+        "total_seconds": finished - started,
+        "rows_per_second": rows / (finished - started) if rows else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", default="100k", help="rows to generate: 10k, 1m, 10m or an integer")
+    parser.add_argument("--database", default=str(DEFAULT_DATABASE),
+                        help="SQLite file to append to (created if missing); defaults to a git-ignored scratch file")
+    parser.add_argument("--batch-size", type=int, default=20_000)
+    parser.add_argument("--workers", type=int, default=1, help="processes generating rows in parallel")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rows = parse_rows(args.rows)
+    Path(args.database).parent.mkdir(parents=True, exist_ok=True)
+    print(f"Generating {rows:,} transactions into {args.database}")
+    stats = bulk_load(args.database, rows, args.batch_size, args.seed, args.workers)
+    print(f"✅ Loaded {rows:,} rows in {stats['total_seconds']:.1f}s "
+          f"(insert {stats['load_seconds']:.1f}s, indexes {stats['index_seconds']:.1f}s) "
+          f"- {stats['rows_per_second']:,.0f} rows/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,376 @@
+import os
+import math
+import time
+import threading
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import logging
+
+from sqlalchemy import Integer, case, cast, delete, extract, func, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import OperationalError
+
+from ..models import Transaction, AnalyticsFunnel, AnalyticsTimeToPay
+
+logger = logging.getLogger(__name__)
+
+HOUR = 3600
+
+# Times to pay below this (clock skew, test webhooks) are counted as this
+MIN_TIME_TO_PAY = 0.001
+
+REPORTED_QUANTILES = (0.5, 0.9, 0.95, 0.99)
+
+
+class AnalyticsError(Exception):
+    """Raised when analytics can't be computed on this database"""
+
+
+def _as_utc(value: datetime) -> datetime:
+    # SQLite hands back naive datetimes holding CURRENT_TIMESTAMP, which is UTC
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value.astimezone(timezone.utc)
+
+
+def hour_of(value: datetime) -> int:
+    """Unix time of the start of the UTC hour containing ``value``"""
+    return int(_as_utc(value).timestamp()) // HOUR * HOUR
+
+
+class LatencySketch:
+    """Mergeable quantile sketch with bounded relative error (DDSketch-style log buckets)
+
+    A value v lands in bin ceil(log_gamma(v)) with gamma = (1 + a) / (1 - a), so
+    any quantile is returned within a relative error of ``a`` of the true value.
+    Bins are plain counts: sketches for hours, plans and workers merge by adding
+    them, which is what lets the database aggregate them with GROUP BY.
+    """
+
+    def __init__(self, accuracy: float = 0.01, bins: Optional[Dict[int, int]] = None):
+        self.accuracy = accuracy
+        self.gamma = (1 + accuracy) / (1 - accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.bins: Dict[int, int] = dict(bins or {})
+
+    def key(self, value: float) -> int:
+        return int(math.ceil(math.log(max(value, MIN_TIME_TO_PAY)) / self.log_gamma))
+
+    def value(self, key: int) -> float:
+        # Midpoint of the bin (gamma^(k-1), gamma^k] with relative error <= accuracy
+        return 2 * self.gamma ** key / (self.gamma + 1)
+
+    def add(self, value: float, count: int = 1):
+        key = self.key(value)
+        self.bins[key] = self.bins.get(key, 0) + count
+
+    def merge(self, bins: Iterable[Tuple[int, int]]):
+        for key, count in bins:
+            self.bins[key] = self.bins.get(key, 0) + count
+
+    @property
+    def count(self) -> int:
+        return sum(self.bins.values())
+
+    def quantile(self, q: float) -> Optional[float]:
+        total = self.count
+        if not total:
+            return None
+        rank = q * (total - 1)
+        seen = 0
+        for key in sorted(self.bins):
+            seen += self.bins[key]
+            if seen > rank:
+                return self.value(key)
+        return self.value(max(self.bins))
+
+    def summary(self) -> Dict[str, Any]:
+        result: Dict[str, Any] = {"count": self.count}
+        for q in REPORTED_QUANTILES:
+            value = self.quantile(q)
+            result[f"p{int(q * 100)}"] = round(value, 3) if value is not None else None
+        return result
+
+
+class FunnelAnalytics:
+    """Hourly checkout -> payment funnel and time-to-pay quantiles per plan
+
+    Checkouts and webhook outcomes are counted in memory as they happen,
+    attributed to the hour the checkout was created (its cohort), and the
+    deltas are flushed to analytics_funnel / analytics_time_to_pay at most
+    every ``flush_interval`` seconds with additive upserts, so every worker
+    can flush without coordinating. Corrections made outside the webhook
+    (reconciliation, bulk operations) show up after a recompute, which
+    rebuilds a range of hours from transactions with GROUP BY queries.
+    """
+
+    def __init__(self):
+        # Load configuration from environment variables
+        self.enabled = os.getenv("ANALYTICS_ENABLED", "true").lower() == "true"
+        self.flush_interval = float(os.getenv("ANALYTICS_FLUSH_INTERVAL", "60"))
+        self.accuracy = float(os.getenv("ANALYTICS_SKETCH_ACCURACY", "0.01"))
+        self.sketch = LatencySketch(self.accuracy)
+        self.engine = None
+        # (hour, plan_id) -> [checkouts, completed, failed, revenue]
+        self._funnel: Dict[Tuple[int, str], List[float]] = {}
+        # (hour, plan_id, bin) -> count
+        self._time_to_pay: Dict[Tuple[int, str, int], int] = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._last_flush = time.monotonic()
+
+    def attach(self, engine):
+        self.engine = engine
+
+    def _counters(self, hour: int, plan_id: str) -> List[float]:
+        return self._funnel.setdefault((hour, plan_id), [0, 0, 0, 0.0])
+
+    def record_checkout(self, plan_id: str, created_at: Optional[datetime]):
+        if not self.enabled:
+            return
+        hour = hour_of(created_at or datetime.now(timezone.utc))
+        with self._lock:
+            self._counters(hour, plan_id)[0] += 1
+        self.maybe_flush()
+
+    def record_outcome(
+        self,
+        plan_id: str,
+        created_at: Optional[datetime],
+        status: str,
+        amount: float = 0.0,
+        completed_at: Optional[datetime] = None
+    ):
+        """Count a completed or failed payment in its checkout's hour"""
+        if not self.enabled or created_at is None:
+            return
+        hour = hour_of(created_at)
+        with self._lock:
+            counters = self._counters(hour, plan_id)
+            if status == "completed":
+                counters[1] += 1
+                counters[3] += amount or 0.0
+                elapsed = (_as_utc(completed_at or datetime.now(timezone.utc)) - _as_utc(created_at)).total_seconds()
+                key = (hour, plan_id, self.sketch.key(elapsed))
+                self._time_to_pay[key] = self._time_to_pay.get(key, 0) + 1
+            elif status == "failed":
+                counters[2] += 1
+        self.maybe_flush()
+
+    def maybe_flush(self):
+        if time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    @staticmethod
+    def _insert(dialect: str):
+        if dialect == "sqlite":
+            return sqlite.insert
+        if dialect == "postgresql":
+            return postgresql.insert
+        raise AnalyticsError(f"Analytics upserts are not supported on {dialect}")
+
+    def flush(self):
+        """Add this worker's pending deltas to the stored buckets"""
+        if self.engine is None or not self._flush_lock.acquire(blocking=False):
+            return
+        try:
+            with self._lock:
+                funnel, self._funnel = self._funnel, {}
+                time_to_pay, self._time_to_pay = self._time_to_pay, {}
+            self._last_flush = time.monotonic()
+            if not funnel and not time_to_pay:
+                return
+            try:
+                insert = self._insert(self.engine.dialect.name)
+                with self.engine.begin() as connection:
+                    if funnel:
+                        statement = insert(AnalyticsFunnel)
+                        connection.execute(
+                            statement.on_conflict_do_update(
+                                index_elements=[AnalyticsFunnel.hour, AnalyticsFunnel.plan_id],
+                                set_={
+                                    name: getattr(AnalyticsFunnel, name) + getattr(statement.excluded, name)
+                                    for name in ("checkouts", "completed", "failed", "revenue")
+                                }
+                            ),
+                            [
+                                {"hour": hour, "plan_id": plan_id, "checkouts": c[0], "completed": c[1], "failed": c[2], "revenue": c[3]}
+                                for (hour, plan_id), c in funnel.items()
+                            ]
+                        )
+                    if time_to_pay:
+                        statement = insert(AnalyticsTimeToPay)
+                        connection.execute(
+                            statement.on_conflict_do_update(
+                                index_elements=[AnalyticsTimeToPay.hour, AnalyticsTimeToPay.plan_id, AnalyticsTimeToPay.bin],
+                                set_={"count": AnalyticsTimeToPay.count + statement.excluded.count}
+                            ),
+                            [
+                                {"hour": hour, "plan_id": plan_id, "bin": key, "count": count}
+                                for (hour, plan_id, key), count in time_to_pay.items()
+                            ]
+                        )
+            except Exception as e:
+                # Keep the deltas for the next flush rather than losing them
+                logger.error(f"Analytics flush failed: {str(e)}")
+                with self._lock:
+                    for key, counters in funnel.items():
+                        pending = self._counters(*key)
+                        for index, value in enumerate(counters):
+                            pending[index] += value
+                    for key, count in time_to_pay.items():
+                        self._time_to_pay[key] = self._time_to_pay.get(key, 0) + count
+        finally:
+            self._flush_lock.release()
+
+    def report(self, hours: int = 24, plan_id: Optional[str] = None) -> Dict[str, Any]:
+        """Funnel and time to pay per hour and plan, plus totals, for the last ``hours`` cohorts"""
+        if self.engine is None:
+            raise AnalyticsError("Analytics is not attached to a database")
+        self.flush()
+        since = hour_of(datetime.now(timezone.utc)) - (hours - 1) * HOUR
+
+        funnel_query = select(AnalyticsFunnel).where(AnalyticsFunnel.hour >= since)
+        bins_query = select(
+            AnalyticsTimeToPay.hour, AnalyticsTimeToPay.plan_id, AnalyticsTimeToPay.bin, AnalyticsTimeToPay.count
+        ).where(AnalyticsTimeToPay.hour >= since)
+        if plan_id:
+            funnel_query = funnel_query.where(AnalyticsFunnel.plan_id == plan_id)
+            bins_query = bins_query.where(AnalyticsTimeToPay.plan_id == plan_id)
+
+        with self.engine.connect() as connection:
+            buckets = connection.execute(funnel_query.order_by(AnalyticsFunnel.hour, AnalyticsFunnel.plan_id)).all()
+            bins = connection.execute(bins_query).all()
+
+        sketches: Dict[Tuple[int, str], LatencySketch] = {}
+        for row in bins:
+            sketches.setdefault((row.hour, row.plan_id), LatencySketch(self.accuracy)).bins[row.bin] = row.count
+
+        totals = {"checkouts": 0, "completed": 0, "failed": 0, "revenue": 0.0}
+        total_sketch = LatencySketch(self.accuracy)
+        plans: Dict[str, Dict[str, Any]] = {}
+        plan_sketches: Dict[str, LatencySketch] = {}
+        rows = []
+        for bucket in buckets:
+            counts = {
+                "checkouts": bucket.checkouts, "completed": bucket.completed,
+                "failed": bucket.failed, "revenue": bucket.revenue,
+            }
+            sketch = sketches.get((bucket.hour, bucket.plan_id), LatencySketch(self.accuracy))
+            rows.append({
+                "hour": datetime.fromtimestamp(bucket.hour, timezone.utc).isoformat(),
+                "plan_id": bucket.plan_id,
+                **self._summarize(counts, sketch),
+            })
+            plan_totals = plans.setdefault(bucket.plan_id, {"checkouts": 0, "completed": 0, "failed": 0, "revenue": 0.0})
+            for name, value in counts.items():
+                plan_totals[name] += value
+                totals[name] += value
+            plan_sketches.setdefault(bucket.plan_id, LatencySketch(self.accuracy)).merge(sketch.bins.items())
+            total_sketch.merge(sketch.bins.items())
+
+        return {
+            "from": datetime.fromtimestamp(since, timezone.utc).isoformat(),
+            "hours": hours,
+            "accuracy": self.accuracy,
+            "totals": self._summarize(totals, total_sketch),
+            "plans": {
+                name: self._summarize(counts, plan_sketches.get(name, LatencySketch(self.accuracy)))
+                for name, counts in plans.items()
+            },
+            "buckets": rows,
+        }
+
+    @staticmethod
+    def _summarize(counts: Dict[str, Any], sketch: LatencySketch) -> Dict[str, Any]:
+        checkouts = counts["checkouts"]
+        return {
+            **counts,
+            "revenue": round(counts["revenue"], 2),
+            "conversion_rate": round(counts["completed"] / checkouts, 4) if checkouts else 0.0,
+            "time_to_pay_seconds": sketch.summary(),
+        }
+
+    def _seconds_expressions(self, dialect: str):
+        """(hour bucket, seconds from created_at to completed_at) as SQL expressions"""
+        if dialect == "sqlite":
+            hour = cast(func.strftime("%s", Transaction.created_at), Integer) // HOUR * HOUR
+            elapsed = (func.julianday(Transaction.completed_at) - func.julianday(Transaction.created_at)) * 86400.0
+        elif dialect == "postgresql":
+            hour = cast(func.floor(extract("epoch", Transaction.created_at) / HOUR), Integer) * HOUR
+            elapsed = extract("epoch", Transaction.completed_at - Transaction.created_at)
+        else:
+            raise AnalyticsError(f"Analytics recompute is not supported on {dialect}")
+        return hour, elapsed
+
+    def recompute(self, hours: Optional[int] = None) -> Dict[str, Any]:
+        """Rebuild stored buckets for the last ``hours`` cohorts (all history if None) from transactions
+
+        Both tables are computed in the database with GROUP BY, bins included
+        (ln/ceil), instead of walking rows in Python. This worker's unflushed
+        deltas for those hours are dropped since the rebuild already counts
+        them; other workers' may be counted twice until the next recompute.
+        """
+        if self.engine is None:
+            raise AnalyticsError("Analytics is not attached to a database")
+        started = time.perf_counter()
+        dialect = self.engine.dialect.name
+        insert = self._insert(dialect)
+        hour, elapsed = self._seconds_expressions(dialect)
+        since = None if hours is None else hour_of(datetime.now(timezone.utc)) - (hours - 1) * HOUR
+
+        with self._lock:
+            self._funnel = {k: v for k, v in self._funnel.items() if since is not None and k[0] < since}
+            self._time_to_pay = {k: v for k, v in self._time_to_pay.items() if since is not None and k[0] < since}
+
+        completed = Transaction.status == "completed"
+        funnel_query = select(
+            hour.label("hour"),
+            Transaction.plan_id,
+            func.count().label("checkouts"),
+            func.sum(case((completed, 1), else_=0)).label("completed"),
+            func.sum(case((Transaction.status == "failed", 1), else_=0)).label("failed"),
+            func.sum(case((completed, Transaction.amount), else_=0.0)).label("revenue"),
+        ).where(Transaction.created_at.isnot(None)).group_by(hour, Transaction.plan_id)
+
+        elapsed = case((elapsed < MIN_TIME_TO_PAY, MIN_TIME_TO_PAY), else_=elapsed)
+        key = cast(func.ceil(func.ln(elapsed) / self.sketch.log_gamma), Integer)
+        bin_conditions = [completed, Transaction.completed_at.isnot(None), Transaction.created_at.isnot(None)]
+        if since is not None:
+            since_at = datetime.fromtimestamp(since, timezone.utc).replace(tzinfo=None)
+            funnel_query = funnel_query.where(Transaction.created_at >= since_at)
+            bin_conditions.append(Transaction.created_at >= since_at)
+        bins_query = select(
+            hour.label("hour"), Transaction.plan_id, key.label("bin"), func.count().label("count")
+        ).where(*bin_conditions).group_by(hour, Transaction.plan_id, key)
+
+        with self.engine.begin() as connection:
+            funnel = [dict(row._mapping) for row in connection.execute(funnel_query)]
+            try:
+                bins = [dict(row._mapping) for row in connection.execute(bins_query)]
+            except OperationalError:
+                # SQLite built without math functions: bin the elapsed times here instead
+                rows = connection.execute(
+                    select(hour.label("hour"), Transaction.plan_id, elapsed.label("elapsed")).where(*bin_conditions)
+                )
+                counted: Dict[Tuple[int, str, int], int] = {}
+                for row in rows:
+                    bin_key = (row.hour, row.plan_id, self.sketch.key(row.elapsed))
+                    counted[bin_key] = counted.get(bin_key, 0) + 1
+                bins = [{"hour": h, "plan_id": p, "bin": b, "count": c} for (h, p, b), c in counted.items()]
+
+            for model in (AnalyticsFunnel, AnalyticsTimeToPay):
+                statement = delete(model)
+                if since is not None:
+                    statement = statement.where(model.hour >= since)
+                connection.execute(statement)
+            if funnel:
+                connection.execute(insert(AnalyticsFunnel), funnel)
+            if bins:
+                connection.execute(insert(AnalyticsTimeToPay), bins)
+
+        seconds = round(time.perf_counter() - started, 3)
+        logger.info(f"Analytics recomputed {len(funnel)} hourly buckets and {len(bins)} sketch bins in {seconds}s")
+        return {"buckets": len(funnel), "bins": len(bins), "seconds": seconds}
+
+
+# Global instance
+funnel_analytics = FunnelAnalytics()
@@ -0,0 +1,320 @@
+import os
+import json
+import time
+import uuid
+import asyncio
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+import logging
+
+from sqlalchemy import and_, case, cast, exists, func, or_, update
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import aliased
+from starlette.concurrency import run_in_threadpool
+
+from ..models import Transaction, BulkJob
+from .reconciliation import CORRECTABLE_FROM
+
+logger = logging.getLogger(__name__)
+
+OPERATIONS = ("mark_failed", "expire", "retry", "reprocess_webhook")
+
+# Statuses each operation may change; everything else in the selection is left alone
+SOURCE_STATUSES = {
+    "mark_failed": ("pending", "expired"),
+    "expire": ("pending",),
+    "retry": ("failed", "expired"),
+    "reprocess_webhook": tuple(sorted(set(CORRECTABLE_FROM["completed"]) | set(CORRECTABLE_FROM["failed"]))),
+}
+
+
+class BulkOperationError(Exception):
+    """Raised when a bulk operation request cannot be run"""
+
+
+def _json_text(dialect: str, column, *path: str):
+    """SQL expression for a text value inside a JSON column, NULL where the column isn't JSON"""
+    if dialect == "sqlite":
+        return case((func.json_valid(column) == 1, func.json_extract(column, "$." + ".".join(path))))
+    if dialect == "postgresql":
+        return func.jsonb_extract_path_text(cast(column, JSONB), *path)
+    raise BulkOperationError(f"reprocess_webhook needs JSON functions, which are not available on {dialect}")
+
+
+class BulkOperationService:
+    """Admin operations over many transactions as chunked, set-based UPDATEs
+
+    A selection (ID list or filter) is walked in primary-key order, ``chunk_size``
+    rows at a time: one column-only SELECT finds the chunk's rows, one UPDATE
+    changes all of them and the chunk commits. The UPDATE repeats the
+    operation's guard, so a row another request changed in between is skipped
+    rather than overwritten. Progress is written to the bulk_jobs row after
+    every chunk, so any worker can report it while the job runs. A running
+    job whose row has not been written for BULK_JOB_TIMEOUT seconds lost its
+    worker and is marked failed the next time jobs are read.
+    """
+
+    def __init__(self):
+        # Load configuration from environment variables
+        self.chunk_size = int(os.getenv("BULK_CHUNK_SIZE", "5000"))
+        self.job_timeout = float(os.getenv("BULK_JOB_TIMEOUT", "300"))
+        self._tasks = set()
+
+    def _guard(self, operation: str, dialect: str) -> List[Any]:
+        """Conditions a row must still meet when the UPDATE reaches it"""
+        conditions = [Transaction.status.in_(SOURCE_STATUSES[operation])]
+        if operation == "retry":
+            # Reopening must respect one pending checkout per user: only each user's newest
+            # failed/expired row is reopened, and only if no other checkout is open
+            other = aliased(Transaction)
+            conditions.append(or_(
+                Transaction.user_id.is_(None),
+                ~exists().where(
+                    other.user_id == Transaction.user_id,
+                    or_(
+                        other.status == "pending",
+                        and_(other.status.in_(SOURCE_STATUSES["retry"]), other.id > Transaction.id)
+                    )
+                )
+            ))
+        elif operation == "reprocess_webhook":
+            event = _json_text(dialect, Transaction.extra_data, "webhook_data", "type")
+            conditions.append(Transaction.extra_data.like('%"webhook_data"%'))
+            conditions.append(or_(
+                and_(event == "payment_succeeded", Transaction.status.in_(CORRECTABLE_FROM["completed"])),
+                and_(event == "payment_failed", Transaction.status.in_(CORRECTABLE_FROM["failed"]))
+            ))
+        return conditions
+
+    def _values(self, operation: str, dialect: str, reason: Optional[str], now: datetime) -> Dict[Any, Any]:
+        if operation == "mark_failed":
+            return {"status": "failed", "error_message": reason or "Marked failed by admin", "updated_at": now}
+        if operation == "expire":
+            return {"status": "expired", "updated_at": now}
+        if operation == "retry":
+            return {
+                "status": "pending",
+                "error_message": None,
+                "retry_count": func.coalesce(Transaction.retry_count, 0) + 1,
+                "updated_at": now,
+            }
+        # reprocess_webhook: apply the outcome of the webhook stored with the row again
+        succeeded = _json_text(dialect, Transaction.extra_data, "webhook_data", "type") == "payment_succeeded"
+        return {
+            "status": case((succeeded, "completed"), else_="failed"),
+            "webhook_received": True,
+            "completed_at": case((succeeded, func.coalesce(Transaction.completed_at, now)), else_=Transaction.completed_at),
+            "error_message": case((succeeded, None), else_=func.coalesce(
+                _json_text(dialect, Transaction.extra_data, "webhook_data", "data", "failure_reason"),
+                "Payment failed"
+            )),
+            "whop_payment_id": func.coalesce(
+                Transaction.whop_payment_id,
+                _json_text(dialect, Transaction.extra_data, "webhook_data", "data", "payment", "id"),
+                _json_text(dialect, Transaction.extra_data, "webhook_data", "data", "id")
+            ),
+            "updated_at": now,
+        }
+
+    @staticmethod
+    def _selection(criteria: Dict[str, Any]) -> List[Any]:
+        conditions = []
+        if criteria.get("status"):
+            conditions.append(Transaction.status == criteria["status"])
+        if criteria.get("plan_id"):
+            conditions.append(Transaction.plan_id == criteria["plan_id"])
+        if criteria.get("user_id"):
+            conditions.append(Transaction.user_id == criteria["user_id"])
+        if criteria.get("created_after"):
+            conditions.append(Transaction.created_at >= criteria["created_after"])
+        if criteria.get("created_before"):
+            conditions.append(Transaction.created_at < criteria["created_before"])
+        return conditions
+
+    def _chunks(self, db, ids: Optional[List[int]], where: List[Any]) -> Iterator[List[Any]]:
+        """Rows (id, user_id, whop_session_id) of the selection, one chunk at a time"""
+        columns = (Transaction.id, Transaction.user_id, Transaction.whop_session_id)
+        if ids is not None:
+            for start in range(0, len(ids), self.chunk_size):
+                yield db.query(*columns).filter(Transaction.id.in_(ids[start:start + self.chunk_size]), *where).all()
+            return
+        last_id = 0
+        while True:
+            # Keyset pagination on the primary key: every chunk is an index range scan
+            rows = db.query(*columns).filter(Transaction.id > last_id, *where).order_by(Transaction.id).limit(self.chunk_size).all()
+            if not rows:
+                return
+            last_id = rows[-1].id
+            yield rows
+
+    def validate(self, operation: str, ids: Optional[List[int]], criteria: Dict[str, Any]):
+        if operation not in OPERATIONS:
+            raise BulkOperationError(f"Unknown operation '{operation}'; expected one of {', '.join(OPERATIONS)}")
+        if ids is None and not any(criteria.get(name) for name in ("status", "plan_id", "user_id", "created_after", "created_before")):
+            raise BulkOperationError("Pass transaction ids or at least one filter")
+
+    def start(
+        self,
+        session_factory: Callable,
+        operation: str,
+        ids: Optional[List[int]] = None,
+        criteria: Optional[Dict[str, Any]] = None,
+        reason: Optional[str] = None,
+        invalidate: Optional[Callable] = None
+    ) -> Dict[str, Any]:
+        """Record a job and run it in the background; returns the job as first stored"""
+        criteria = {name: value for name, value in (criteria or {}).items() if value is not None}
+        self.validate(operation, ids, criteria)
+        if ids is not None:
+            ids = sorted(set(ids))
+
+        db = session_factory()
+        try:
+            job = BulkJob(
+                id=uuid.uuid4().hex,
+                operation=operation,
+                selection=json.dumps({"ids": ids, **criteria, "reason": reason}, default=str),
+                status="running",
+                total=0,
+                processed=0,
+                affected=0,
+                created_at=datetime.now(timezone.utc).replace(tzinfo=None),
+                heartbeat_at=datetime.now(timezone.utc).replace(tzinfo=None),
+            )
+            db.add(job)
+            db.commit()
+            result = self._as_dict(job)
+        finally:
+            db.close()
+
+        task = asyncio.ensure_future(run_in_threadpool(
+            self.run, session_factory, result["id"], operation, ids, criteria, reason, invalidate
+        ))
+        # Keep a reference until the task finishes so it can't be garbage collected
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return result
+
+    def run(
+        self,
+        session_factory: Callable,
+        job_id: str,
+        operation: str,
+        ids: Optional[List[int]],
+        criteria: Dict[str, Any],
+        reason: Optional[str],
+        invalidate: Optional[Callable]
+    ) -> Tuple[int, int]:
+        """Execute a job chunk by chunk; returns (processed, affected)"""
+        db = session_factory()
+        processed = affected = 0
+        started = time.perf_counter()
+        try:
+            dialect = db.get_bind().dialect.name
+            where = self._selection(criteria) + self._guard(operation, dialect)
+            total = 0
+            if ids is not None:
+                for start in range(0, len(ids), self.chunk_size):
+                    total += db.query(func.count(Transaction.id)).filter(
+                        Transaction.id.in_(ids[start:start + self.chunk_size]), *where
+                    ).scalar()
+            else:
+                total = db.query(func.count(Transaction.id)).filter(*where).scalar()
+            db.query(BulkJob).filter(BulkJob.id == job_id).update({
+                "total": total, "heartbeat_at": datetime.now(timezone.utc).replace(tzinfo=None),
+            })
+            db.commit()
+
+            for rows in self._chunks(db, ids, where):
+                if not rows:
+                    continue
+                now = datetime.now(timezone.utc).replace(tzinfo=None)
+                result = db.execute(
+                    update(Transaction)
+                    .where(Transaction.id.in_([row.id for row in rows]), *where)
+                    .values(self._values(operation, dialect, reason, now))
+                    .execution_options(synchronize_session=False)
+                )
+                if invalidate is not None:
+                    invalidate(db, rows)
+                processed += len(rows)
+                affected += result.rowcount
+                db.query(BulkJob).filter(BulkJob.id == job_id).update({
+                    "processed": processed, "affected": affected, "heartbeat_at": now,
+                })
+                db.commit()
+
+            db.query(BulkJob).filter(BulkJob.id == job_id).update({
+                "status": "completed",
+                "finished_at": datetime.now(timezone.utc).replace(tzinfo=None),
+            })
+            db.commit()
+            logger.info(
+                f"Bulk {operation} {job_id} finished: {affected} of {processed} transactions changed "
+                f"in {time.perf_counter() - started:.2f}s"
+            )
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Bulk {operation} {job_id} failed after {processed} transactions: {str(e)}")
+            db.query(BulkJob).filter(BulkJob.id == job_id).update({
+                "status": "failed",
+                "error": str(e),
+                "finished_at": datetime.now(timezone.utc).replace(tzinfo=None),
+            })
+            db.commit()
+        finally:
+            db.close()
+        return processed, affected
+
+    @staticmethod
+    def _as_dict(job: BulkJob) -> Dict[str, Any]:
+        return {
+            "id": job.id,
+            "operation": job.operation,
+            "selection": json.loads(job.selection or "{}"),
+            "status": job.status,
+            "total": job.total,
+            "processed": job.processed,
+            "affected": job.affected,
+            "progress": round(min(job.processed / job.total, 1.0), 4) if job.total else (1.0 if job.status == "completed" else 0.0),
+            "error": job.error,
+            "created_at": job.created_at.isoformat() if job.created_at else None,
+            "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+        }
+
+    def _fail_abandoned(self, db):
+        """Mark failed the running jobs that stopped writing progress, i.e. whose worker died"""
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        abandoned = db.query(BulkJob).filter(
+            BulkJob.status == "running",
+            func.coalesce(BulkJob.heartbeat_at, BulkJob.created_at) < now - timedelta(seconds=self.job_timeout)
+        ).update({
+            "status": "failed",
+            "error": f"No progress for {self.job_timeout:.0f}s - the worker running the job stopped",
+            "finished_at": now,
+        }, synchronize_session=False)
+        if abandoned:
+            db.commit()
+            logger.warning(f"Marked {abandoned} abandoned bulk job(s) failed")
+
+    def get(self, session_factory: Callable, job_id: str) -> Optional[Dict[str, Any]]:
+        db = session_factory()
+        try:
+            self._fail_abandoned(db)
+            job = db.get(BulkJob, job_id)
+            return self._as_dict(job) if job is not None else None
+        finally:
+            db.close()
+
+    def recent(self, session_factory: Callable, limit: int = 20) -> List[Dict[str, Any]]:
+        db = session_factory()
+        try:
+            self._fail_abandoned(db)
+            jobs = db.query(BulkJob).order_by(BulkJob.created_at.desc()).limit(limit).all()
+            return [self._as_dict(job) for job in jobs]
+        finally:
+            db.close()
+
+
+# Global instance
+bulk_operations = BulkOperationService()
@@ -0,0 +1,446 @@
+import os
+import json
+import time
+import threading
+from datetime import datetime
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+import logging
+
+from sqlalchemy import event, select, delete, insert
+from sqlalchemy.orm import Session
+
+from ..models import CacheInvalidation, TransactionSnapshot
+
+logger = logging.getLogger(__name__)
+
+# Returned by backends on a miss so that None can be cached
+MISSING = object()
+
+
+def _encode(value: Any) -> Dict[str, Any]:
+    """json.dumps default= for the cached types JSON has no form for"""
+    if isinstance(value, TransactionSnapshot):
+        return {"__snapshot__": list(value.__reduce__()[1])}
+    if isinstance(value, datetime):
+        return {"__datetime__": value.isoformat()}
+    raise TypeError(f"{type(value).__name__} cannot be stored in the shared cache")
+
+
+def _decode(obj: Dict[str, Any]) -> Any:
+    """json.loads object_hook undoing _encode (inner objects are decoded first)"""
+    if "__datetime__" in obj:
+        return datetime.fromisoformat(obj["__datetime__"])
+    if "__snapshot__" in obj:
+        return TransactionSnapshot(*obj["__snapshot__"])
+    return obj
+
+
+class LocalCacheBackend:
+    """Per-process LRU cache with per-entry TTL"""
+
+    def __init__(self, max_entries: int = 10_000):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, namespace: str, key: str) -> Any:
+        with self._lock:
+            entry = self._entries.get((namespace, key))
+            if entry is None:
+                return MISSING
+            if entry[0] < time.monotonic():
+                del self._entries[(namespace, key)]
+                return MISSING
+            self._entries.move_to_end((namespace, key))
+            return entry[1]
+
+    def set(self, namespace: str, key: str, value: Any, ttl: float):
+        with self._lock:
+            self._entries[(namespace, key)] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end((namespace, key))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def version(self, namespace: str, key: str) -> Any:
+        # CacheLayer's per-key load tracking already covers loads in this process
+        return None
+
+    def fill(self, namespace: str, key: str, value: Any, ttl: float, version: Any):
+        self.set(namespace, key, value, ttl)
+
+    def delete(self, namespace: str, key: str):
+        with self._lock:
+            self._entries.pop((namespace, key), None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class RedisCacheBackend:
+    """Cache shared by every worker and host through a Redis-protocol server
+
+    Values are stored as JSON with a server-side TTL. Datetimes and
+    TransactionSnapshots are tagged objects, so they come back as they went
+    in; nothing read from Redis is unpickled or otherwise able to construct
+    arbitrary objects.
+
+    Deleting a key is not enough on its own: a worker that read the row
+    before another node committed could still write the old value back
+    afterwards. Every key therefore has a version counter that delete()
+    bumps before removing the value; fill() stores a loaded value, then
+    checks the version it read before loading and removes the value again
+    if the key was invalidated in between.
+    """
+
+    # How long a key's version outlives its last invalidation; far longer than any load
+    VERSION_TTL = 3600
+    # Marks values in the current encoding; older releases stored plain JSON, then pickles
+    FORMAT = b"j1:"
+
+    def __init__(self, url: str, prefix: str = "cache", client=None):
+        if client is None:
+            try:
+                import redis
+            except ImportError as e:
+                raise RuntimeError("CACHE_BACKEND=redis requires the 'redis' package") from e
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self.prefix = prefix
+        self.evictions = 0
+
+    def _key(self, namespace: str, key: str) -> str:
+        return f"{self.prefix}:{namespace}:{key}"
+
+    def _version_key(self, namespace: str, key: str) -> str:
+        return f"{self.prefix}-version:{namespace}:{key}"
+
+    def get(self, namespace: str, key: str) -> Any:
+        raw = self.client.get(self._key(namespace, key))
+        if raw is None:
+            return MISSING
+        if not raw.startswith(self.FORMAT):
+            # Written by an older release; never decoded
+            return MISSING
+        try:
+            return json.loads(raw[len(self.FORMAT):], object_hook=_decode)
+        except Exception:
+            # e.g. written before TransactionSnapshot gained a field
+            return MISSING
+
+    @classmethod
+    def encode(cls, value: Any) -> bytes:
+        return cls.FORMAT + json.dumps(value, default=_encode, separators=(",", ":")).encode()
+
+    def set(self, namespace: str, key: str, value: Any, ttl: float):
+        self.client.set(self._key(namespace, key), self.encode(value), px=int(ttl * 1000))
+
+    def version(self, namespace: str, key: str) -> Any:
+        return self.client.get(self._version_key(namespace, key))
+
+    def fill(self, namespace: str, key: str, value: Any, ttl: float, version: Any):
+        """set() a value loaded after reading ``version``, unless the key was invalidated since"""
+        self.set(namespace, key, value, ttl)
+        if self.client.get(self._version_key(namespace, key)) != version:
+            # delete() ran after our read; it may have missed the value we just wrote
+            self.client.delete(self._key(namespace, key))
+
+    def delete(self, namespace: str, key: str):
+        version_key = self._version_key(namespace, key)
+        self.client.incr(version_key)
+        self.client.pexpire(version_key, self.VERSION_TTL * 1000)
+        self.client.delete(self._key(namespace, key))
+
+    def clear(self):
+        for key in self.client.scan_iter(f"{self.prefix}:*"):
+            self.client.delete(key)
+
+    def __len__(self) -> int:
+        return 0
+
+
+class DatabaseInvalidationBus:
+    """Cross-worker invalidation through the cache_invalidations table
+
+    Writers insert a row in the same transaction as the data change, so a
+    notification exists exactly when the change is committed. Every worker
+    polls for rows newer than the last one it applied (at most once per
+    ``poll_interval`` and only when the cache is used), which bounds how long
+    another worker can serve a stale entry. Reads only request a poll: it runs
+    in a background thread, so no request (or event loop) waits on the query.
+    Old rows are pruned after ``retention`` seconds; a worker that has not
+    polled for that long cannot know what it missed and flushes its whole
+    cache instead.
+    """
+
+    def __init__(self, poll_interval: float = 1.0, retention: float = 300.0):
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self.engine = None
+        self.last_seen_id = 0
+        self._last_poll = 0.0
+        self._last_prune = 0.0
+        self._lock = threading.Lock()
+        self._wanted = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._apply: Optional[Callable[[str, str], None]] = None
+        self._flush: Optional[Callable[[], None]] = None
+
+    def attach(self, engine):
+        """Start from the current end of the log; older notifications predate this worker's cache"""
+        self.engine = engine
+        with engine.connect() as connection:
+            latest = connection.execute(
+                select(CacheInvalidation.id).order_by(CacheInvalidation.id.desc()).limit(1)
+            ).scalar()
+        self.last_seen_id = latest or 0
+        self._last_poll = time.monotonic()
+
+    def publish(self, db: Session, namespace: str, key: str):
+        db.add(CacheInvalidation(namespace=namespace, cache_key=key, created_at=time.time()))
+
+    def publish_many(self, db: Session, namespace: str, keys: Iterable[str]):
+        now = time.time()
+        db.execute(insert(CacheInvalidation), [
+            {"namespace": namespace, "cache_key": key, "created_at": now} for key in keys
+        ])
+
+    def poll_soon(self, apply: Callable[[str, str], None], flush: Callable[[], None]):
+        """Have the background thread poll if one is due; never waits"""
+        if self.engine is None or time.monotonic() - self._last_poll < self.poll_interval:
+            return
+        self._apply, self._flush = apply, flush
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="cache-invalidations", daemon=True)
+            self._thread.start()
+        self._wanted.set()
+
+    def _run(self):
+        while True:
+            self._wanted.wait()
+            self._wanted.clear()
+            self.poll(self._apply, self._flush)
+
+    def poll(self, apply: Callable[[str, str], None], flush: Callable[[], None], force: bool = False):
+        """Apply notifications committed by any worker since the last poll"""
+        if self.engine is None:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_poll < self.poll_interval:
+            return
+        # One poller per worker; concurrent readers keep using the cache meanwhile
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            with self.engine.begin() as connection:
+                if now - self._last_poll > self.retention / 2:
+                    flush()
+                rows = connection.execute(
+                    select(CacheInvalidation.id, CacheInvalidation.namespace, CacheInvalidation.cache_key)
+                    .where(CacheInvalidation.id > self.last_seen_id)
+                    .order_by(CacheInvalidation.id)
+                ).all()
+                for row in rows:
+                    apply(row.namespace, row.cache_key)
+                    self.last_seen_id = row.id
+                if now - self._last_prune > self.retention / 2:
+                    connection.execute(
+                        delete(CacheInvalidation).where(CacheInvalidation.created_at < time.time() - self.retention)
+                    )
+                    self._last_prune = now
+            self._last_poll = now
+        except Exception as e:
+            logger.error(f"Cache invalidation poll failed: {str(e)}")
+        finally:
+            self._lock.release()
+
+
+class CacheLayer:
+    """Read-through cache with invalidation that is safe across workers
+
+    The memory backend keeps entries per process and relies on the database
+    invalidation bus to evict entries other workers have changed. The redis
+    backend is shared by every process, so invalidations just delete the key.
+    Invalidations are queued on the SQLAlchemy session and applied after it
+    commits, so a rolled-back write never evicts anything and a concurrent
+    reader cannot re-cache the old row before the new one is visible.
+    """
+
+    def __init__(self):
+        # Load configuration from environment variables
+        self.enabled = os.getenv("CACHE_ENABLED", "true").lower() == "true"
+        self.default_ttl = float(os.getenv("CACHE_DEFAULT_TTL", "300"))
+        self.backend_name = os.getenv("CACHE_BACKEND", "memory")
+        self.backend = self._create_backend(self.backend_name)
+        self.bus = None
+        if isinstance(self.backend, LocalCacheBackend):
+            self.bus = DatabaseInvalidationBus(
+                poll_interval=float(os.getenv("CACHE_INVALIDATION_POLL_INTERVAL", "1.0")),
+                retention=float(os.getenv("CACHE_INVALIDATION_RETENTION", "300")),
+            )
+        self.stats: Dict[str, Dict[str, int]] = {}
+        # Keys being loaded: [loads in flight, invalidations applied meanwhile]. A load that
+        # overlaps an invalidation of its own key (or a flush) is not stored
+        self._loading: Dict[Tuple[str, str], List[int]] = {}
+        self._flushes = 0
+        self._loading_lock = threading.Lock()
+        # Called with (namespace, key) for every applied invalidation, (None, None) on a full flush
+        self.listeners: List[Callable[[Optional[str], Optional[str]], None]] = []
+
+    @staticmethod
+    def _create_backend(name: str):
+        """Build the cache backend named by CACHE_BACKEND"""
+        if name == "redis":
+            return RedisCacheBackend(os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+        if name != "memory":
+            logger.warning(f"Unknown CACHE_BACKEND '{name}' - using in-process cache")
+        return LocalCacheBackend(int(os.getenv("CACHE_MAX_ENTRIES", "10000")))
+
+    def attach(self, engine):
+        """Begin following invalidations published by other workers"""
+        if self.enabled and self.bus is not None:
+            self.bus.attach(engine)
+
+    def _count(self, namespace: str, outcome: str):
+        counters = self.stats.setdefault(namespace, {"hits": 0, "misses": 0, "invalidations": 0})
+        counters[outcome] += 1
+
+    def _apply_invalidation(self, namespace: str, key: str):
+        with self._loading_lock:
+            loading = self._loading.get((namespace, key))
+            if loading is not None:
+                loading[1] += 1
+        self.backend.delete(namespace, key)
+        self._notify(namespace, key)
+
+    def _notify(self, namespace: Optional[str], key: Optional[str]):
+        for listener in self.listeners:
+            try:
+                listener(namespace, key)
+            except Exception as e:
+                logger.error(f"Cache invalidation listener failed: {str(e)}")
+
+    def sync(self):
+        """Apply invalidations committed by other workers now (at most once per poll interval); blocks on the query"""
+        if self.enabled and self.bus is not None:
+            self.bus.poll(self._apply_invalidation, self.clear)
+
+    def get(self, namespace: str, key: Any) -> Any:
+        """Cached value or MISSING"""
+        if not self.enabled:
+            return MISSING
+        if self.bus is not None:
+            self.bus.poll_soon(self._apply_invalidation, self.clear)
+        try:
+            value = self.backend.get(namespace, str(key))
+        except Exception as e:
+            logger.error(f"Cache read failed: {str(e)}")
+            value = MISSING
+        self._count(namespace, "misses" if value is MISSING else "hits")
+        return value
+
+    def set(self, namespace: str, key: Any, value: Any, ttl: Optional[float] = None):
+        if not self.enabled:
+            return
+        try:
+            self.backend.set(namespace, str(key), value, self.default_ttl if ttl is None else ttl)
+        except Exception as e:
+            logger.error(f"Cache write failed: {str(e)}")
+
+    def get_or_load(self, namespace: str, key: Any, loader: Callable[[], Any], ttl: Optional[float] = None) -> Any:
+        """Return the cached value, calling ``loader`` and caching its result on a miss"""
+        value = self.get(namespace, key)
+        if value is not MISSING:
+            return value
+        try:
+            version = self.backend.version(namespace, str(key))
+        except Exception as e:
+            logger.error(f"Cache read failed: {str(e)}")
+            return loader()
+        slot = (namespace, str(key))
+        with self._loading_lock:
+            loading = self._loading.setdefault(slot, [0, 0])
+            loading[0] += 1
+            started = (loading[1], self._flushes)
+        try:
+            value = loader()
+        finally:
+            with self._loading_lock:
+                overlapped = (loading[1], self._flushes) != started
+                loading[0] -= 1
+                if not loading[0]:
+                    del self._loading[slot]
+        if not overlapped:
+            try:
+                self.backend.fill(namespace, str(key), value, self.default_ttl if ttl is None else ttl, version)
+            except Exception as e:
+                logger.error(f"Cache write failed: {str(e)}")
+        return value
+
+    def invalidate(self, db: Session, namespace: str, key: Any):
+        """Evict ``key`` everywhere once ``db`` commits"""
+        # With the cache disabled, listeners still hear about local commits
+        if not (self.enabled or self.listeners) or key is None:
+            return
+        db.info.setdefault("cache_invalidations", set()).add((namespace, str(key)))
+        if self.enabled and self.bus is not None:
+            self.bus.publish(db, namespace, str(key))
+
+    def invalidate_many(self, db: Session, namespace: str, keys: Iterable[Any]):
+        """Bulk form of invalidate() for set-based writes: one executemany instead of a row per flush"""
+        if not (self.enabled or self.listeners):
+            return
+        keys = {str(key) for key in keys if key is not None}
+        if not keys:
+            return
+        db.info.setdefault("cache_invalidations", set()).update((namespace, key) for key in keys)
+        if self.enabled and self.bus is not None:
+            self.bus.publish_many(db, namespace, sorted(keys))
+
+    def _after_commit(self, session: Session):
+        pending: Set[Tuple[str, str]] = session.info.pop("cache_invalidations", set())
+        for namespace, key in pending:
+            try:
+                self._apply_invalidation(namespace, key)
+            except Exception as e:
+                logger.error(f"Cache invalidation failed: {str(e)}")
+            self._count(namespace, "invalidations")
+
+    @staticmethod
+    def _after_rollback(session: Session):
+        session.info.pop("cache_invalidations", None)
+
+    def clear(self):
+        with self._loading_lock:
+            self._flushes += 1
+        self.backend.clear()
+        self._notify(None, None)
+
+    def snapshot_stats(self) -> Dict[str, Any]:
+        namespaces = {}
+        for namespace, counters in self.stats.items():
+            lookups = counters["hits"] + counters["misses"]
+            namespaces[namespace] = {
+                **counters,
+                "hit_ratio": round(counters["hits"] / lookups, 4) if lookups else 0.0,
+            }
+        return {
+            "enabled": self.enabled,
+            "backend": self.backend_name,
+            "entries": len(self.backend),
+            "evictions": self.backend.evictions,
+            "namespaces": namespaces,
+        }
+
+
+# Global instance
+cache = CacheLayer()
+
+event.listen(Session, "after_commit", cache._after_commit)
+event.listen(Session, "after_rollback", cache._after_rollback)
@@ -0,0 +1,144 @@
+import os
+import asyncio
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import logging
+
+from starlette.concurrency import run_in_threadpool
+
+from ..database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+# (stage function, values, future of the caller waiting for the row)
+Pending = Tuple[Callable, Dict[str, Any], asyncio.Future]
+
+
+class GroupCommitWriter:
+    """Single writer that commits concurrent checkout inserts together
+
+    Callers enqueue the values of their insert and await a future. One writer
+    task per event loop takes everything queued within ``window`` seconds (at
+    most ``max_batch`` inserts), stages them all in one session with set-based
+    statements and commits once, so a burst of checkouts costs one fsync per
+    batch instead of one per checkout. Futures are resolved only after that
+    commit returns, so a caller never sees an ID that isn't durable. If the
+    batch fails, its inserts are retried one transaction each, so a bad insert
+    only fails its own caller.
+    """
+
+    def __init__(self):
+        # Load configuration from environment variables
+        self.enabled = os.getenv("CHECKOUT_GROUP_COMMIT", "false").lower() == "true"
+        self.window = float(os.getenv("CHECKOUT_GROUP_COMMIT_WINDOW_MS", "2")) / 1000
+        self.max_batch = int(os.getenv("CHECKOUT_GROUP_COMMIT_MAX_BATCH", "500"))
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._loop = None
+        self.stats = {"batches": 0, "inserts": 0, "fallbacks": 0}
+
+    def _ensure_writer(self) -> asyncio.Queue:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._task is None or self._task.done():
+            # First use, or a new event loop (e.g. a test client per request)
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._task = loop.create_task(self._run(self._queue))
+        return self._queue
+
+    async def submit(self, stage: Callable, values: Dict[str, Any]) -> Any:
+        """Queue one insert and wait for its committed result
+
+        ``stage(db, batch)`` does the inserts of a whole batch (a list of
+        values) in the writer's session without committing and returns one
+        result per entry; that result (ORM objects are detached with their
+        loaded attributes) is what the caller gets back.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._ensure_writer().put_nowait((stage, values, future))
+        return await future
+
+    async def close(self):
+        """Commit whatever is still queued and stop the writer"""
+        if self._task is None or self._task.done() or self._loop is not asyncio.get_running_loop():
+            return
+        self._queue.put_nowait(None)
+        await self._task
+        self._task = None
+
+    async def _run(self, queue: asyncio.Queue):
+        loop = asyncio.get_running_loop()
+        while True:
+            first = await queue.get()
+            if first is None:
+                return
+            batch: List[Pending] = [first]
+            stopping = False
+            deadline = loop.time() + self.window
+            while len(batch) < self.max_batch:
+                # Take what is already queued without waiting, then wait out the window for more
+                try:
+                    item = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(queue.get(), remaining)
+                    except asyncio.TimeoutError:
+                        break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            live = [item for item in batch if not item[2].cancelled()]
+            if live:
+                try:
+                    results = await run_in_threadpool(self._write, live)
+                except Exception as e:
+                    for _, _, future in live:
+                        if not future.done():
+                            future.set_exception(e)
+                else:
+                    for (_, _, future), (ok, result) in zip(live, results):
+                        if future.done():
+                            continue
+                        if ok:
+                            future.set_result(result)
+                        else:
+                            future.set_exception(result)
+            if stopping:
+                return
+
+    def _write(self, batch: List[Pending]) -> List[Tuple[bool, Any]]:
+        """Stage and commit a batch; returns (succeeded, result or exception) per insert"""
+        db = SessionLocal()
+        try:
+            # Batches normally share one stage function; keep submission order either way
+            by_stage: Dict[Callable, List[int]] = {}
+            for index, (stage, _, _) in enumerate(batch):
+                by_stage.setdefault(stage, []).append(index)
+            results: List[Any] = [None] * len(batch)
+            for stage, indexes in by_stage.items():
+                for index, result in zip(indexes, stage(db, [batch[i][1] for i in indexes])):
+                    results[index] = result
+            # Everything is written by the flush; detaching keeps the loaded attributes readable after commit
+            db.flush()
+            db.expunge_all()
+            db.commit()
+            self.stats["batches"] += 1
+            self.stats["inserts"] += len(batch)
+            return [(True, result) for result in results]
+        except Exception as e:
+            db.rollback()
+            if len(batch) == 1:
+                return [(False, e)]
+            logger.warning(f"Group commit of {len(batch)} checkouts failed, retrying one by one: {str(e)}")
+            self.stats["fallbacks"] += 1
+        finally:
+            db.close()
+        return [self._write([item])[0] for item in batch]
+
+
+# Global instance
+checkout_writer = GroupCommitWriter()
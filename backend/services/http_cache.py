@@ -0,0 +1,82 @@
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Optional
+
+from starlette.requests import Request
+from starlette.responses import HTMLResponse, Response
+
+
+def make_etag(body: bytes) -> str:
+    """Strong ETag derived from the response body"""
+    return '"%s"' % hashlib.sha256(body).hexdigest()[:32]
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison of an If-None-Match header against an ETag (RFC 9110)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+
+def weak_etag(*parts) -> str:
+    """Weak ETag over values that change whenever the representation does"""
+    return 'W/"%s"' % hashlib.sha1("|".join(str(part) for part in parts).encode()).hexdigest()[:24]
+
+
+def _as_utc(value: datetime) -> datetime:
+    # SQLite hands back naive datetimes holding CURRENT_TIMESTAMP, which is UTC
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value.astimezone(timezone.utc)
+
+
+def http_date(value: datetime) -> str:
+    return format_datetime(_as_utc(value), usegmt=True)
+
+
+def parse_http_date(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        return _as_utc(parsedate_to_datetime(value))
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+def is_not_modified(request: Request, etag: str, last_modified: Optional[datetime] = None) -> bool:
+    """Evaluate If-None-Match, or If-Modified-Since when no ETag was sent (RFC 9110 13.2.2)"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        return etag_matches(if_none_match, etag)
+    if last_modified is None:
+        return False
+    since = parse_http_date(request.headers.get("if-modified-since"))
+    # HTTP dates have one-second resolution
+    return since is not None and _as_utc(last_modified).replace(microsecond=0) <= since
+
+
+def not_modified(headers: dict) -> Response:
+    return Response(status_code=304, headers=headers)
+
+
+class StaticPage:
+    """A fully rendered page held in memory and served with ETag revalidation"""
+
+    def __init__(self, body: bytes):
+        self.body = body
+        self.etag = make_etag(body)
+        # Browsers may keep the page but must revalidate, so a redeploy is picked up immediately
+        self.headers = {"ETag": self.etag, "Cache-Control": "no-cache"}
+
+    def response(self, request: Request) -> Response:
+        if etag_matches(request.headers.get("if-none-match"), self.etag):
+            return not_modified(self.headers)
+        return HTMLResponse(self.body, headers=self.headers)
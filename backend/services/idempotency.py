@@ -0,0 +1,330 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+import logging
+
+from sqlalchemy import delete, update
+from sqlalchemy.exc import IntegrityError
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse
+
+from ..database import SessionLocal
+from ..models import IdempotencyKey
+
+logger = logging.getLogger(__name__)
+
+HEADER_NAME = "idempotency-key"
+
+# Keys are client-generated (usually UUIDs); anything longer is a client bug
+MAX_KEY_LENGTH = 255
+
+# Outcomes worth retrying for real rather than replaying
+UNSTORED_STATUSES = (429,)
+
+# Per-session headers that must not be handed to whoever replays the key
+UNSTORED_HEADERS = (b"set-cookie",)
+
+# Returned by claim() when this request won the key and must run the endpoint
+CLAIMED = object()
+
+
+class IdempotencyStore:
+    """Responses of POSTs made with an Idempotency-Key, for replay to retries
+
+    Each key (scoped to the caller's session, or to the request body when it
+    has none, and the path) is claimed by
+    inserting a row into the idempotency_keys table; the row holds no response
+    until the first request finishes, which is how a duplicate arriving at
+    another worker knows to wait. Finished responses are also kept in a
+    per-process LRU so replays usually cost no query at all. Server errors
+    release the key so the retry runs the endpoint again.
+    """
+
+    def __init__(self):
+        # Load configuration from environment variables
+        self.enabled = os.getenv("IDEMPOTENCY_ENABLED", "true").lower() == "true"
+        self.paths = tuple(
+            path.strip() for path in
+            os.getenv("IDEMPOTENCY_PATHS", "/api/create-cerebra-checkout,/api/transactions/").split(",")
+            if path.strip()
+        )
+        self.ttl = float(os.getenv("IDEMPOTENCY_TTL", "86400"))
+        self.max_entries = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "1000"))
+        self.wait_timeout = float(os.getenv("IDEMPOTENCY_WAIT_TIMEOUT", "10"))
+        # A claim older than this belongs to a worker that died mid-request
+        self.lock_timeout = float(os.getenv("IDEMPOTENCY_LOCK_TIMEOUT", "60"))
+        self.poll_interval = 0.05
+        self._responses: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.inflight: Dict[str, asyncio.Future] = {}
+        self._last_prune = 0.0
+
+    @staticmethod
+    def request_hash(method: str, path: str, body: bytes) -> str:
+        return hashlib.sha256(method.encode() + b" " + path.encode() + b"\n" + body).hexdigest()
+
+    def remember(self, key: str, record: Dict[str, Any]):
+        self._responses[key] = record
+        self._responses.move_to_end(key)
+        while len(self._responses) > self.max_entries:
+            self._responses.popitem(last=False)
+
+    def recall(self, key: str) -> Optional[Dict[str, Any]]:
+        record = self._responses.get(key)
+        if record is None:
+            return None
+        if record["created_at"] < time.time() - self.ttl:
+            del self._responses[key]
+            return None
+        self._responses.move_to_end(key)
+        return record
+
+    @staticmethod
+    def _as_record(row: IdempotencyKey) -> Dict[str, Any]:
+        return {
+            "request_hash": row.request_hash,
+            "status_code": row.status_code,
+            "headers": json.loads(row.headers) if row.headers else [],
+            "body": row.body or b"",
+            "created_at": row.created_at,
+        }
+
+    def claim(self, key: str, request_hash: str) -> Any:
+        """CLAIMED if the caller now owns ``key``, otherwise the existing record"""
+        db = SessionLocal()
+        try:
+            now = time.time()
+            db.add(IdempotencyKey(key=key, request_hash=request_hash, created_at=now))
+            try:
+                db.commit()
+                return CLAIMED
+            except IntegrityError:
+                db.rollback()
+
+            row = db.get(IdempotencyKey, key)
+            if row is None:
+                # Released between our insert and read; the caller simply tries again
+                return None
+            if row.created_at < now - self.ttl or (row.status_code is None and row.created_at < now - self.lock_timeout):
+                # Expired or abandoned: take it over, unless another request just did
+                taken = db.execute(
+                    update(IdempotencyKey)
+                    .where(IdempotencyKey.key == key, IdempotencyKey.created_at == row.created_at)
+                    .values(request_hash=request_hash, status_code=None, headers=None, body=None, created_at=now)
+                ).rowcount
+                db.commit()
+                return CLAIMED if taken == 1 else None
+            return self._as_record(row)
+        finally:
+            db.close()
+
+    def load(self, key: str) -> Optional[Dict[str, Any]]:
+        db = SessionLocal()
+        try:
+            row = db.get(IdempotencyKey, key)
+            return self._as_record(row) if row is not None else None
+        finally:
+            db.close()
+
+    def save(self, key: str, record: Dict[str, Any]):
+        db = SessionLocal()
+        try:
+            db.execute(
+                update(IdempotencyKey)
+                .where(IdempotencyKey.key == key)
+                .values(
+                    status_code=record["status_code"],
+                    headers=json.dumps(record["headers"]),
+                    body=record["body"]
+                )
+            )
+            now = time.time()
+            if now - self._last_prune > min(self.ttl, 3600):
+                db.execute(delete(IdempotencyKey).where(IdempotencyKey.created_at < now - self.ttl))
+                self._last_prune = now
+            db.commit()
+        finally:
+            db.close()
+
+    def release(self, key: str):
+        db = SessionLocal()
+        try:
+            db.execute(delete(IdempotencyKey).where(IdempotencyKey.key == key, IdempotencyKey.status_code.is_(None)))
+            db.commit()
+        finally:
+            db.close()
+
+
+# Global instance
+idempotency_store = IdempotencyStore()
+
+
+def _error(status_code: int, detail: str) -> JSONResponse:
+    return JSONResponse({"detail": detail}, status_code=status_code)
+
+
+class IdempotencyMiddleware:
+    """ASGI middleware answering retried POSTs from the stored first response
+
+    Applies to POSTs on IDEMPOTENCY_PATHS that carry an ``Idempotency-Key``
+    header. A replay never reaches the endpoint: it gets the original status,
+    headers and body plus ``Idempotent-Replayed: true``. A duplicate that
+    arrives while the first request is still running waits for its result
+    (an asyncio future within a worker, polling the table across workers)
+    instead of running the endpoint a second time.
+    """
+
+    def __init__(self, app, store: IdempotencyStore = idempotency_store):
+        self.app = app
+        self.store = store
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http" or scope["method"] != "POST"
+            or not self.store.enabled or scope["path"] not in self.store.paths
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        header = None
+        for name, value in scope["headers"]:
+            if name == HEADER_NAME.encode():
+                header = value.decode("latin-1").strip()
+                break
+        if header is None:
+            await self.app(scope, receive, send)
+            return
+        if not header or len(header) > MAX_KEY_LENGTH:
+            await _error(400, f"Idempotency-Key must be 1-{MAX_KEY_LENGTH} characters")(scope, receive, send)
+            return
+
+        # The body is part of the request's identity, so it is read up front and replayed to the app
+        messages = []
+        body = b""
+        while True:
+            message = await receive()
+            messages.append(message)
+            if message["type"] != "http.request":
+                break
+            body += message.get("body", b"")
+            if not message.get("more_body", False):
+                break
+
+        async def replay_receive():
+            if messages:
+                return messages.pop(0)
+            return await receive()
+
+        request_hash = self.store.request_hash(scope["method"], scope["path"], body)
+        # Scoped to the signed session so another browser reusing the key can't get this caller's checkout.
+        # Without a session cookie (API clients, or a first response lost before its cookie arrived) every
+        # attempt gets a fresh session, so the key is scoped to the request itself instead.
+        session = scope.get("state", {}).get("session") or {}
+        if session.get("session_id") and not session.get("new"):
+            key = f"{session['session_id']}:{scope['path']}:{header}"
+        else:
+            key = f"request-{request_hash}:{scope['path']}:{header}"
+        deadline = time.monotonic() + self.store.wait_timeout
+
+        while True:
+            record = self.store.recall(key)
+            if record is not None:
+                await self._replay(record, request_hash, scope, receive, send)
+                return
+
+            waiting = self.store.inflight.get(key)
+            if waiting is not None:
+                try:
+                    await asyncio.wait_for(asyncio.shield(waiting), max(deadline - time.monotonic(), 0))
+                except asyncio.TimeoutError:
+                    await _error(409, "A request with this Idempotency-Key is still being processed")(scope, receive, send)
+                    return
+                # Replayed from memory on the next pass, or run here if the first attempt failed
+                continue
+
+            future = asyncio.get_running_loop().create_future()
+            self.store.inflight[key] = future
+            try:
+                claim = await run_in_threadpool(self.store.claim, key, request_hash)
+                if claim is CLAIMED:
+                    await self._execute(key, request_hash, scope, replay_receive, send)
+                    return
+                if claim is not None and claim["status_code"] is None:
+                    # Running on another worker
+                    claim = await self._wait_elsewhere(key, deadline)
+                    if claim is None and time.monotonic() >= deadline:
+                        await _error(409, "A request with this Idempotency-Key is still being processed")(scope, receive, send)
+                        return
+                if claim is not None and claim["status_code"] is not None:
+                    self.store.remember(key, claim)
+                    await self._replay(claim, request_hash, scope, receive, send)
+                    return
+            finally:
+                del self.store.inflight[key]
+                if not future.done():
+                    future.set_result(None)
+
+    async def _wait_elsewhere(self, key: str, deadline: float) -> Optional[Dict[str, Any]]:
+        """Poll the table until another worker stores the response, releases the key or time runs out"""
+        while time.monotonic() < deadline:
+            await asyncio.sleep(self.store.poll_interval)
+            record = await run_in_threadpool(self.store.load, key)
+            if record is None or record["status_code"] is not None:
+                return record
+        return None
+
+    async def _execute(self, key: str, request_hash: str, scope, receive, send):
+        """Run the endpoint, streaming its response through while keeping a copy"""
+        start: Dict[str, Any] = {}
+        chunks: List[bytes] = []
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                start.update(message)
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except BaseException:
+            await run_in_threadpool(self.store.release, key)
+            raise
+
+        status_code = start.get("status", 500)
+        if status_code >= 500 or status_code in UNSTORED_STATUSES:
+            await run_in_threadpool(self.store.release, key)
+            return
+
+        headers: List[Tuple[str, str]] = [
+            (name.decode("latin-1"), value.decode("latin-1"))
+            for name, value in start.get("headers", [])
+            if name.lower() not in UNSTORED_HEADERS
+        ]
+        record = {
+            "request_hash": request_hash,
+            "status_code": status_code,
+            "headers": headers,
+            "body": b"".join(chunks),
+            "created_at": time.time(),
+        }
+        try:
+            await run_in_threadpool(self.store.save, key, record)
+        except Exception as e:
+            # The client already has its response; a retry will just run the endpoint again
+            logger.error(f"Could not store idempotent response for {key}: {str(e)}")
+            await run_in_threadpool(self.store.release, key)
+            return
+        self.store.remember(key, record)
+
+    async def _replay(self, record: Dict[str, Any], request_hash: str, scope, receive, send):
+        if record["request_hash"] != request_hash:
+            await _error(422, "Idempotency-Key was already used with a different request")(scope, receive, send)
+            return
+        headers = [(name.encode("latin-1"), value.encode("latin-1")) for name, value in record["headers"]]
+        headers.append((b"idempotent-replayed", b"true"))
+        await send({"type": "http.response.start", "status": record["status_code"], "headers": headers})
+        await send({"type": "http.response.body", "body": record["body"]})
@@ -1,35 +1,46 @@
-import json
 from datetime import datetime
 from typing import Dict, Any
-from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch
-from reportlab.lib import colors
 from io import BytesIO
 import os
+import time
+from .metrics import invoice_render_duration
+from .tracing import tracer
+from ..models import TransactionSnapshot
 
 class InvoiceService:
-    """Service for generating downloadable invoices"""
+    """Service for generating downloadable invoices
+    
+    ReportLab is imported on the first PDF render rather than at import time,
+    so workers that never build a PDF don't pay for it at startup.
+    """
     
     def __init__(self):
-        self.styles = getSampleStyleSheet()
+        self._styles = None
         # Load company information from environment variables
         self.company_name = os.getenv("COMPANY_NAME", "Your Company Name")
         self.company_address = os.getenv("COMPANY_ADDRESS", "Your Company Address")
         self.product_name = os.getenv("PRODUCT_NAME", "Premium Access")
-        
-    def generate_invoice_pdf(self, transaction) -> BytesIO:
+    
+    @property
+    def styles(self):
+        """ReportLab sample stylesheet, built on first use"""
+        if self._styles is None:
+            from reportlab.lib.styles import getSampleStyleSheet
+            self._styles = getSampleStyleSheet()
+        return self._styles
+        
+    @tracer.traced("invoice.pdf")
+    def generate_invoice_pdf(self, transaction: TransactionSnapshot) -> BytesIO:
         """Generate PDF invoice for a completed transaction"""
+        from reportlab.lib.pagesizes import letter
+        from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
+        from reportlab.lib.styles import ParagraphStyle
+        from reportlab.lib.units import inch
+        from reportlab.lib import colors
+        
         buffer = BytesIO()
         doc = SimpleDocTemplate(buffer, pagesize=letter, topMargin=1*inch)
         
-        # Parse extra data
-        extra_data = json.loads(transaction.extra_data or "{}")
-        webhook_data = extra_data.get("webhook_data", {})
-        payment_data = extra_data.get("payment_data", {})
-        customer_data = extra_data.get("customer_data", {})
-        
         # Build invoice content
         story = []
         
@@ -60,7 +71,7 @@ class InvoiceService:
         details_data = [
             ['Invoice Date:', invoice_date.strftime('%B %d, %Y')],
             ['Transaction ID:', str(transaction.id)],
-            ['Payment ID:', extra_data.get("whop_payment_id", "N/A")],
+            ['Payment ID:', transaction.payment_id or "N/A"],
             ['Status:', transaction.status.title()]
         ]
         
@@ -76,12 +87,9 @@ class InvoiceService:
         
         # Bill to section
         story.append(Paragraph("BILL TO:", self.styles['Heading3']))
-        customer_name = transaction.customer_name or customer_data.get("name", "Valued Customer")
-        customer_email = transaction.customer_email or customer_data.get("email", "")
-        
-        story.append(Paragraph(customer_name, self.styles['Normal']))
-        if customer_email:
-            story.append(Paragraph(customer_email, self.styles['Normal']))
+        story.append(Paragraph(transaction.billing_name, self.styles['Normal']))
+        if transaction.billing_email:
+            story.append(Paragraph(transaction.billing_email, self.styles['Normal']))
         story.append(Spacer(1, 30))
         
         # Items table
@@ -135,24 +143,22 @@ class InvoiceService:
         story.append(Paragraph(footer_text, self.styles['Normal']))
         
         # Build PDF
-        doc.build(story)
+        render_start = time.perf_counter()
+        with tracer.span("invoice.build"):
+            doc.build(story)
+        invoice_render_duration.observe(time.perf_counter() - render_start)
         buffer.seek(0)
         return buffer
     
-    def get_receipt_data(self, transaction) -> Dict[str, Any]:
+    def get_receipt_data(self, transaction: TransactionSnapshot) -> Dict[str, Any]:
         """Get structured receipt data for display"""
-        extra_data = json.loads(transaction.extra_data or "{}")
-        webhook_data = extra_data.get("webhook_data", {})
-        payment_data = extra_data.get("payment_data", {})
-        customer_data = extra_data.get("customer_data", {})
-        
         return {
             "invoice_number": f"{transaction.id:06d}",
             "transaction_id": transaction.id,
-            "payment_id": extra_data.get("whop_payment_id"),
+            "payment_id": transaction.payment_id,
             "invoice_date": (transaction.completed_at or transaction.created_at).strftime('%B %d, %Y'),
-            "customer_name": transaction.customer_name or customer_data.get("name", "Valued Customer"),
-            "customer_email": transaction.customer_email or customer_data.get("email", ""),
+            "customer_name": transaction.billing_name,
+            "customer_email": transaction.billing_email,
             "amount": transaction.amount,
             "status": transaction.status,
             "product_name": "Cerebra Premium Access",
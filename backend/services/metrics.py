@@ -0,0 +1,264 @@
+import os
+import time
+import threading
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+import logging
+
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+# Latency buckets (seconds) shared by request, statement and render histograms
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(label_names: Tuple[str, ...], label_values: Tuple[str, ...], extra: str = "") -> str:
+    """Render a Prometheus label set such as {method="GET",route="/"}"""
+    parts = [
+        '%s="%s"' % (name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in zip(label_names, label_values)
+    ]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    """Monotonically increasing counter, optionally labelled"""
+
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, label_names: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        # Updates are read-modify-writes from handler threads and engine events at once
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values: str, amount: float = 1.0):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0.0) + amount
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.label_names, labels)} {value}" for labels, value in values]
+
+
+class Gauge(Counter):
+    """Value that can go up and down, or be computed at scrape time"""
+
+    type_name = "gauge"
+
+    def __init__(self, name: str, documentation: str, label_names: Iterable[str] = (),
+                 function: Optional[Callable[[], float]] = None):
+        super().__init__(name, documentation, label_names)
+        self.function = function
+
+    def dec(self, *label_values: str, amount: float = 1.0):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0.0) - amount
+
+    def set(self, value: float, *label_values: str):
+        with self._lock:
+            self._values[label_values] = value
+
+    def samples(self) -> List[str]:
+        if self.function is not None:
+            return [f"{self.name} {self.function()}"]
+        return super().samples()
+
+
+class Histogram:
+    """Bucketed distribution of observed values, optionally labelled
+
+    Observations only bump one bucket slot (under the histogram's lock);
+    cumulative bucket counts are derived when the registry is scraped.
+    """
+
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, label_names: Iterable[str] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        # label values -> [per-bucket counts..., +Inf count, sum]
+        self._series: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values: str):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            # Copies, so a scrape sees each series' buckets, sum and count from the same moment
+            snapshot = [(labels, list(series)) for labels, series in self._series.items()]
+        lines = []
+        for labels, series in snapshot:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound!r}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, labels, le)} {cumulative}")
+            suffix = _format_labels(self.label_names, labels)
+            lines.append(f"{self.name}_sum{suffix} {series[-1]}")
+            lines.append(f"{self.name}_count{suffix} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """Collection of metrics rendered in the Prometheus text exposition format
+
+    Values are per process: with several gunicorn workers each worker exposes
+    its own series, so scrape each worker or aggregate with a `worker` label.
+    """
+
+    CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+    def __init__(self):
+        self.enabled = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, documentation: str, label_names: Iterable[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, label_names))
+
+    def gauge(self, name: str, documentation: str, label_names: Iterable[str] = (),
+              function: Optional[Callable[[], float]] = None) -> Gauge:
+        return self.register(Gauge(name, documentation, label_names, function))
+
+    def histogram(self, name: str, documentation: str, label_names: Iterable[str] = (),
+                  buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, label_names, buckets))
+
+    def render(self) -> str:
+        """Render every registered metric for a Prometheus scrape"""
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type_name}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+# Global instance
+metrics = MetricsRegistry()
+
+http_request_duration = metrics.histogram(
+    "http_request_duration_seconds", "HTTP request latency by route", ("method", "route", "status")
+)
+http_requests_in_progress = metrics.gauge(
+    "http_requests_in_progress", "HTTP requests currently being served", ("method",)
+)
+db_statement_duration = metrics.histogram(
+    "db_statement_duration_seconds", "SQL statement execution time by operation", ("operation",)
+)
+db_pool_checkout_wait = metrics.histogram(
+    "db_pool_checkout_wait_seconds", "Time spent waiting for a pooled database connection"
+)
+webhook_events = metrics.counter(
+    "whop_webhook_events_total", "Whop webhook events received by type", ("type",)
+)
+invoice_render_duration = metrics.histogram(
+    "invoice_pdf_render_seconds", "Invoice PDF render time"
+)
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording per-route latency and in-flight requests
+
+    Routes are labelled by their path template (``/api/transactions/{transaction_id}``)
+    so label cardinality stays bounded; unmatched paths share one series.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status_holder = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status_holder[0] = message["status"]
+            await send(message)
+
+        http_requests_in_progress.inc(method)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            http_request_duration.observe(
+                time.perf_counter() - start,
+                method,
+                getattr(route, "path", "unmatched"),
+                str(status_holder[0])
+            )
+            http_requests_in_progress.dec(method)
+
+
+def instrument_engine(engine):
+    """Attach statement timing, pool gauges and checkout wait timing to an engine
+
+    Everything goes through the engine rather than its current pool, so it
+    keeps working after ``engine.dispose()`` replaces the pool.
+    """
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("metrics_query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["metrics_query_start"].pop()
+        operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "UNKNOWN"
+        db_statement_duration.observe(elapsed, operation)
+
+    # Pool gauges read the engine's pool at scrape time; NullPool/StaticPool lack some counters
+    metrics.gauge("db_pool_size", "Configured connection pool size",
+                  function=lambda: getattr(engine.pool, "size", lambda: 0)())
+    metrics.gauge("db_pool_checked_out", "Connections currently checked out of the pool",
+                  function=lambda: getattr(engine.pool, "checkedout", lambda: 0)())
+    metrics.gauge("db_pool_overflow", "Connections open beyond the pool size",
+                  function=lambda: max(getattr(engine.pool, "overflow", lambda: 0)(), 0))
+
+    # The pool has no event before a checkout, so the request is stamped on the way in (checkouts
+    # are synchronous, hence per thread) and the pool's checkout event, which the engine hands on
+    # to every pool it recreates, records the wait
+    pending = threading.local()
+    raw_connection = engine.raw_connection
+
+    def stamped_raw_connection():
+        pending.start = time.perf_counter()
+        try:
+            return raw_connection()
+        finally:
+            start, pending.start = getattr(pending, "start", None), None
+            if start is not None:
+                # The checkout failed (e.g. timed out waiting), which is a wait worth recording too
+                db_pool_checkout_wait.observe(time.perf_counter() - start)
+
+    engine.raw_connection = stamped_raw_connection
+
+    @event.listens_for(engine, "checkout")
+    def _checkout(dbapi_connection, connection_record, connection_proxy):
+        start, pending.start = getattr(pending, "start", None), None
+        if start is not None:
+            db_pool_checkout_wait.observe(time.perf_counter() - start)
@@ -0,0 +1,140 @@
+import os
+import asyncio
+from typing import Any, Callable, Dict, Iterable, Optional, Set, Tuple
+import logging
+
+from starlette.concurrency import run_in_threadpool
+
+from .cache import cache
+
+logger = logging.getLogger(__name__)
+
+
+class ChangeNotifier:
+    """Wakes requests waiting for a cached record to change
+
+    Waiters subscribe to a (namespace, key) of the cache layer and get an
+    asyncio future. Every invalidation the cache applies resolves the futures
+    of its key: invalidations committed in this worker (webhooks, checkout
+    creation, bulk operations, reconciliation) fire right after the commit,
+    those of other workers when the invalidation bus is next polled. While
+    anyone waits, one task per event loop polls the bus every
+    CACHE_INVALIDATION_POLL_INTERVAL, so a waiting client costs a future and a
+    dict entry, never a query of its own.
+
+    Without a bus (CACHE_BACKEND=redis, or the cache disabled) that task asks
+    each namespace's probe instead: one query for the current version of
+    every key anyone waits on, every PAYMENT_WAIT_POLL_INTERVAL. Waiters
+    report the version they read with ``seen()``, and a key whose version
+    differs from it is notified as if it had been invalidated.
+    """
+
+    def __init__(self):
+        # Load configuration from environment variables
+        self.wait_timeout = float(os.getenv("PAYMENT_WAIT_TIMEOUT", "30"))
+        self.stream_timeout = float(os.getenv("PAYMENT_EVENTS_TIMEOUT", "300"))
+        self.heartbeat_interval = float(os.getenv("PAYMENT_EVENTS_HEARTBEAT", "15"))
+        self.poll_interval = float(os.getenv("PAYMENT_WAIT_POLL_INTERVAL", "1.0"))
+        self._waiters: Dict[Tuple[str, str], Set[asyncio.Future]] = {}
+        # namespace -> function returning {key: version} for the keys it is given
+        self._probes: Dict[str, Callable[[Iterable[str]], Dict[str, Any]]] = {}
+        # Version of each waited-on key as last read by a waiter
+        self._seen: Dict[Tuple[str, str], Any] = {}
+        self._poller: Optional[asyncio.Task] = None
+        self._poller_loop = None
+
+    @property
+    def waiting(self) -> int:
+        return sum(len(futures) for futures in self._waiters.values())
+
+    def subscribe(self, namespace: str, key) -> asyncio.Future:
+        """Future resolved by the next invalidation of ``key``; subscribe before reading the record"""
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault((namespace, str(key)), set()).add(future)
+        self._ensure_poller()
+        return future
+
+    def unsubscribe(self, namespace: str, key, future: asyncio.Future):
+        futures = self._waiters.get((namespace, str(key)))
+        if futures is None:
+            return
+        futures.discard(future)
+        if not futures:
+            del self._waiters[(namespace, str(key))]
+            self._seen.pop((namespace, str(key)), None)
+
+    def register_probe(self, namespace: str, probe: Callable[[Iterable[str]], Dict[str, Any]]):
+        """Use ``probe`` to detect writes to ``namespace`` by other workers when there is no bus"""
+        self._probes[namespace] = probe
+
+    def seen(self, namespace: str, key, version: Any):
+        """Record the version a waiter just read; the probe notifies once it differs"""
+        self._seen[(namespace, str(key))] = version
+
+    @property
+    def bus_available(self) -> bool:
+        return cache.enabled and cache.bus is not None and cache.bus.engine is not None
+
+    async def wait(self, future: asyncio.Future, timeout: float) -> bool:
+        """True if the subscription fired within ``timeout`` seconds"""
+        try:
+            await asyncio.wait_for(asyncio.shield(future), max(timeout, 0))
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def notify(self, namespace: Optional[str], key: Optional[str]):
+        """Cache listener; may be called from any thread"""
+        if namespace is None:
+            # The cache was flushed: every waiter re-reads
+            futures = [future for waiting in list(self._waiters.values()) for future in list(waiting)]
+        else:
+            futures = list(self._waiters.get((namespace, key), ()))
+        for future in futures:
+            future.get_loop().call_soon_threadsafe(self._resolve, future)
+
+    @staticmethod
+    def _resolve(future: asyncio.Future):
+        if not future.done():
+            future.set_result(True)
+
+    def _ensure_poller(self):
+        if not self.bus_available and not self._probes:
+            return
+        loop = asyncio.get_running_loop()
+        if self._poller_loop is not loop or self._poller is None or self._poller.done():
+            self._poller_loop = loop
+            self._poller = loop.create_task(self._poll_while_waiting())
+
+    async def _poll_while_waiting(self):
+        while self._waiters:
+            if self.bus_available:
+                await asyncio.sleep(cache.bus.poll_interval)
+                poll = cache.sync
+            else:
+                await asyncio.sleep(self.poll_interval)
+                poll = self._probe_waiting
+            try:
+                await run_in_threadpool(poll)
+            except Exception as e:
+                logger.error(f"Invalidation poll for waiters failed: {str(e)}")
+
+    def _probe_waiting(self):
+        """Notify waited-on keys whose version no longer matches what their waiters read"""
+        keys: Dict[str, list] = {}
+        for namespace, key in list(self._waiters):
+            if namespace in self._probes and (namespace, key) in self._seen:
+                keys.setdefault(namespace, []).append(key)
+        for namespace, waited in keys.items():
+            versions = self._probes[namespace](waited)
+            for key in waited:
+                seen = self._seen.get((namespace, key))
+                if versions.get(key) != seen:
+                    self._seen[(namespace, key)] = versions.get(key)
+                    self.notify(namespace, key)
+
+
+# Global instance
+change_notifier = ChangeNotifier()
+
+cache.listeners.append(change_notifier.notify)
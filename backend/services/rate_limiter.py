@@ -0,0 +1,151 @@
+import os
+import time
+import math
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class InMemoryRateLimitBackend:
+    """Per-process sliding-window counters with LRU eviction
+
+    Each key costs one small list ``[window_index, previous_count, current_count]``.
+    Keys idle for more than a window carry no information and are evicted first;
+    ``max_keys`` bounds memory when many distinct clients hit the endpoint.
+    """
+
+    def __init__(self, max_keys: int = 100_000):
+        self.max_keys = max_keys
+        self._counters: "OrderedDict[str, list]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def hit(self, key: str, window: float, now: float) -> Tuple[int, int]:
+        """Count one hit and return (previous_window_count, current_window_count)"""
+        window_index = int(now // window)
+        with self._lock:
+            counter = self._counters.get(key)
+            if counter is None:
+                counter = [window_index, 0, 0]
+                self._counters[key] = counter
+            else:
+                self._counters.move_to_end(key)
+                if counter[0] != window_index:
+                    # Roll forward: the old current window becomes "previous" only if adjacent
+                    counter[1] = counter[2] if counter[0] == window_index - 1 else 0
+                    counter[2] = 0
+                    counter[0] = window_index
+            counter[2] += 1
+            result = (counter[1], counter[2])
+            self._evict(window_index)
+        return result
+
+    def _evict(self, window_index: int):
+        """Drop stale keys from the LRU end, then enforce the size bound"""
+        while self._counters:
+            oldest_key, oldest = next(iter(self._counters.items()))
+            if oldest[0] < window_index - 1 or len(self._counters) > self.max_keys:
+                del self._counters[oldest_key]
+            else:
+                break
+
+    def __len__(self) -> int:
+        return len(self._counters)
+
+
+class RedisRateLimitBackend:
+    """Sliding-window counters shared by every worker through Redis
+
+    Uses one INCR per hit on a key scoped to the current window, so all
+    gunicorn/uvicorn workers (and hosts) enforce a single budget.
+    """
+
+    def __init__(self, url: str, prefix: str = "ratelimit"):
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError("RATE_LIMIT_BACKEND=redis requires the 'redis' package") from e
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def hit(self, key: str, window: float, now: float) -> Tuple[int, int]:
+        """Count one hit and return (previous_window_count, current_window_count)"""
+        window_index = int(now // window)
+        current_key = f"{self.prefix}:{key}:{window_index}"
+        previous_key = f"{self.prefix}:{key}:{window_index - 1}"
+
+        pipe = self.client.pipeline()
+        pipe.incr(current_key)
+        pipe.expire(current_key, int(math.ceil(window * 2)))
+        pipe.get(previous_key)
+        current, _, previous = pipe.execute()
+        return int(previous or 0), int(current)
+
+
+class SlidingWindowRateLimiter:
+    """Sliding-window rate limiter over a pluggable counter backend
+
+    The window is approximated from two fixed buckets: the previous bucket's
+    count is weighted by how much of it still overlaps the sliding window.
+    """
+
+    def __init__(self, backend, limit: int, window: float):
+        self.backend = backend
+        self.limit = limit
+        self.window = window
+
+    def hit(self, key: str, now: Optional[float] = None) -> float:
+        """Record a hit for ``key``; return 0 if allowed, else seconds until retry"""
+        now = time.time() if now is None else now
+        previous, current = self.backend.hit(key, self.window, now)
+
+        elapsed = (now % self.window) / self.window
+        estimated = previous * (1 - elapsed) + current
+        if estimated <= self.limit:
+            return 0.0
+        return self.window - (now % self.window)
+
+
+class CheckoutRateLimiter:
+    """Throttles checkout creation per client IP and per browser fingerprint"""
+
+    def __init__(self):
+        # Load configuration from environment variables
+        self.enabled = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+        window = float(os.getenv("CHECKOUT_RATE_LIMIT_WINDOW", "60"))
+        ip_limit = int(os.getenv("CHECKOUT_RATE_LIMIT_PER_IP", "30"))
+        fingerprint_limit = int(os.getenv("CHECKOUT_RATE_LIMIT_PER_USER", "10"))
+
+        backend = self._create_backend(os.getenv("RATE_LIMIT_BACKEND", "memory"))
+        self.ip_limiter = SlidingWindowRateLimiter(backend, ip_limit, window)
+        self.fingerprint_limiter = SlidingWindowRateLimiter(backend, fingerprint_limit, window)
+
+    @staticmethod
+    def _create_backend(name: str):
+        """Build the counter backend named by RATE_LIMIT_BACKEND"""
+        if name == "redis":
+            return RedisRateLimitBackend(os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+        if name != "memory":
+            logger.warning(f"Unknown RATE_LIMIT_BACKEND '{name}' - using in-memory counters")
+        return InMemoryRateLimitBackend(int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000")))
+
+    def check(self, user_info: Dict[str, Any]) -> float:
+        """Return 0 if the client may create a checkout, else seconds until retry"""
+        if not self.enabled:
+            return 0.0
+        try:
+            now = time.time()
+            return max(
+                self.ip_limiter.hit(f"checkout:ip:{user_info['ip_address']}", now),
+                self.fingerprint_limiter.hit(f"checkout:fp:{user_info['user_fingerprint']}", now)
+            )
+        except Exception as e:
+            # Fail open: a broken shared backend must not take checkout down
+            logger.error(f"Rate limit check failed: {str(e)}")
+            return 0.0
+
+
+# Global instance
+checkout_rate_limiter = CheckoutRateLimiter()
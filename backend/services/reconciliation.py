@@ -0,0 +1,376 @@
+import os
+import json
+import asyncio
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterable, List, Optional
+import logging
+
+from sqlalchemy import update
+from starlette.concurrency import run_in_threadpool
+
+from ..models import Transaction, ReconciliationState
+from .whop_service import whop_service, WhopApiError
+
+logger = logging.getLogger(__name__)
+
+# Whop payment status -> local transaction status
+STATUS_MAP = {"paid": "completed", "succeeded": "completed", "completed": "completed", "failed": "failed"}
+
+# Local statuses a Whop outcome may correct; completed rows are never downgraded
+CORRECTABLE_FROM = {"completed": ("pending", "expired", "failed"), "failed": ("pending", "expired")}
+
+# Keeps IN (...) lists well under SQLite's bound-parameter limit
+LOOKUP_CHUNK = 500
+
+
+class ReconciliationError(Exception):
+    """Raised when a reconciliation run cannot start or finish"""
+
+
+def _payment_created_at(payment: Dict[str, Any]) -> Optional[float]:
+    """Whop timestamps arrive as Unix seconds or ISO 8601 strings"""
+    value = payment.get("created_at")
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+def _chunks(values: List[Any]) -> Iterable[List[Any]]:
+    for start in range(0, len(values), LOOKUP_CHUNK):
+        yield values[start:start + LOOKUP_CHUNK]
+
+
+class ReconciliationReport:
+    """Counts and (capped) details of one run"""
+
+    def __init__(self, dry_run: bool, incremental: bool, limit: int):
+        self.limit = limit
+        self.summary: Dict[str, Any] = {
+            "dry_run": dry_run,
+            "incremental": incremental,
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "pages": 0,
+            "payments_seen": 0,
+            "matched": 0,
+            "in_sync": 0,
+            "corrected": 0,
+            "conflicts": 0,
+            "unmatched": 0,
+            "unmapped_status": 0,
+        }
+        self.corrections: List[Dict[str, Any]] = []
+        self.conflicts: List[Dict[str, Any]] = []
+        self.unmatched: List[str] = []
+
+    def add(self, bucket: List, item: Any):
+        if len(bucket) < self.limit:
+            bucket.append(item)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            **self.summary,
+            "corrections": self.corrections,
+            "conflicting_payments": self.conflicts,
+            "unmatched_payments": self.unmatched,
+        }
+
+
+class ReconciliationEngine:
+    """Brings local transactions in line with Whop's payments
+
+    Pages of the payments API (newest first) are fetched ``concurrency`` at a
+    time. Each batch of pages is matched to transactions with IN lookups on
+    the indexed whop_payment_id, checkout_reference and whop_session_id
+    columns, and the resulting corrections are written with one guarded
+    executemany UPDATE per target status. Incremental runs stop paging once they reach payments
+    older than the stored high-water mark (minus an overlap for late-arriving
+    payments); the mark only advances after a run that finished cleanly.
+    """
+
+    STATE_NAME = "whop_payments"
+
+    def __init__(self):
+        # Load configuration from environment variables
+        self.concurrency = int(os.getenv("RECONCILE_CONCURRENCY", "4"))
+        self.page_size = int(os.getenv("RECONCILE_PAGE_SIZE", "100"))
+        self.overlap = float(os.getenv("RECONCILE_OVERLAP_SECONDS", "3600"))
+        self.report_limit = int(os.getenv("RECONCILE_REPORT_LIMIT", "500"))
+        self._running = False
+
+    async def run(
+        self,
+        session_factory: Callable,
+        dry_run: bool = False,
+        full: bool = False,
+        invalidate: Optional[Callable] = None
+    ) -> Dict[str, Any]:
+        """Reconcile and return the diff report"""
+        if self._running:
+            raise ReconciliationError("A reconciliation run is already in progress")
+        if not whop_service.api.configured:
+            raise ReconciliationError("WHOP_API_KEY not set - cannot read Whop payments")
+
+        self._running = True
+        try:
+            state = await run_in_threadpool(self._load_state, session_factory)
+            high_water_mark = None if full else state.get("high_water_mark")
+            cutoff = high_water_mark - self.overlap if high_water_mark is not None else None
+            report = ReconciliationReport(dry_run, cutoff is not None, self.report_limit)
+            newest = high_water_mark
+
+            async for payments in self._payment_batches(report, cutoff):
+                created = [c for c in (_payment_created_at(p) for p in payments) if c is not None]
+                if created:
+                    newest = max(created + ([newest] if newest is not None else []))
+                await run_in_threadpool(self._apply_batch, session_factory, payments, report, dry_run, invalidate)
+
+            report.summary["finished_at"] = datetime.now(timezone.utc).isoformat()
+            report.summary["high_water_mark"] = newest
+            if not dry_run:
+                await run_in_threadpool(self._save_state, session_factory, newest, report.summary)
+            logger.info(
+                f"Reconciliation {'dry run ' if dry_run else ''}finished: {report.summary['payments_seen']} payments, "
+                f"{report.summary['corrected']} corrected, {report.summary['conflicts']} conflicts, "
+                f"{report.summary['unmatched']} unmatched"
+            )
+            return report.as_dict()
+        except WhopApiError as e:
+            raise ReconciliationError(f"Whop API unavailable: {str(e)}") from e
+        finally:
+            self._running = False
+
+    async def _payment_batches(self, report: ReconciliationReport, cutoff: Optional[float]):
+        """Yield the payments of each window of concurrently fetched pages
+
+        The next window is already being fetched while the caller writes the
+        current one to the database.
+        """
+        first = await whop_service.api.list_payments(1, self.page_size)
+        total_pages = int((first.get("pagination") or {}).get("total_pages") or 1)
+        pages = [first]
+        next_page = 2
+        prefetch = None
+
+        try:
+            while True:
+                payments = [payment for page in pages for payment in (page.get("data") or [])]
+                report.summary["pages"] += len(pages)
+
+                more = bool(payments) and next_page <= total_pages
+                if more and cutoff is not None:
+                    created = [c for c in (_payment_created_at(p) for p in payments) if c is not None]
+                    more = not (created and min(created) < cutoff)
+                if more:
+                    window = range(next_page, min(next_page + self.concurrency, total_pages + 1))
+                    prefetch = asyncio.ensure_future(asyncio.gather(
+                        *(whop_service.api.list_payments(page, self.page_size) for page in window)
+                    ))
+                    next_page = window.stop
+
+                if payments:
+                    yield payments
+                if not more:
+                    return
+                pages = await prefetch
+                prefetch = None
+        finally:
+            if prefetch is not None and not prefetch.done():
+                prefetch.cancel()
+
+    def _apply_batch(
+        self,
+        session_factory: Callable,
+        payments: List[Dict[str, Any]],
+        report: ReconciliationReport,
+        dry_run: bool,
+        invalidate: Optional[Callable]
+    ):
+        """Match one batch of payments and write its corrections in a single UPDATE"""
+        # Successful payments first, so a later failed retry can't shadow them
+        payments = sorted(payments, key=lambda p: STATUS_MAP.get(str(p.get("status")).lower()) != "completed")
+        keys = []
+        for payment in payments:
+            keys.append((
+                str(payment.get("id") or ""),
+                whop_service.extract_checkout_reference_from_webhook({"data": payment}),
+                str(payment.get("checkout_id") or payment.get("checkout_session_id") or ""),
+            ))
+
+        db = session_factory()
+        try:
+            columns = (
+                Transaction.id, Transaction.status, Transaction.user_id, Transaction.whop_session_id,
+                Transaction.whop_payment_id, Transaction.checkout_reference,
+            )
+            by_payment, by_reference, by_session = {}, {}, {}
+            for index, column, target in (
+                (0, Transaction.whop_payment_id, by_payment),
+                (1, Transaction.checkout_reference, by_reference),
+                (2, Transaction.whop_session_id, by_session),
+            ):
+                values = sorted({key[index] for key in keys if key[index]})
+                for chunk in _chunks(values):
+                    for row in db.query(*columns).filter(column.in_(chunk)):
+                        target[getattr(row, column.key)] = row
+
+            now = datetime.now(timezone.utc).replace(tzinfo=None)
+            current: Dict[int, Dict[str, Any]] = {}
+            updates: Dict[int, Dict[str, Any]] = {}
+            # Reported once the write shows which corrections the rows still accepted
+            corrections: Dict[int, List[Dict[str, Any]]] = {}
+            for payment, (payment_id, reference, session_id) in zip(payments, keys):
+                report.summary["payments_seen"] += 1
+                row = by_payment.get(payment_id) or by_reference.get(reference) or by_session.get(session_id)
+                if row is None:
+                    report.summary["unmatched"] += 1
+                    report.add(report.unmatched, payment_id)
+                    continue
+                report.summary["matched"] += 1
+
+                # View of the row including corrections already made in this batch
+                local = current.setdefault(row.id, {"status": row.status, "whop_payment_id": row.whop_payment_id})
+                whop_status = str(payment.get("status") or "").lower()
+                target_status = STATUS_MAP.get(whop_status)
+                changes: Dict[str, Any] = {}
+
+                if target_status is None:
+                    report.summary["unmapped_status"] += 1
+                elif target_status != local["status"]:
+                    if local["status"] in CORRECTABLE_FROM[target_status]:
+                        changes["status"] = target_status
+                        changes["webhook_received"] = True
+                        if target_status == "completed":
+                            changes["completed_at"] = now
+                            changes["error_message"] = None
+                        else:
+                            changes["error_message"] = payment.get("failure_reason") or "Payment failed (reconciled)"
+                    else:
+                        report.summary["conflicts"] += 1
+                        report.add(report.conflicts, {
+                            "transaction_id": row.id, "payment_id": payment_id,
+                            "local_status": local["status"], "whop_status": whop_status,
+                        })
+
+                if payment_id and (local["whop_payment_id"] is None or "status" in changes):
+                    if local["whop_payment_id"] != payment_id:
+                        changes["whop_payment_id"] = payment_id
+
+                if not changes:
+                    if target_status == local["status"]:
+                        report.summary["in_sync"] += 1
+                    continue
+
+                corrections.setdefault(row.id, []).append({
+                    "transaction_id": row.id, "payment_id": payment_id, "whop_status": whop_status,
+                    "from": local["status"], "to": changes.get("status", local["status"]),
+                    "fields": sorted(changes),
+                })
+                local.update({k: v for k, v in changes.items() if k in local})
+                updates.setdefault(row.id, {"id": row.id, "updated_at": now}).update(changes)
+                if invalidate is not None and not dry_run:
+                    invalidate(db, row)
+
+            skipped: Dict[int, Optional[str]] = {}
+            if updates and not dry_run:
+                skipped = self._write(db, updates)
+                db.commit()
+
+            for transaction_id, items in corrections.items():
+                for item in items:
+                    whop_status = item.pop("whop_status")
+                    if transaction_id in skipped:
+                        # Changed by a webhook or admin since it was read; left as that write made it
+                        report.summary["conflicts"] += 1
+                        report.add(report.conflicts, {
+                            "transaction_id": transaction_id, "payment_id": item["payment_id"],
+                            "local_status": skipped[transaction_id], "whop_status": whop_status,
+                        })
+                    else:
+                        report.summary["corrected"] += 1
+                        report.add(report.corrections, item)
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    @staticmethod
+    def _write(db, updates: Dict[int, Dict[str, Any]]) -> Dict[int, Optional[str]]:
+        """Apply a batch's corrections; returns the rows that no longer accepted them, with their status
+
+        The status and payment ID were checked against values read before the
+        UPDATE, so each UPDATE repeats that check in its WHERE clause (as
+        bulk_operations does) and a row a webhook completed in between is
+        never downgraded. Rows it skipped are found by reading them back
+        within the same transaction.
+        """
+        groups: Dict[Optional[str], List[Dict[str, Any]]] = {}
+        for values in updates.values():
+            groups.setdefault(values.get("status"), []).append(values)
+        for target_status, group in groups.items():
+            if target_status is None:
+                guard = Transaction.whop_payment_id.is_(None)
+            else:
+                guard = Transaction.status.in_(CORRECTABLE_FROM[target_status])
+            # ORM bulk UPDATE by primary key: one executemany per distinct set of columns. The session
+            # only ever loaded plain rows, so there are no ORM instances to synchronize
+            db.execute(update(Transaction).where(guard).execution_options(synchronize_session=None), group)
+
+        skipped = {}
+        for chunk in _chunks(sorted(updates)):
+            rows = db.query(Transaction.id, Transaction.status, Transaction.whop_payment_id).filter(
+                Transaction.id.in_(chunk)
+            )
+            for row in rows:
+                values = updates[row.id]
+                if row.status != values.get("status", row.status) or (
+                    row.whop_payment_id != values.get("whop_payment_id", row.whop_payment_id)
+                ):
+                    skipped[row.id] = row.status
+        return skipped
+
+    def _load_state(self, session_factory: Callable) -> Dict[str, Any]:
+        db = session_factory()
+        try:
+            state = db.get(ReconciliationState, self.STATE_NAME)
+            if state is None:
+                return {}
+            return {
+                "high_water_mark": state.high_water_mark,
+                "last_run_at": state.last_run_at,
+                "last_report": json.loads(state.last_report or "null"),
+            }
+        finally:
+            db.close()
+
+    def _save_state(self, session_factory: Callable, high_water_mark: Optional[float], summary: Dict[str, Any]):
+        db = session_factory()
+        try:
+            state = db.get(ReconciliationState, self.STATE_NAME) or ReconciliationState(name=self.STATE_NAME)
+            state.high_water_mark = high_water_mark
+            state.last_run_at = datetime.now(timezone.utc).replace(tzinfo=None)
+            state.last_report = json.dumps(summary, default=str)
+            db.add(state)
+            db.commit()
+        finally:
+            db.close()
+
+    def status(self, session_factory: Callable) -> Dict[str, Any]:
+        """High-water mark and summary of the last completed run"""
+        return {"running": self._running, **self._load_state(session_factory)}
+
+
+# Global instance
+reconciliation_engine = ReconciliationEngine()
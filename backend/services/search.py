@@ -0,0 +1,279 @@
+import os
+import time
+import threading
+from typing import Any, Dict, List, Optional
+import logging
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+# Columns support staff search by; order matches SEARCH_WEIGHTS
+SEARCH_COLUMNS = ("customer_email", "customer_name", "user_id", "whop_payment_id")
+
+# Column weights in the relevance score: identifiers and emails outrank a matching name
+SEARCH_WEIGHTS = (10.0, 5.0, 10.0, 10.0)
+
+# Trigram indexes can't serve shorter terms
+MIN_TERM_LENGTH = 3
+
+# matches: candidates found (at most max_candidates), counted while they are ranked anyway
+RESULT_COLUMNS = (
+    "t.id, t.customer_email, t.customer_name, t.user_id, t.whop_payment_id, t.status, t.amount, t.created_at, "
+    "count(*) OVER () AS matches"
+)
+
+# SQLite: external-content FTS5 table with the trigram tokenizer (substring matches),
+# kept in sync with transactions by triggers so every write path - ORM, bulk UPDATEs,
+# seed loads - updates it. Status-only updates don't touch the searched columns and skip it.
+SQLITE_FTS_TABLE = "transactions_fts"
+
+SQLITE_SCHEMA = [
+    f"CREATE VIRTUAL TABLE {SQLITE_FTS_TABLE} USING fts5("
+    f"{', '.join(SEARCH_COLUMNS)}, content='transactions', content_rowid='id', tokenize='trigram')",
+    f"CREATE TRIGGER transactions_fts_insert AFTER INSERT ON transactions BEGIN "
+    f"INSERT INTO {SQLITE_FTS_TABLE} (rowid, {', '.join(SEARCH_COLUMNS)}) "
+    f"VALUES (new.id, {', '.join('new.' + c for c in SEARCH_COLUMNS)}); END",
+    f"CREATE TRIGGER transactions_fts_delete AFTER DELETE ON transactions BEGIN "
+    f"INSERT INTO {SQLITE_FTS_TABLE} ({SQLITE_FTS_TABLE}, rowid, {', '.join(SEARCH_COLUMNS)}) "
+    f"VALUES ('delete', old.id, {', '.join('old.' + c for c in SEARCH_COLUMNS)}); END",
+    f"CREATE TRIGGER transactions_fts_update AFTER UPDATE OF {', '.join(SEARCH_COLUMNS)} ON transactions BEGIN "
+    f"INSERT INTO {SQLITE_FTS_TABLE} ({SQLITE_FTS_TABLE}, rowid, {', '.join(SEARCH_COLUMNS)}) "
+    f"VALUES ('delete', old.id, {', '.join('old.' + c for c in SEARCH_COLUMNS)}); "
+    f"INSERT INTO {SQLITE_FTS_TABLE} (rowid, {', '.join(SEARCH_COLUMNS)}) "
+    f"VALUES (new.id, {', '.join('new.' + c for c in SEARCH_COLUMNS)}); END",
+    f"INSERT INTO {SQLITE_FTS_TABLE} ({SQLITE_FTS_TABLE}) VALUES ('rebuild')",
+]
+
+# PostgreSQL: one GIN trigram index over the concatenated columns; the index itself stays in sync.
+# Built CONCURRENTLY (outside a transaction) so writes carry on meanwhile; a build that died
+# half-way leaves an invalid index behind, which is dropped first.
+POSTGRES_DOCUMENT = " || ' ' || ".join(f"coalesce({column}, '')" for column in SEARCH_COLUMNS)
+
+POSTGRES_INDEX = "ix_transactions_search_trgm"
+
+POSTGRES_SCHEMA = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    f"DROP INDEX CONCURRENTLY IF EXISTS {POSTGRES_INDEX}",
+    f"CREATE INDEX CONCURRENTLY {POSTGRES_INDEX} ON transactions USING gin (({POSTGRES_DOCUMENT}) gin_trgm_ops)",
+]
+
+
+class SearchError(Exception):
+    """Raised for search queries that can't be served from the index"""
+
+
+def _like_pattern(term: str) -> str:
+    """%term% with LIKE wildcards in the term itself escaped (use with ESCAPE '\\')"""
+    return "%" + term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+
+def _match_score(term_count: int) -> str:
+    """Relevance of a candidate row: per term and column, exact > prefix > substring, times the column weight
+
+    Cheap enough to compute for every candidate, unlike bm25, whose document
+    frequencies cost a pass over the full match list of common terms.
+    """
+    parts = []
+    for index in range(term_count):
+        for column, weight in zip(SEARCH_COLUMNS, SEARCH_WEIGHTS):
+            value = f"lower(coalesce(t.{column}, ''))"
+            parts.append(
+                f"{weight} * (CASE WHEN {value} = :term{index} THEN 3 WHEN instr({value}, :term{index}) = 1 THEN 2 "
+                f"WHEN instr({value}, :term{index}) > 0 THEN 1 ELSE 0 END)"
+            )
+    return " + ".join(parts)
+
+
+class TransactionSearch:
+    """Ranked substring search over customer email, name, user ID and Whop payment ID
+
+    Matches are taken newest first from the trigram index, at most
+    ``max_candidates`` of them, and only those are ranked (exact, prefix and
+    substring matches by column on SQLite, trigram similarity on PostgreSQL). That keeps latency bounded when a
+    term matches most of a multi-million-row table (``example.com``); the
+    response says so with ``truncated`` and a more specific term narrows it.
+    """
+
+    def __init__(self):
+        # Load configuration from environment variables
+        self.max_candidates = int(os.getenv("SEARCH_MAX_CANDIDATES", "5000"))
+        self.backend = "like"
+        # Engine whose FTS5 table is still being built (here or by another worker); checked again on each search
+        self._pending_engine = None
+        self._builder: Optional[threading.Thread] = None
+
+    @staticmethod
+    def _sqlite_index_exists(connection) -> bool:
+        return connection.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+            {"name": SQLITE_FTS_TABLE}
+        ).first() is not None
+
+    @staticmethod
+    def _sqlite_fts5_available(engine) -> bool:
+        """Whether this SQLite has FTS5 and its trigram tokenizer (a temp table takes no lock on the database)"""
+        try:
+            with engine.connect() as connection:
+                connection.execute(text("CREATE VIRTUAL TABLE temp.fts5_probe USING fts5(value, tokenize='trigram')"))
+                connection.execute(text("DROP TABLE temp.fts5_probe"))
+            return True
+        except Exception:
+            return False
+
+    @staticmethod
+    def _postgres_index_valid(connection) -> bool:
+        row = connection.execute(
+            text("SELECT i.indisvalid FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid WHERE c.relname = :name"),
+            {"name": POSTGRES_INDEX}
+        ).first()
+        return bool(row and row[0])
+
+    def install(self, engine):
+        """Use this database's search index, building a missing one in a background thread
+
+        Only the lookup runs at startup: building the index on a large table
+        takes a while (and on SQLite holds the write lock throughout), so it
+        never delays boot. ``python migrate_db.py`` builds it ahead of a deploy.
+        Searches use LIKE scans until the index is ready.
+        """
+        dialect = engine.dialect.name
+        try:
+            with engine.connect() as connection:
+                if dialect == "sqlite" and self._sqlite_index_exists(connection):
+                    self.backend = "fts5"
+                    return
+                if dialect == "postgresql" and self._postgres_index_valid(connection):
+                    self.backend = "trigram"
+                    return
+        except Exception as e:
+            logger.warning(f"Search index lookup failed, falling back to unindexed LIKE scans: {str(e)}")
+            return
+        if dialect == "sqlite":
+            if not self._sqlite_fts5_available(engine):
+                logger.warning("SQLite lacks FTS5 with the trigram tokenizer, falling back to unindexed LIKE scans")
+                return
+            # Several workers starting on a fresh database all land here; whichever build commits first
+            # is picked up by every worker's next search
+            self._pending_engine = engine
+        elif dialect != "postgresql":
+            return
+        logger.info("Search index missing; building it in the background, using LIKE scans until it is ready")
+        self._builder = threading.Thread(target=self._build, args=(engine,), name="search-index", daemon=True)
+        self._builder.start()
+
+    def _build(self, engine):
+        started = time.perf_counter()
+        try:
+            if engine.dialect.name == "sqlite":
+                with engine.begin() as connection:
+                    if not self._sqlite_index_exists(connection):
+                        for statement in SQLITE_SCHEMA:
+                            connection.execute(text(statement))
+                        logger.info(f"Built {SQLITE_FTS_TABLE} in {time.perf_counter() - started:.1f}s")
+                self._index_ready()
+            else:
+                with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+                    for statement in POSTGRES_SCHEMA:
+                        connection.execute(text(statement))
+                logger.info(f"Built {POSTGRES_INDEX} in {time.perf_counter() - started:.1f}s")
+                self.backend = "trigram"
+        except Exception as e:
+            # On SQLite usually another worker's build ("already exists", "database is locked"),
+            # which the next search picks up; otherwise e.g. no privilege to create pg_trgm
+            logger.info(f"Search index not built here, using LIKE scans until it exists: {str(e)}")
+
+    def _index_ready(self) -> bool:
+        """Switch to the FTS5 table once the worker building it has committed"""
+        try:
+            with self._pending_engine.connect() as connection:
+                ready = self._sqlite_index_exists(connection)
+        except Exception:
+            return False
+        if ready:
+            self.backend = "fts5"
+            self._pending_engine = None
+        return ready
+
+    @staticmethod
+    def terms(query: str) -> List[str]:
+        terms = [term for term in query.split() if term]
+        if not terms or any(len(term) < MIN_TERM_LENGTH for term in terms):
+            raise SearchError(f"Search terms must be at least {MIN_TERM_LENGTH} characters")
+        return terms
+
+    def search(self, db: Session, query: str, limit: int = 20, offset: int = 0) -> Dict[str, Any]:
+        terms = self.terms(query)
+        if self._pending_engine is not None:
+            self._index_ready()
+        params: Dict[str, Any] = {"candidates": self.max_candidates, "limit": limit + 1, "offset": offset}
+
+        if self.backend == "trigram":
+            conditions = []
+            for index, term in enumerate(terms):
+                params[f"pattern{index}"] = _like_pattern(term)
+                conditions.append(f"({POSTGRES_DOCUMENT}) ILIKE :pattern{index} ESCAPE '\\'")
+            params["query"] = " ".join(terms)
+            sql = (
+                f"SELECT {RESULT_COLUMNS}, c.score FROM ("
+                f"SELECT id, similarity({POSTGRES_DOCUMENT}, :query) AS score FROM transactions "
+                f"WHERE {' AND '.join(conditions)} ORDER BY id DESC LIMIT :candidates"
+                f") AS c JOIN transactions t ON t.id = c.id ORDER BY c.score DESC, t.id DESC LIMIT :limit OFFSET :offset"
+            )
+        else:
+            if self.backend == "fts5":
+                # Each term is a quoted phrase: a substring match under the trigram tokenizer
+                params["match"] = " AND ".join('"%s"' % term.replace('"', '""') for term in terms)
+                candidates = (
+                    f"SELECT rowid AS id FROM {SQLITE_FTS_TABLE} WHERE {SQLITE_FTS_TABLE} MATCH :match "
+                    f"ORDER BY rowid DESC LIMIT :candidates"
+                )
+            else:
+                conditions = []
+                for index, term in enumerate(terms):
+                    params[f"pattern{index}"] = _like_pattern(term.lower())
+                    conditions.append("(" + " OR ".join(
+                        f"lower(coalesce({column}, '')) LIKE :pattern{index} ESCAPE '\\'" for column in SEARCH_COLUMNS
+                    ) + ")")
+                candidates = f"SELECT id FROM transactions WHERE {' AND '.join(conditions)} ORDER BY id DESC LIMIT :candidates"
+            for index, term in enumerate(terms):
+                params[f"term{index}"] = term.lower()
+            sql = (
+                f"SELECT {RESULT_COLUMNS}, {_match_score(len(terms))} AS score FROM ({candidates}) AS c "
+                f"JOIN transactions t ON t.id = c.id ORDER BY score DESC, t.id DESC LIMIT :limit OFFSET :offset"
+            )
+
+        started = time.perf_counter()
+        rows = db.execute(text(sql), params).all()
+        elapsed_ms = (time.perf_counter() - started) * 1000
+
+        matches = rows[0].matches if rows else 0
+        return {
+            "query": query,
+            "backend": self.backend,
+            "results": [
+                {
+                    "id": row.id,
+                    "customer_email": row.customer_email,
+                    "customer_name": row.customer_name,
+                    "user_id": row.user_id,
+                    "whop_payment_id": row.whop_payment_id,
+                    "status": row.status,
+                    "amount": row.amount,
+                    "created_at": row.created_at,
+                    "score": round(float(row.score or 0), 4),
+                }
+                for row in rows[:limit]
+            ],
+            "limit": limit,
+            "offset": offset,
+            "has_more": len(rows) > limit,
+            "matches": matches,
+            "truncated": matches >= self.max_candidates,
+            "took_ms": round(elapsed_ms, 2),
+        }
+
+
+# Global instance
+transaction_search = TransactionSearch()
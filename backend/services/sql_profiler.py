@@ -0,0 +1,210 @@
+import os
+import json
+import time
+import random
+import threading
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+import logging
+
+from sqlalchemy import event
+from starlette.concurrency import run_in_threadpool
+
+logger = logging.getLogger(__name__)
+
+# Profile collecting statements for the request being served, if any
+_current_profile: ContextVar[Optional["SqlProfile"]] = ContextVar("sql_profile", default=None)
+
+# Statement kinds worth asking the planner about
+EXPLAINABLE = ("SELECT", "UPDATE", "DELETE", "WITH")
+
+
+class SqlProfile:
+    """Statements issued while serving one request"""
+
+    def __init__(self, method: str, path: str):
+        self.method = method
+        self.path = path
+        self.statements: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def record(self, statement: str, parameters: Any, duration: float):
+        with self._lock:
+            self.statements.append({"sql": statement, "params": parameters, "duration": duration})
+
+
+class SqlProfiler:
+    """Opt-in per-request SQL profiling with full-scan and N+1 detection
+
+    A request is profiled when SQL_PROFILER_ENABLED is set and it either sends
+    the X-SQL-Profile header or is picked by SQL_PROFILE_SAMPLE_RATE. Every
+    statement executed through the engine during the request is timed, the
+    distinct statements are run through EXPLAIN (QUERY PLAN), and the report is
+    returned in the X-SQL-Profile response header and optionally appended to a
+    JSON-lines log.
+    """
+
+    HEADER = "x-sql-profile"
+
+    def __init__(self):
+        # Load configuration from environment variables
+        self.enabled = os.getenv("SQL_PROFILER_ENABLED", "false").lower() == "true"
+        self.sample_rate = float(os.getenv("SQL_PROFILE_SAMPLE_RATE", "0"))
+        self.log_path = os.getenv("SQL_PROFILE_LOG")
+        self.repeat_threshold = int(os.getenv("SQL_PROFILE_REPEAT_THRESHOLD", "3"))
+        self.engine = None
+        self._log_lock = threading.Lock()
+
+    def instrument_engine(self, engine):
+        """Record statements for profiled requests; a no-op lookup otherwise"""
+        self.engine = engine
+
+        @event.listens_for(engine, "before_cursor_execute")
+        def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            if _current_profile.get() is not None:
+                conn.info.setdefault("profile_query_start", []).append(time.perf_counter())
+
+        @event.listens_for(engine, "after_cursor_execute")
+        def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            profile = _current_profile.get()
+            if profile is not None and conn.info.get("profile_query_start"):
+                duration = time.perf_counter() - conn.info["profile_query_start"].pop()
+                profile.record(statement, parameters, duration)
+
+    def should_profile(self, headers: Dict[bytes, bytes]) -> bool:
+        if not self.enabled:
+            return False
+        if headers.get(self.HEADER.encode()) not in (None, b"", b"0"):
+            return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def explain(self, statement: str, parameters: Any) -> List[str]:
+        """Return the query plan lines for a statement"""
+        sqlite = self.engine.dialect.name == "sqlite"
+        prefix = "EXPLAIN QUERY PLAN " if sqlite else "EXPLAIN "
+        connection = self.engine.raw_connection()
+        try:
+            cursor = connection.cursor()
+            cursor.execute(prefix + statement, parameters or ())
+            rows = cursor.fetchall()
+            # SQLite rows are (id, parent, notused, detail); other dialects return one text column
+            return [str(row[-1]) for row in rows]
+        finally:
+            connection.close()
+
+    @staticmethod
+    def scan_flags(statement: str, parameters: Any, plan: List[str]) -> List[str]:
+        """Flag plan steps and predicates that read every row"""
+        flags = []
+        for line in plan:
+            detail = line.strip()
+            if (detail.startswith("SCAN ") and "INDEX" not in detail and "PRIMARY KEY" not in detail) \
+                    or "Seq Scan" in detail:
+                flags.append(f"full table scan: {detail}")
+        # Column.contains() renders as LIKE '%' || ? || '%'; literal patterns arrive as parameters
+        params = parameters.values() if isinstance(parameters, dict) else (parameters or ())
+        normalized = " ".join(statement.upper().split())
+        if "LIKE '%'" in normalized or (
+            " LIKE " in normalized and any(isinstance(p, str) and p.startswith("%") for p in params)
+        ):
+            flags.append("leading-wildcard LIKE cannot use an index and is evaluated for every candidate row")
+        return flags
+
+    def analyze(self, profile: SqlProfile) -> Dict[str, Any]:
+        """Group statements, explain each distinct one and collect flags"""
+        groups: Dict[str, Dict[str, Any]] = {}
+        for recorded in profile.statements:
+            group = groups.setdefault(recorded["sql"], {
+                "sql": recorded["sql"],
+                "params": recorded["params"],
+                "count": 0,
+                "total_ms": 0.0,
+                "param_sets": set(),
+            })
+            group["count"] += 1
+            group["total_ms"] += recorded["duration"] * 1000
+            group["param_sets"].add(repr(recorded["params"]))
+
+        report_statements, flags = [], []
+        for group in groups.values():
+            statement_flags = []
+            if group["sql"].lstrip().upper().startswith(EXPLAINABLE):
+                try:
+                    group["plan"] = self.explain(group["sql"], group["params"])
+                except Exception as e:
+                    group["plan"] = [f"EXPLAIN failed: {str(e)}"]
+                statement_flags.extend(self.scan_flags(group["sql"], group["params"], group["plan"]))
+            if group["count"] >= self.repeat_threshold:
+                statement_flags.append(f"executed {group['count']} times in one request (possible N+1)")
+            if len(group.pop("param_sets")) < group["count"]:
+                statement_flags.append("identical statement and parameters executed more than once")
+
+            group["total_ms"] = round(group["total_ms"], 3)
+            group["params"] = repr(group["params"])[:200]
+            group["flags"] = statement_flags
+            report_statements.append(group)
+            flags.extend(f"{flag} [{group['sql'][:80]}]" for flag in statement_flags)
+
+        return {
+            "method": profile.method,
+            "path": profile.path,
+            "statement_count": len(profile.statements),
+            "total_ms": round(sum(s["duration"] for s in profile.statements) * 1000, 3),
+            "flags": flags,
+            "statements": report_statements,
+        }
+
+    def header_value(self, report: Dict[str, Any]) -> str:
+        """Compact summary that fits in a response header"""
+        return json.dumps({
+            "statements": report["statement_count"],
+            "distinct": len(report["statements"]),
+            "total_ms": report["total_ms"],
+            "flags": report["flags"][:5],
+        })
+
+    def write_log(self, report: Dict[str, Any]):
+        if not self.log_path:
+            return
+        line = json.dumps({"timestamp": time.time(), **report}, default=str)
+        with self._log_lock, open(self.log_path, "a", encoding="utf-8") as log_file:
+            log_file.write(line + "\n")
+
+
+# Global instance
+sql_profiler = SqlProfiler()
+
+
+class SqlProfilerMiddleware:
+    """ASGI middleware that profiles selected requests with ``sql_profiler``"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not sql_profiler.should_profile(dict(scope["headers"])):
+            await self.app(scope, receive, send)
+            return
+
+        profile = SqlProfile(scope["method"], scope["path"])
+        token = _current_profile.set(profile)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                try:
+                    report = await run_in_threadpool(sql_profiler.analyze, profile)
+                    message.setdefault("headers", [])
+                    message["headers"] = list(message["headers"]) + [
+                        (b"x-sql-profile", sql_profiler.header_value(report).encode("latin-1"))
+                    ]
+                    await run_in_threadpool(sql_profiler.write_log, report)
+                    for flag in report["flags"]:
+                        logger.warning(f"SQL profile {profile.method} {profile.path}: {flag}")
+                except Exception as e:
+                    logger.error(f"SQL profiling failed: {str(e)}")
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current_profile.reset(token)
@@ -0,0 +1,122 @@
+import os
+import json
+import stat
+from mimetypes import guess_type
+from pathlib import Path
+from typing import Dict, Optional, Set
+import logging
+
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+
+from ..build_assets import MANIFEST_FILE
+
+logger = logging.getLogger(__name__)
+
+# Preferred first; (Accept-Encoding token, file suffix)
+PRECOMPRESSED_ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+def accepted_encodings(accept_encoding: Optional[str]) -> Set[str]:
+    """Content codings the client accepts (q > 0)"""
+    accepted = set()
+    for part in (accept_encoding or "").split(","):
+        coding, _, params = part.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if quality > 0:
+            accepted.add(coding)
+    return accepted
+
+
+class AssetManifest:
+    """Maps logical asset names to their content-hashed build names"""
+
+    def __init__(self, url_prefix: str = "/static"):
+        self.url_prefix = url_prefix
+        self.entries: Dict[str, str] = {}
+        self.hashed_names: Set[str] = set()
+
+    def load(self, directory: Path):
+        manifest_path = Path(directory) / MANIFEST_FILE
+        if not manifest_path.exists():
+            self.entries, self.hashed_names = {}, set()
+            return
+        try:
+            self.entries = json.loads(manifest_path.read_text())
+            self.hashed_names = set(self.entries.values())
+            logger.info(f"Loaded asset manifest with {len(self.entries)} entries from {manifest_path}")
+        except Exception as e:
+            logger.error(f"Could not read asset manifest {manifest_path}: {str(e)}")
+            self.entries, self.hashed_names = {}, set()
+
+    def url(self, name: str) -> str:
+        """URL of an asset, fingerprinted when a build is being served"""
+        name = name.lstrip("/")
+        return f"{self.url_prefix}/{self.entries.get(name, name)}"
+
+    def is_hashed(self, path: str) -> bool:
+        return path.lstrip("/") in self.hashed_names
+
+
+# Global instance
+asset_manifest = AssetManifest()
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    """StaticFiles that serves build-time .br/.gz siblings and caches hashed assets forever
+
+    The encoded file is sent as-is through FileResponse (sendfile/pathsend where
+    the server supports it), so nothing is compressed per request.
+    Fingerprinted names from the manifest get ``Cache-Control: immutable``;
+    everything else must be revalidated.
+    """
+
+    def __init__(self, *args, manifest: AssetManifest = asset_manifest, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.manifest = manifest
+
+    def file_response(self, full_path, stat_result, scope, status_code: int = 200):
+        request_headers = Headers(scope=scope)
+        relative = os.path.relpath(full_path, self.directory).replace(os.sep, "/")
+        headers = {
+            "Cache-Control": IMMUTABLE_CACHE_CONTROL if self.manifest.is_hashed(relative) else "no-cache",
+            "Vary": "Accept-Encoding",
+        }
+
+        served_path, served_stat = full_path, stat_result
+        accepted = accepted_encodings(request_headers.get("accept-encoding"))
+        for coding, suffix in PRECOMPRESSED_ENCODINGS:
+            if coding not in accepted:
+                continue
+            try:
+                candidate_stat = os.stat(str(full_path) + suffix)
+            except OSError:
+                continue
+            if stat.S_ISREG(candidate_stat.st_mode):
+                served_path, served_stat = str(full_path) + suffix, candidate_stat
+                headers["Content-Encoding"] = coding
+                break
+
+        # Content type comes from the original name, not the .br/.gz suffix
+        response = FileResponse(
+            served_path,
+            status_code=status_code,
+            stat_result=served_stat,
+            headers=headers,
+            media_type=guess_type(str(full_path))[0] or "text/plain",
+        )
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
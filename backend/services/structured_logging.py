@@ -0,0 +1,240 @@
+import os
+import sys
+import json
+import copy
+import queue
+import random
+import atexit
+import threading
+import time
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler
+from typing import Dict, Optional
+import logging
+
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+log_records_discarded = metrics.counter(
+    "log_records_discarded_total", "Log records not written, by reason", ("reason",)
+)
+
+# Application loggers live under the package this module belongs to ("backend", or the root logger when run from backend/)
+APP_LOGGER = __name__.rpartition(".services.")[0]
+
+# Attributes every LogRecord has; anything else came in through ``extra=``
+STANDARD_ATTRIBUTES = frozenset(vars(logging.makeLogRecord({})).keys()) | {"message", "asctime", "taskName"}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: timestamp, level, logger, message and any ``extra`` fields"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for name, value in record.__dict__.items():
+            if name not in STANDARD_ATTRIBUTES and not name.startswith("_"):
+                entry[name] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class EventSampler(logging.Filter):
+    """Keeps only a fraction of the records of noisy event types
+
+    Records are matched by their ``event`` extra field, so
+    ``logger.info("Payment pending: %s", payment_id, extra={"event": "payment_pending"})``
+    is kept with the probability configured for ``payment_pending``. Warnings
+    and errors are never sampled.
+    """
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self.rates.get(getattr(record, "event", None))
+        if rate is None or rate >= 1.0 or random.random() < rate:
+            return True
+        log_records_discarded.inc("sampled")
+        return False
+
+
+class DroppingQueueHandler(QueueHandler):
+    """QueueHandler that never blocks the caller and leaves formatting to the writer thread
+
+    The stock handler formats the message in the logging thread before
+    enqueueing; here the record is only copied, so %-style arguments are
+    interpolated on the writer thread. When the bounded queue is full the
+    record is dropped and counted instead of stalling the event loop.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        if record.exc_info and not record.exc_text:
+            # Tracebacks reference live frames; render them while they still exist
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            log_records_discarded.inc("queue_full")
+
+
+class LogWriter:
+    """Background thread that drains the log queue and writes records in batches
+
+    Whatever is queued when the thread wakes up is formatted and written with
+    a single write and flush, so a burst costs one syscall and one GIL
+    hand-off rather than one per record (QueueListener flushes every record).
+    """
+
+    def __init__(self, records: "queue.Queue", handler: logging.StreamHandler,
+                 batch_size: int = 512, linger: float = 0.01):
+        self.records = records
+        self.handler = handler
+        self.batch_size = batch_size
+        self.linger = linger
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Write out what is still queued and end the thread"""
+        if self._thread is None:
+            return
+        self.records.put(None)
+        self._thread.join()
+        self._thread = None
+
+    def _run(self):
+        while True:
+            batch = [self.records.get()]
+            # Let a burst accumulate instead of waking up (and taking the GIL) for every record
+            time.sleep(self.linger)
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.records.get_nowait())
+                except queue.Empty:
+                    break
+            lines = []
+            for record in batch:
+                if record is None:
+                    continue
+                try:
+                    lines.append(self.handler.format(record) + self.handler.terminator)
+                except Exception:
+                    self.handler.handleError(record)
+            if lines:
+                self.handler.acquire()
+                try:
+                    self.handler.stream.write("".join(lines))
+                    self.handler.flush()
+                except Exception:
+                    self.handler.handleError(batch[-1])
+                finally:
+                    self.handler.release()
+            if None in batch:
+                return
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+
+class LoggingSetup:
+    """Routes application logs through a bounded queue to a background writer thread
+
+    Loggers hand records to a QueueHandler (a copy and a put_nowait); a
+    LogWriter thread formats them (JSON or text) and does the I/O. Noisy
+    event types are sampled before they are queued.
+    """
+
+    def __init__(self):
+        # Load configuration from environment variables
+        self.enabled = os.getenv("LOG_QUEUE_ENABLED", "true").lower() == "true"
+        self.level = os.getenv("LOG_LEVEL", "INFO").upper()
+        self.format = os.getenv("LOG_FORMAT", "json")
+        self.file = os.getenv("LOG_FILE")
+        self.queue_size = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+        self.sample_rates = self._parse_rates(
+            os.getenv("LOG_SAMPLE_RATES", "webhook_received=0.1,payment_pending=0.1,membership_invalid=0.1")
+        )
+        self.writer: Optional[LogWriter] = None
+        self.handler: Optional[logging.Handler] = None
+        self._stop_at_exit = False
+
+    @staticmethod
+    def _parse_rates(value: str) -> Dict[str, float]:
+        rates = {}
+        for item in value.split(","):
+            name, _, rate = item.partition("=")
+            if name.strip() and rate.strip():
+                try:
+                    rates[name.strip()] = float(rate)
+                except ValueError:
+                    logger.warning(f"Ignoring invalid LOG_SAMPLE_RATES entry '{item}'")
+        return rates
+
+    def _output_handler(self) -> logging.StreamHandler:
+        handler = logging.FileHandler(self.file) if self.file else logging.StreamHandler(sys.stderr)
+        handler.setFormatter(JsonFormatter() if self.format == "json" else TextFormatter())
+        return handler
+
+    def start(self, logger_name: str = APP_LOGGER):
+        """Attach the queue handler to ``logger_name`` (the application's loggers) and start the writer"""
+        if self.handler is not None:
+            return
+        target = logging.getLogger(logger_name)
+        # A level set by whoever embeds the app (e.g. the benchmarks) wins
+        if target.level == logging.NOTSET or not logger_name:
+            target.setLevel(self.level)
+        output = self._output_handler()
+        if self.enabled:
+            records: "queue.Queue[logging.LogRecord]" = queue.Queue(maxsize=self.queue_size)
+            self.handler = DroppingQueueHandler(records)
+            self.writer = LogWriter(records, output)
+            self.writer.start()
+            if not self._stop_at_exit:
+                atexit.register(self.stop, logger_name)
+                self._stop_at_exit = True
+        else:
+            self.handler = output
+        self.handler.addFilter(EventSampler(self.sample_rates))
+        target.addHandler(self.handler)
+        # Application records are written here only, not again by the root logger
+        target.propagate = False
+
+    def stop(self, logger_name: str = APP_LOGGER):
+        """Write out what is still queued and detach"""
+        if self.handler is not None:
+            target = logging.getLogger(logger_name)
+            target.removeHandler(self.handler)
+            target.propagate = True
+            if self.writer is None:
+                self.handler.close()
+            self.handler = None
+        if self.writer is not None:
+            self.writer.stop()
+            self.writer.handler.close()
+            self.writer = None
+
+
+# Global instance
+logging_setup = LoggingSetup()
@@ -0,0 +1,467 @@
+import os
+import json
+import time
+import queue
+import random
+import threading
+import functools
+import inspect
+from collections import deque
+from contextvars import ContextVar
+from fnmatch import fnmatch
+from typing import Any, Callable, Deque, Dict, List, Optional
+import logging
+
+from sqlalchemy import event
+
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+traces_total = metrics.counter(
+    "traces_total", "Finished request traces by tail-sampling decision", ("decision",)
+)
+traces_export_dropped = metrics.counter(
+    "traces_export_dropped_total", "Kept traces not exported, by reason", ("reason",)
+)
+
+# Innermost open span of the request being served, if it is traced
+_current_span: ContextVar[Optional["Span"]] = ContextVar("trace_span", default=None)
+
+
+class Span:
+    """One timed operation within a trace
+
+    Use as a context manager (which also makes it the parent of spans
+    opened inside the block) or call ``end()``.
+    """
+
+    __slots__ = ("trace", "name", "span_id", "parent_id", "start", "finish", "attributes", "error", "_token")
+
+    def __init__(self, trace: "Trace", name: str, parent_id: Optional[str], attributes: Dict[str, Any]):
+        self.trace = trace
+        self.name = name
+        self.span_id = "%016x" % random.getrandbits(64)
+        self.parent_id = parent_id
+        self.start = time.perf_counter()
+        self.finish: Optional[float] = None
+        self.attributes = attributes
+        self.error: Optional[str] = None
+        self._token = None
+
+    @property
+    def duration(self) -> float:
+        return (self.finish or time.perf_counter()) - self.start
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def record_error(self, error: BaseException):
+        self.error = f"{type(error).__name__}: {error}"
+
+    def activate(self) -> "Span":
+        """Make this the parent of spans opened from here on in this context"""
+        self._token = _current_span.set(self)
+        return self
+
+    def end(self):
+        if self.finish is None:
+            self.finish = time.perf_counter()
+        if self._token is not None:
+            try:
+                _current_span.reset(self._token)
+            except ValueError:
+                # Ended from another context (e.g. a thread the span was handed to)
+                pass
+            self._token = None
+
+    def __enter__(self) -> "Span":
+        return self.activate()
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc is not None:
+            self.record_error(exc)
+        self.end()
+
+
+class _NoopSpan:
+    """Stand-in returned when the current request isn't traced"""
+
+    def set_attribute(self, key: str, value: Any):
+        pass
+
+    def record_error(self, error: BaseException):
+        pass
+
+    def activate(self) -> "_NoopSpan":
+        return self
+
+    def end(self):
+        pass
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Trace:
+    """Spans recorded while serving one request"""
+
+    def __init__(self, trace_id: str, max_spans: int):
+        self.trace_id = trace_id
+        self.max_spans = max_spans
+        self.spans: List[Span] = []
+        self.dropped_spans = 0
+        self.finished = False
+        # Span clocks are perf_counter readings, exported as offsets from this wall-clock time
+        self.wall_start = time.time()
+        self._lock = threading.Lock()
+
+    def add(self, name: str, parent_id: Optional[str], attributes: Dict[str, Any]) -> Optional[Span]:
+        with self._lock:
+            if self.finished or len(self.spans) >= self.max_spans:
+                # Late work (a task or thread that outlived the request) or a runaway loop
+                self.dropped_spans += 1
+                return None
+            span = Span(self, name, parent_id, attributes)
+            self.spans.append(span)
+            return span
+
+    def to_dict(self, reason: str) -> Dict[str, Any]:
+        root = self.spans[0]
+        return {
+            "trace_id": self.trace_id,
+            "name": root.name,
+            "reason": reason,
+            "start": self.wall_start,
+            "duration_ms": round(root.duration * 1000, 3),
+            "error": root.error,
+            "dropped_spans": self.dropped_spans,
+            "spans": [
+                {
+                    "span_id": span.span_id,
+                    "parent_id": span.parent_id,
+                    "name": span.name,
+                    "start_ms": round((span.start - root.start) * 1000, 3),
+                    # Spans still open when the request finished are cut off there
+                    "duration_ms": round(((span.finish or root.finish) - span.start) * 1000, 3),
+                    "attributes": span.attributes,
+                    "error": span.error,
+                }
+                for span in self.spans
+            ],
+        }
+
+
+def otlp_payload(traces: List[Dict[str, Any]], service_name: str) -> Dict[str, Any]:
+    """OTLP/HTTP JSON body (ExportTraceServiceRequest) for exported traces"""
+
+    def value(item):
+        if isinstance(item, bool):
+            return {"boolValue": item}
+        if isinstance(item, int):
+            return {"intValue": str(item)}
+        if isinstance(item, float):
+            return {"doubleValue": item}
+        return {"stringValue": str(item)}
+
+    spans = []
+    for trace in traces:
+        start_nanos = int(trace["start"] * 1e9)
+        for index, span in enumerate(trace["spans"]):
+            begin = start_nanos + int(span["start_ms"] * 1e6)
+            otlp_span = {
+                "traceId": trace["trace_id"],
+                "spanId": span["span_id"],
+                "name": span["name"],
+                # SERVER for the request itself, INTERNAL below it
+                "kind": 2 if index == 0 else 1,
+                "startTimeUnixNano": str(begin),
+                "endTimeUnixNano": str(begin + int(span["duration_ms"] * 1e6)),
+                "attributes": [{"key": key, "value": value(item)} for key, item in span["attributes"].items()],
+                "status": {"code": 2, "message": span["error"]} if span["error"] else {"code": 1},
+            }
+            if span["parent_id"]:
+                otlp_span["parentSpanId"] = span["parent_id"]
+            spans.append(otlp_span)
+    return {"resourceSpans": [{
+        "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": service_name}}]},
+        "scopeSpans": [{"scope": {"name": __name__}, "spans": spans}],
+    }]}
+
+
+class TraceExporter:
+    """Background thread that writes kept traces to a JSONL file or posts them to an OTLP collector"""
+
+    def __init__(self, tracer: "Tracer"):
+        self.tracer = tracer
+        self.traces: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue(maxsize=tracer.queue_size)
+        self._thread: Optional[threading.Thread] = None
+        self._client = None
+        # Seconds to let kept traces accumulate so each write or POST carries a batch
+        self.linger = 0.05
+        self.batch_size = 200
+
+    def submit(self, trace: Dict[str, Any]):
+        if self._thread is None:
+            self.start()
+        try:
+            self.traces.put_nowait(trace)
+        except queue.Full:
+            traces_export_dropped.inc("queue_full")
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Export what is still queued and end the thread"""
+        if self._thread is None:
+            return
+        self.traces.put(None)
+        self._thread.join()
+        self._thread = None
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+
+    def _run(self):
+        while True:
+            batch = [self.traces.get()]
+            time.sleep(self.linger)
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.traces.get_nowait())
+                except queue.Empty:
+                    break
+            kept = [trace for trace in batch if trace is not None]
+            if kept:
+                try:
+                    self.export(kept)
+                except Exception as e:
+                    traces_export_dropped.inc("export_failed", amount=len(kept))
+                    logger.warning(f"Exporting {len(kept)} traces failed: {str(e)}")
+            if None in batch:
+                return
+
+    def export(self, traces: List[Dict[str, Any]]):
+        if self.tracer.exporter == "otlp":
+            if self._client is None:
+                import httpx
+                self._client = httpx.Client(timeout=5.0)
+            response = self._client.post(
+                self.tracer.otlp_endpoint, json=otlp_payload(traces, self.tracer.service_name)
+            )
+            response.raise_for_status()
+        else:
+            with open(self.tracer.file, "a", encoding="utf-8") as trace_file:
+                trace_file.write("".join(json.dumps(trace, default=str) + "\n" for trace in traces))
+
+
+class Tracer:
+    """Request tracing with tail-based sampling
+
+    Every request served while TRACING_ENABLED is set gets a trace; spans for
+    SQL statements, template renders, PDF builds and webhook handling are
+    recorded into it through a context variable, so they nest correctly
+    across awaits and the threadpool. Whether a trace is kept is decided when
+    the request finishes: slow ones (TRACE_SLOW_MS), failed ones and a
+    TRACE_SAMPLE_RATE fraction of the rest are exported; everything else is
+    discarded without any I/O. Outside a traced request every span call
+    returns a shared no-op span.
+    """
+
+    def __init__(self):
+        # Load configuration from environment variables
+        self.enabled = os.getenv("TRACING_ENABLED", "false").lower() == "true"
+        self.slow_threshold = float(os.getenv("TRACE_SLOW_MS", "500")) / 1000
+        self.sample_rate = float(os.getenv("TRACE_SAMPLE_RATE", "0"))
+        self.exporter = os.getenv("TRACE_EXPORTER", "jsonl")
+        self.file = os.getenv("TRACE_FILE", "traces.jsonl")
+        self.otlp_endpoint = os.getenv("TRACE_OTLP_ENDPOINT", "http://localhost:4318/v1/traces")
+        self.service_name = os.getenv("TRACE_SERVICE_NAME", "whop-checkout")
+        self.max_spans = int(os.getenv("TRACE_MAX_SPANS", "500"))
+        self.queue_size = int(os.getenv("TRACE_QUEUE_SIZE", "1000"))
+        self.exclude_paths = tuple(
+            path.strip() for path in
+            os.getenv("TRACE_EXCLUDE_PATHS", "/metrics,/static/*,/api/transactions/*/wait,/api/transactions/*/events")
+            .split(",")
+            if path.strip()
+        )
+        # Kept traces for GET /api/admin/traces
+        self.recent: Deque[Dict[str, Any]] = deque(maxlen=int(os.getenv("TRACE_RECENT", "100")))
+        self.writer = TraceExporter(self)
+
+    def traces_path(self, path: str) -> bool:
+        return not any(fnmatch(path, pattern) for pattern in self.exclude_paths)
+
+    def start_trace(self, name: str, traceparent: Optional[str] = None, **attributes) -> Span:
+        """Open the root span of a new trace, continuing a W3C ``traceparent`` if one came in"""
+        trace_id, parent_id = None, None
+        if traceparent:
+            parts = traceparent.strip().split("-")
+            if len(parts) == 4 and len(parts[1]) == 32 and len(parts[2]) == 16:
+                trace_id, parent_id = parts[1], parts[2]
+        trace = Trace(trace_id or "%032x" % random.getrandbits(128), self.max_spans)
+        root = trace.add(name, parent_id, attributes)
+        return root.activate()
+
+    def span(self, name: str, **attributes) -> Any:
+        """Child of the current span; a no-op outside traced requests. Activated by ``with``"""
+        parent = _current_span.get()
+        if parent is None:
+            return NOOP_SPAN
+        return parent.trace.add(name, parent.span_id, attributes) or NOOP_SPAN
+
+    def start_span(self, name: str, **attributes) -> Any:
+        """Like ``span`` but already active, for code that calls ``end()`` itself"""
+        return self.span(name, **attributes).activate()
+
+    def traced(self, name: Optional[str] = None) -> Callable:
+        """Decorator recording each call of a function (sync or async) as a span"""
+
+        def decorator(function):
+            span_name = name or function.__qualname__
+            if inspect.iscoroutinefunction(function):
+                @functools.wraps(function)
+                async def async_wrapper(*args, **kwargs):
+                    with self.span(span_name):
+                        return await function(*args, **kwargs)
+                return async_wrapper
+
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                with self.span(span_name):
+                    return function(*args, **kwargs)
+            return wrapper
+
+        return decorator
+
+    def finish(self, root: Span):
+        """End the request's trace and keep or drop it"""
+        root.end()
+        trace = root.trace
+        with trace._lock:
+            trace.finished = True
+        if root.error:
+            reason = "error"
+        elif root.duration >= self.slow_threshold:
+            reason = "slow"
+        elif self.sample_rate > 0 and random.random() < self.sample_rate:
+            reason = "sampled"
+        else:
+            traces_total.inc("dropped")
+            return
+        traces_total.inc(reason)
+        record = trace.to_dict(reason)
+        self.recent.append(record)
+        self.writer.submit(record)
+
+    def recent_traces(self, trace_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Newest kept traces first; summaries only unless one is asked for by ID"""
+        traces = list(self.recent)[::-1]
+        if trace_id:
+            return [trace for trace in traces if trace["trace_id"] == trace_id]
+        return [
+            dict({key: value for key, value in trace.items() if key != "spans"}, span_count=len(trace["spans"]))
+            for trace in traces
+        ]
+
+    def instrument_engine(self, engine):
+        """Record a span per SQL statement issued within a traced request"""
+
+        @event.listens_for(engine, "before_cursor_execute")
+        def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            parent = _current_span.get()
+            if parent is None:
+                return
+            operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "UNKNOWN"
+            span = parent.trace.add(f"db.{operation.lower()}", parent.span_id, {
+                "db.system": engine.dialect.name,
+                "db.statement": statement[:500],
+                "db.executemany": executemany,
+            })
+            conn.info.setdefault("trace_spans", []).append(span)
+
+        @event.listens_for(engine, "after_cursor_execute")
+        def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            if conn.info.get("trace_spans"):
+                span = conn.info["trace_spans"].pop()
+                if span is not None:
+                    span.end()
+
+        @event.listens_for(engine, "handle_error")
+        def _handle_error(exception_context):
+            conn = exception_context.connection
+            if conn is not None and conn.info.get("trace_spans"):
+                span = conn.info["trace_spans"].pop()
+                if span is not None:
+                    span.record_error(exception_context.original_exception)
+                    span.end()
+
+    def instrument_templates(self, environment):
+        """Record a span per template render of a Jinja environment"""
+        tracer = self
+
+        class TracedTemplate(environment.template_class):
+            def render(self, *args, **kwargs):
+                with tracer.span("template.render", template=self.name):
+                    return super().render(*args, **kwargs)
+
+        environment.template_class = TracedTemplate
+
+    def close(self):
+        self.writer.stop()
+
+
+# Global instance
+tracer = Tracer()
+
+
+class TracingMiddleware:
+    """ASGI middleware that traces each request with ``tracer``"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not tracer.traces_path(scope["path"]):
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        headers = dict(scope["headers"])
+        traceparent = headers.get(b"traceparent")
+        root = tracer.start_trace(
+            f"{method} {scope['path']}", traceparent.decode("latin-1") if traceparent else None,
+            **{"http.method": method, "http.target": scope["path"]}
+        )
+        status_holder = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status_holder[0] = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"x-trace-id", root.trace.trace_id.encode("latin-1"))
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except Exception as e:
+            root.record_error(e)
+            raise
+        finally:
+            route = scope.get("route")
+            if route is not None:
+                root.name = f"{method} {route.path}"
+                root.set_attribute("http.route", route.path)
+            root.set_attribute("http.status_code", status_holder[0])
+            if status_holder[0] >= 500 and root.error is None:
+                root.error = f"HTTP {status_holder[0]}"
+            tracer.finish(root)
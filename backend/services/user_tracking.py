@@ -1,8 +1,17 @@
+import os
+import hmac
+import time
 import uuid
 import hashlib
+import secrets
 from datetime import datetime
+from fnmatch import fnmatch
+from http.cookies import SimpleCookie
 from typing import Optional, Dict, Any
 from fastapi import Request
+import logging
+
+logger = logging.getLogger(__name__)
 
 
 class UserTrackingService:
@@ -19,25 +28,48 @@ class UserTrackingService:
         return str(uuid.uuid4())
     
     @staticmethod
-    def get_user_fingerprint(request: Request) -> str:
-        """Create a user fingerprint based on request data"""
+    def compute_fingerprint(ip: str, user_agent: str) -> str:
+        """Hash of the identifying information of a client"""
         # Combine IP, User-Agent, and other identifying info
-        ip = request.client.host
-        user_agent = request.headers.get("user-agent", "")
-        
-        # Create a hash of identifying information
         fingerprint_data = f"{ip}:{user_agent}"
         return hashlib.md5(fingerprint_data.encode()).hexdigest()
     
+    @staticmethod
+    def get_user_fingerprint(request: Request) -> str:
+        """Create a user fingerprint based on request data"""
+        return UserTrackingService.compute_fingerprint(
+            request.client.host,
+            request.headers.get("user-agent", "")
+        )
+    
     @staticmethod
     def extract_user_info(request: Request) -> Dict[str, Any]:
-        """Extract user information from request"""
-        return {
+        """Extract user information from request
+        
+        Uses the session issued by SessionCookieMiddleware, so the session ID and
+        fingerprint are the same on every request from a browser. The result is
+        memoized on the request for dependencies and handlers that both need it.
+        """
+        user_info = getattr(request.state, "user_info", None)
+        if user_info is not None:
+            return user_info
+        
+        session = getattr(request.state, "session", None)
+        if session is None:
+            # Outside the middleware (e.g. scripts): one-off session as before
+            session = {
+                "session_id": UserTrackingService.generate_session_id(),
+                "fingerprint": UserTrackingService.get_user_fingerprint(request)
+            }
+        
+        user_info = {
             "ip_address": request.client.host,
             "user_agent": request.headers.get("user-agent", ""),
-            "session_id": UserTrackingService.generate_session_id(),
-            "user_fingerprint": UserTrackingService.get_user_fingerprint(request)
+            "session_id": session["session_id"],
+            "user_fingerprint": session["fingerprint"]
         }
+        request.state.user_info = user_info
+        return user_info
     
     @staticmethod
     def create_user_identifier(email: str = None, name: str = None) -> str:
@@ -52,3 +84,111 @@ class UserTrackingService:
 
 # Global instance
 user_tracking = UserTrackingService()
+
+
+class SessionCookieMiddleware:
+    """ASGI middleware that gives every browser one signed, long-lived session
+    
+    The cookie carries ``session_id.issued_at.fingerprint.signature``, where the
+    signature is an HMAC-SHA256 under SECRET_KEY. A valid cookie is trusted
+    as-is, so the fingerprint is computed once when the session is issued and
+    never re-derived. Requests without a valid cookie get a new session and a
+    Set-Cookie on their response.
+    """
+    
+    def __init__(self, app):
+        self.app = app
+        # Load configuration from environment variables
+        secret = os.getenv("SECRET_KEY")
+        if not secret:
+            logger.warning("SECRET_KEY not set - session cookies won't survive restarts or be valid across workers")
+            secret = secrets.token_urlsafe(32)
+        self.key = hashlib.sha256(b"session-cookie:" + secret.encode()).digest()
+        self.cookie_name = os.getenv("SESSION_COOKIE_NAME", "cerebra_session")
+        self.max_age = int(os.getenv("SESSION_MAX_AGE", str(30 * 24 * 3600)))
+        self.secure = os.getenv("SESSION_COOKIE_SECURE", "false").lower() == "true"
+        # Assets, scrapes, webhooks, admin and long-poll JSON are machine traffic and must not mint sessions
+        self.exclude_paths = tuple(
+            path.strip() for path in
+            os.getenv(
+                "SESSION_EXCLUDE_PATHS",
+                "/static/*,/metrics,/api/webhooks/*,/api/admin/*,/api/transactions/*/wait,/api/transactions/*/events"
+            ).split(",")
+            if path.strip()
+        )
+    
+    def excluded(self, path: str) -> bool:
+        return any(fnmatch(path, pattern) for pattern in self.exclude_paths)
+    
+    def sign(self, payload: str) -> str:
+        return hmac.new(self.key, payload.encode(), hashlib.sha256).hexdigest()[:32]
+    
+    def load(self, cookie_value: str) -> Optional[Dict[str, str]]:
+        """Session from a cookie value, or None if it is forged, malformed or expired"""
+        try:
+            session_id, issued_at, fingerprint, signature = cookie_value.split(".")
+            if not hmac.compare_digest(signature, self.sign(f"{session_id}.{issued_at}.{fingerprint}")):
+                return None
+            if time.time() - int(issued_at) > self.max_age:
+                return None
+        except ValueError:
+            return None
+        return {"session_id": session_id, "fingerprint": fingerprint}
+    
+    def issue(self, scope) -> Dict[str, str]:
+        headers = dict(scope["headers"])
+        client = scope.get("client")
+        fingerprint = UserTrackingService.compute_fingerprint(
+            client[0] if client else "",
+            headers.get(b"user-agent", b"").decode("latin-1")
+        )
+        session_id = uuid.uuid4().hex
+        payload = f"{session_id}.{int(time.time())}.{fingerprint}"
+        return {
+            "session_id": session_id,
+            "fingerprint": fingerprint,
+            "cookie": f"{payload}.{self.sign(payload)}"
+        }
+    
+    def _cookie_value(self, scope) -> Optional[str]:
+        for name, value in scope["headers"]:
+            if name == b"cookie":
+                cookie = SimpleCookie()
+                try:
+                    cookie.load(value.decode("latin-1"))
+                except Exception:
+                    return None
+                morsel = cookie.get(self.cookie_name)
+                if morsel:
+                    return morsel.value
+        return None
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self.excluded(scope["path"]):
+            await self.app(scope, receive, send)
+            return
+        
+        cookie_value = self._cookie_value(scope)
+        session = self.load(cookie_value) if cookie_value else None
+        new_session = None
+        if session is None:
+            new_session = self.issue(scope)
+            # "new": minted for this request, so the client can't present it again on a retry
+            session = {"session_id": new_session["session_id"], "fingerprint": new_session["fingerprint"], "new": True}
+        scope.setdefault("state", {})["session"] = session
+        
+        if new_session is None:
+            await self.app(scope, receive, send)
+            return
+        
+        set_cookie = (
+            f"{self.cookie_name}={new_session['cookie']}; Path=/; Max-Age={self.max_age}; HttpOnly; SameSite=Lax"
+            + ("; Secure" if self.secure else "")
+        ).encode("latin-1")
+        
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [(b"set-cookie", set_cookie)]
+            await send(message)
+        
+        await self.app(scope, receive, send_wrapper)
@@ -1,19 +1,245 @@
 import os
 import hmac
+import time
+import uuid
+import random
+import asyncio
 import hashlib
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 import logging
 
+from .cache import cache, MISSING
+
 logger = logging.getLogger(__name__)
 
+# Cache namespaces for Whop API lookups
+WHOP_SESSION_CACHE = "whop_sessions"
+WHOP_PAYMENT_CACHE = "whop_payments"
+
+
+class WhopApiError(Exception):
+    """Raised when the Whop API cannot answer a request"""
+
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class CircuitBreaker:
+    """Stops calling an upstream that keeps failing
+
+    After ``failure_threshold`` consecutive failures the circuit opens and
+    calls fail fast for ``reset_timeout`` seconds. Then a single trial call is
+    let through (half-open): success closes the circuit, failure re-opens it.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self._trial_in_flight:
+            self._trial_in_flight = True
+            return True
+        return False
+
+    def end_trial(self):
+        self._trial_in_flight = False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._trial_in_flight = False
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            if self.opened_at is None:
+                logger.warning(f"Whop API circuit opened after {self.failures} consecutive failures")
+            self.opened_at = time.monotonic()
+
+
+class WhopApiClient:
+    """Async client for the Whop REST API
+
+    One pooled ``httpx.AsyncClient`` (keep-alive, bounded connections) is shared
+    by every request in the worker. Transient failures (timeouts, connection
+    errors, 429 and 5xx) are retried with full-jitter exponential backoff,
+    successful lookups are cached for a few seconds, concurrent lookups of the
+    same resource share one upstream call, and a circuit breaker fails fast
+    while Whop is down instead of tying up workers on timeouts.
+    """
+
+    RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+    def __init__(self, transport=None):
+        # Load configuration from environment variables
+        self.api_key = os.getenv("WHOP_API_KEY")
+        self.base_url = os.getenv("WHOP_API_BASE_URL", "https://api.whop.com/api/v2").rstrip("/")
+        self.timeout = float(os.getenv("WHOP_API_TIMEOUT", "5"))
+        self.max_retries = int(os.getenv("WHOP_API_MAX_RETRIES", "2"))
+        self.backoff_base = float(os.getenv("WHOP_API_BACKOFF_BASE", "0.2"))
+        self.cache_ttl = float(os.getenv("WHOP_API_CACHE_TTL", "10"))
+        self.max_connections = int(os.getenv("WHOP_API_MAX_CONNECTIONS", "20"))
+        self.circuit = CircuitBreaker(
+            failure_threshold=int(os.getenv("WHOP_CIRCUIT_FAILURE_THRESHOLD", "5")),
+            reset_timeout=float(os.getenv("WHOP_CIRCUIT_RESET_TIMEOUT", "30")),
+        )
+        # httpx transport override, e.g. an httpx.MockTransport standing in for Whop
+        self.transport = transport
+        self._client = None
+        self._loop = None
+        self._inflight: Dict[str, "asyncio.Future"] = {}
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.api_key)
+
+    def _get_client(self):
+        """The shared AsyncClient, recreated if the event loop changed (e.g. between test runs)"""
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            import httpx
+
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers={"Authorization": f"Bearer {self.api_key}", "Accept": "application/json"},
+                timeout=httpx.Timeout(self.timeout, connect=min(self.timeout, 3.0)),
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                    keepalive_expiry=30.0,
+                ),
+                transport=self.transport,
+            )
+            self._loop = loop
+            self._inflight = {}
+        return self._client
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def _backoff(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        """Full-jitter exponential backoff, honouring a short Retry-After"""
+        delay = random.uniform(0, self.backoff_base * (2 ** attempt))
+        if retry_after:
+            try:
+                delay = max(delay, min(float(retry_after), self.timeout))
+            except ValueError:
+                pass
+        return delay
+
+    async def _request(self, method: str, path: str, **kwargs) -> Dict[str, Any]:
+        import httpx
+
+        if not self.configured:
+            raise WhopApiError("WHOP_API_KEY not set")
+        trial = self.circuit.state == "half_open"
+        if not self.circuit.allow():
+            raise WhopApiError("Whop API circuit open - failing fast")
+
+        try:
+            client = self._get_client()
+            last_error = "no attempt made"
+            for attempt in range(self.max_retries + 1):
+                retry_after = None
+                try:
+                    response = await client.request(method, path, **kwargs)
+                except httpx.TransportError as e:
+                    last_error = f"{type(e).__name__}: {str(e)}"
+                else:
+                    if response.status_code not in self.RETRYABLE_STATUS:
+                        # Any non-retryable answer, 4xx included, means Whop itself is healthy
+                        self.circuit.record_success()
+                        if response.status_code >= 400:
+                            raise WhopApiError(
+                                f"Whop API {method} {path} returned {response.status_code}", response.status_code
+                            )
+                        return response.json()
+                    last_error = f"HTTP {response.status_code}"
+                    retry_after = response.headers.get("retry-after")
+
+                if attempt < self.max_retries:
+                    await asyncio.sleep(self._backoff(attempt, retry_after))
+
+            self.circuit.record_failure()
+            raise WhopApiError(f"Whop API {method} {path} failed after {self.max_retries + 1} attempts: {last_error}")
+        finally:
+            if trial:
+                # However the trial ended (a decode error, cancellation), the next call may try again
+                self.circuit.end_trial()
+
+    async def _fetch(self, namespace: str, key: str, path: str) -> Dict[str, Any]:
+        result = await self._request("GET", path)
+        cache.set(namespace, key, result, self.cache_ttl)
+        return result
+
+    async def _cached_get(self, namespace: str, key: str, path: str) -> Dict[str, Any]:
+        """GET through the shared cache, with one upstream call per key at a time"""
+        cached = cache.get(namespace, key)
+        if cached is not MISSING:
+            return cached
+
+        self._get_client()
+        inflight_key = f"{namespace}:{key}"
+        task = self._inflight.get(inflight_key)
+        if task is None:
+            # A task rather than the first caller's coroutine, so that caller disconnecting
+            # does not cancel the lookup for everyone else waiting on it
+            task = asyncio.ensure_future(self._fetch(namespace, key, path))
+            self._inflight[inflight_key] = task
+            task.add_done_callback(lambda done: self._finish_inflight(inflight_key, done))
+        return await asyncio.shield(task)
+
+    def _finish_inflight(self, inflight_key: str, task: "asyncio.Future"):
+        if self._inflight.get(inflight_key) is task:
+            del self._inflight[inflight_key]
+        if not task.cancelled():
+            # Mark the exception retrieved even if every waiter went away
+            task.exception()
+
+    async def get_checkout_session(self, session_id: str) -> Dict[str, Any]:
+        return await self._cached_get(WHOP_SESSION_CACHE, session_id, f"/checkout_sessions/{session_id}")
+
+    async def get_payment(self, payment_id: str) -> Dict[str, Any]:
+        return await self._cached_get(WHOP_PAYMENT_CACHE, payment_id, f"/payments/{payment_id}")
+
+    async def list_payments(self, page: int = 1, per: int = 50) -> Dict[str, Any]:
+        """One page of payments, newest first: {"data": [...], "pagination": {...}}"""
+        return await self._request("GET", "/payments", params={"page": page, "per": per})
+
+
 class WhopService:
     """Service for Whop webhook verification and checkout management"""
     
+    # Metadata key used to correlate Whop payments with local transactions
+    CHECKOUT_REFERENCE_KEY = "checkout_reference"
+    
     def __init__(self):
         # Load configuration from environment variables
         self.webhook_secret = os.getenv("WHOP_WEBHOOK_SECRET")
         self.plan_id = os.getenv("WHOP_PLAN_ID")
         self.checkout_link = os.getenv("WHOP_CHECKOUT_LINK")
+        # Seconds a pending checkout is handed back to the same user instead of creating another
+        self.checkout_reuse_window = int(os.getenv("CHECKOUT_REUSE_WINDOW", "1800"))
+        self.api = WhopApiClient()
         
         # Validate required configuration
         if not self.webhook_secret:
@@ -22,6 +248,12 @@ class WhopService:
             logger.warning("WHOP_PLAN_ID not set - checkout may not work properly")
         if not self.checkout_link:
             logger.warning("WHOP_CHECKOUT_LINK not set - checkout will fail")
+        if not self.api.configured:
+            logger.info("WHOP_API_KEY not set - Whop session and payment lookups are disabled")
+    
+    def generate_checkout_reference(self) -> str:
+        """Generate a unique correlation key for a new checkout"""
+        return f"chk_{uuid.uuid4().hex}"
     
     def get_checkout_url(self, user_id: str, metadata: Dict[str, Any] = None) -> str:
         """
@@ -76,6 +308,42 @@ class WhopService:
             webhook_data.get("checkout_session_id") or
             ""
         )
+    
+    def extract_checkout_reference_from_webhook(self, webhook_data: Dict[str, Any]) -> str:
+        """Extract the checkout reference we passed through Whop metadata"""
+        data = webhook_data.get("data", {}) or {}
+        payment_data = data.get("payment", {}) or {}
+        
+        for metadata in (data.get("metadata"), payment_data.get("metadata"), webhook_data.get("metadata")):
+            if isinstance(metadata, dict) and metadata.get(self.CHECKOUT_REFERENCE_KEY):
+                return str(metadata[self.CHECKOUT_REFERENCE_KEY])
+        return ""
+    
+    async def get_session_status(self, session_id: str) -> Dict[str, Any]:
+        """Fetch a Whop checkout session; status is "unknown" when Whop can't be asked"""
+        if not self.api.configured or not session_id:
+            return {"status": "unknown"}
+        try:
+            session = await self.api.get_checkout_session(session_id)
+        except WhopApiError as e:
+            logger.warning(f"Whop session lookup failed for {session_id}: {str(e)}")
+            return {"status": "unknown", "error": str(e)}
+        return {**session, "status": session.get("status", "unknown")}
+    
+    async def get_payment_status(self, payment_id: str) -> Dict[str, Any]:
+        """Fetch a Whop payment; status is "unknown" when Whop can't be asked"""
+        if not self.api.configured or not payment_id:
+            return {"status": "unknown"}
+        try:
+            payment = await self.api.get_payment(payment_id)
+        except WhopApiError as e:
+            logger.warning(f"Whop payment lookup failed for {payment_id}: {str(e)}")
+            return {"status": "unknown", "error": str(e)}
+        return {**payment, "status": payment.get("status", "unknown")}
+    
+    async def close(self):
+        """Close pooled Whop API connections"""
+        await self.api.aclose()
 
 # Global instance
 whop_service = WhopService()
\ No newline at end of file
@@ -0,0 +1 @@
+# Performance benchmarks (run from the project root, e.g. python -m benchmarks.metrics_overhead)
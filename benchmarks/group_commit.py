@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Compare checkout insert throughput with and without group commit.
+
+Fires concurrent POST /api/create-cerebra-checkout requests (a distinct
+customer each, so every request inserts a row) at the in-process ASGI app
+with CHECKOUT_GROUP_COMMIT=false and =true. Each mode runs in a fresh
+interpreter against its own empty SQLite file, so both pay the same
+per-commit fsync. Keep --concurrency below the connection pool size (15): the
+per-commit path runs in the event loop and stalls once every pooled
+connection belongs to a request waiting behind it.
+
+    python -m benchmarks.group_commit --requests 2000 --concurrency 12
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+
+async def _drive(requests: int, concurrency: int) -> dict:
+    """Send ``requests`` checkout creations from ``concurrency`` clients"""
+    import logging
+    import httpx
+    from backend.main import app
+    from backend.services.group_commit import checkout_writer
+
+    logging.getLogger("backend").setLevel(logging.ERROR)
+    next_index = iter(range(requests))
+    errors = 0
+
+    async def client_loop(client):
+        nonlocal errors
+        for i in next_index:
+            response = await client.post("/api/create-cerebra-checkout", json={
+                "plan_id": "plan_bench", "amount": 5.0, "customer_email": f"launch{i}@example.com",
+            })
+            if response.status_code != 200:
+                errors += 1
+
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            await client.post("/api/create-cerebra-checkout", json={"plan_id": "plan_bench", "amount": 5.0})  # warm-up
+            start = time.perf_counter()
+            await asyncio.gather(*(client_loop(client) for _ in range(concurrency)))
+            elapsed = time.perf_counter() - start
+    return {"elapsed": elapsed, "errors": errors, **checkout_writer.stats}
+
+
+def run_mode(group_commit: bool, requests: int, concurrency: int, directory: str) -> dict:
+    database = Path(directory) / f"checkouts_{'group' if group_commit else 'single'}.db"
+    env = dict(os.environ, CHECKOUT_GROUP_COMMIT="true" if group_commit else "false",
+               DATABASE_URL=f"sqlite:///{database}", RATE_LIMIT_ENABLED="false",
+               WHOP_CHECKOUT_LINK="plan_bench", WHOP_PLAN_ID="plan_bench")
+    output = subprocess.run(
+        [sys.executable, "-m", "benchmarks.group_commit", "--worker",
+         "--requests", str(requests), "--concurrency", str(concurrency)],
+        cwd=PROJECT_ROOT, env=env, check=True, capture_output=True, text=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=12)
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(asyncio.run(_drive(args.requests, args.concurrency))))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        results = {mode: run_mode(mode, args.requests, args.concurrency, tmp) for mode in (False, True)}
+
+    for mode, result in results.items():
+        label = "group commit" if mode else "commit per checkout"
+        batches = f"  {result['inserts'] / result['batches']:.1f} inserts/commit" if result["batches"] else ""
+        print(f"{label:<20} {args.requests / result['elapsed']:>9,.0f} checkouts/s  errors {result['errors']}{batches}")
+    speedup = results[False]["elapsed"] / results[True]["elapsed"]
+    print(f"speedup: {speedup:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Enforce a cold-start import budget for the app using ``python -X importtime``.
+
+Imports backend.main in fresh interpreters, keeps the fastest run, prints the
+slowest modules and fails when the total exceeds the budget or when a module
+that should load lazily (ReportLab by default) is imported at startup:
+
+    python -m benchmarks.import_time
+    python -m benchmarks.import_time --budget-ms 600 --forbid reportlab,httpx
+"""
+
+import argparse
+import subprocess
+import sys
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+
+def measure(module: str):
+    """Return {module: (self_us, cumulative_us)} for one cold import of ``module``"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=PROJECT_ROOT, capture_output=True, text=True, check=True
+    )
+    timings = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        timings[name.strip()] = (int(self_us), int(cumulative_us))
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="backend.main")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=1000.0, help="maximum cumulative import time")
+    parser.add_argument("--forbid", default="reportlab", help="comma-separated packages that must load lazily")
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    runs = [measure(args.module) for _ in range(args.runs)]
+    best = min(runs, key=lambda timings: timings[args.module][1])
+    total_ms = best[args.module][1] / 1000
+
+    print(f"Slowest imports (self time) for {args.module}:")
+    for name, (self_us, cumulative_us) in sorted(best.items(), key=lambda item: -item[1][0])[:args.top]:
+        print(f"  {self_us / 1000:8.1f}ms self {cumulative_us / 1000:8.1f}ms cumulative  {name}")
+
+    failures = []
+    if total_ms > args.budget_ms:
+        failures.append(f"import of {args.module} took {total_ms:.1f}ms (budget {args.budget_ms:.0f}ms)")
+    for package in filter(None, (p.strip() for p in args.forbid.split(","))):
+        eager = sorted(name for name in best if name == package or name.startswith(package + "."))
+        if eager:
+            failures.append(f"{package} is imported at startup ({len(eager)} modules) but should load lazily")
+
+    print(f"\nTotal: {total_ms:.1f}ms (best of {args.runs}, budget {args.budget_ms:.0f}ms)")
+    for failure in failures:
+        print(f"❌ {failure}")
+    if not failures:
+        print("✅ Import budget met")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+"""
+End-to-end load test of the real ASGI app against a seeded database.
+
+Seeds (once, cached under benchmarks/.data/) a database of the requested
+size. Each run benchmarks a fresh copy of that seed, because checkout_burst
+and webhook_storm write to it. It drives each scenario either in-process
+through httpx's ASGI transport or against uvicorn workers, and reports throughput and
+p50/p95/p99 latency per scenario. Results are saved as JSON so branches
+can be compared:
+
+    python -m benchmarks.loadtest --rows 10k --save benchmarks/results/main.json
+    python -m benchmarks.loadtest --rows 10k --compare benchmarks/results/main.json
+    python -m benchmarks.loadtest --rows 1m --target uvicorn --workers 4 --scenarios landing_page,webhook_storm
+"""
+
+import argparse
+import asyncio
+import hashlib
+import hmac
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from backend.seed_data import parse_rows, bulk_load
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+DATA_DIR = Path(__file__).resolve().parent / ".data"
+WEBHOOK_SECRET = "whsec_benchmark"
+
+SCENARIO_NAMES = (
+    "landing_page", "checkout_burst", "webhook_storm", "admin_refresh", "listing_pagination", "invoice_download",
+    "status_polling", "conditional_polling", "invoice_revalidation",
+)
+
+# Scenarios that replay the last ETag seen for a path in If-None-Match
+CONDITIONAL_SCENARIOS = ("conditional_polling", "invoice_revalidation")
+
+
+class ScenarioContext:
+    """Identifiers from the seeded database that scenarios draw requests from"""
+
+    def __init__(self, database: str, rows: int):
+        connection = sqlite3.connect(database)
+        self.rows = rows
+        self.completed_ids = [row[0] for row in connection.execute(
+            "SELECT id FROM transactions WHERE status = 'completed' ORDER BY id DESC LIMIT 1000")]
+        self.pending_references = [row[0] for row in connection.execute(
+            "SELECT checkout_reference FROM transactions WHERE status = 'pending' "
+            "AND checkout_reference IS NOT NULL ORDER BY id DESC LIMIT 20000")]
+        connection.close()
+        # Validators seen per path, replayed by conditional polling like a browser cache would
+        self.etags = {}
+
+    def request(self, scenario: str, i: int):
+        """Return (method, path, request kwargs) for the i-th request of a scenario"""
+        if scenario == "landing_page":
+            return "GET", "/", {"headers": {"user-agent": f"Mozilla/5.0 (benchmark {i})"}}
+        if scenario == "checkout_burst":
+            return "POST", "/api/create-cerebra-checkout", {"json": {
+                "plan_id": "plan_bench", "amount": 5.0, "customer_email": f"burst{i}-{time.time_ns()}@example.com",
+            }}
+        if scenario == "webhook_storm":
+            # Each webhook completes a different pending checkout until the pool runs dry
+            reference = self.pending_references.pop() if self.pending_references else "chk_exhausted"
+            body = json.dumps({"type": "payment_succeeded", "data": {
+                "id": f"pay_bench_{i}", "amount": 500, "metadata": {"checkout_reference": reference},
+                "customer": {"email": f"storm{i}@example.com", "name": f"Storm {i}"},
+            }}).encode()
+            signature = hmac.new(WEBHOOK_SECRET.encode(), body, hashlib.sha256).hexdigest()
+            return "POST", "/api/webhooks/whop", {"content": body, "headers": {
+                "content-type": "application/json", "x-whop-signature": signature,
+            }}
+        if scenario == "admin_refresh":
+            return "GET", "/admin", {}
+        if scenario == "listing_pagination":
+            page_size = 100
+            skip = (i * page_size) % max(self.rows - page_size, 1)
+            return "GET", f"/api/transactions/?skip={skip}&limit={page_size}", {}
+        if scenario in ("status_polling", "conditional_polling", "invoice_revalidation"):
+            # Success pages poll a small set of recent transactions over and over
+            transaction_id = self.completed_ids[i % min(len(self.completed_ids), 50)]
+            if scenario == "invoice_revalidation":
+                path = f"/api/invoice/{transaction_id}/download"
+            else:
+                path = f"/api/admin/payment-status/{transaction_id}"
+            etag = self.etags.get(path) if scenario in CONDITIONAL_SCENARIOS else None
+            return "GET", path, {"headers": {"if-none-match": etag} if etag else {}}
+        if scenario == "invoice_download":
+            return "GET", f"/api/invoice/{self.completed_ids[i % len(self.completed_ids)]}/download", {}
+        raise ValueError(f"Unknown scenario {scenario}")
+
+    def observe(self, path: str, response):
+        etag = response.headers.get("etag")
+        if etag:
+            self.etags[path] = etag
+
+
+def percentile(sorted_values, fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+async def run_scenario(client, context: ScenarioContext, scenario: str, requests: int, concurrency: int):
+    """Fire ``requests`` requests from ``concurrency`` workers and summarise latencies"""
+    latencies, errors = [], 0
+    next_index = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for i in next_index:
+            method, path, kwargs = context.request(scenario, i)
+            start = time.perf_counter()
+            response = await client.request(method, path, **kwargs)
+            latencies.append(time.perf_counter() - start)
+            context.observe(path, response)
+            if response.status_code >= 400:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "errors": errors,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(requests / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+    }
+
+
+def wait_for_server(base_url: str, timeout: float = 30.0):
+    import httpx
+
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if httpx.get(f"{base_url}/payment/cancel", timeout=1.0).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"uvicorn did not start at {base_url}")
+
+
+async def run_suite(args, context: ScenarioContext, scenarios):
+    import httpx
+
+    results = {}
+
+    async def drive(client):
+        for scenario in scenarios:
+            requests = args.requests if scenario not in ("admin_refresh", "invoice_download") else max(args.requests // 5, 1)
+            # Warm up caches, connections and template compilation before measuring
+            await run_scenario(client, context, scenario, min(10, requests), 1)
+            results[scenario] = await run_scenario(client, context, scenario, requests, args.concurrency)
+            summary = results[scenario]
+            print(f"{scenario:<20} {summary['throughput_rps']:>9.1f} req/s  p50 {summary['p50_ms']:>8.2f}ms  "
+                  f"p95 {summary['p95_ms']:>8.2f}ms  p99 {summary['p99_ms']:>8.2f}ms  errors {summary['errors']}")
+
+    if args.target == "inprocess":
+        import logging
+        from backend.main import app
+
+        # Per-request warnings (e.g. exhausted webhook references) would drown the report
+        logging.getLogger("backend").setLevel(logging.ERROR)
+
+        transport = httpx.ASGITransport(app=app)
+        async with app.router.lifespan_context(app):
+            async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+                await drive(client)
+    else:
+        base_url = f"http://127.0.0.1:{args.port}"
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "backend.main:app", "--host", "127.0.0.1", "--port", str(args.port),
+             "--workers", str(args.workers), "--log-level", "warning"],
+            cwd=PROJECT_ROOT, env=os.environ.copy()
+        )
+        try:
+            wait_for_server(base_url)
+            limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+            async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60.0) as client:
+                await drive(client)
+        finally:
+            server.terminate()
+            server.wait()
+    return results
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=PROJECT_ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return "unknown"
+
+
+def compare(results, baseline_path: str):
+    baseline = json.loads(Path(baseline_path).read_text())["scenarios"]
+    print(f"\nComparison with {baseline_path}:")
+    for scenario, summary in results.items():
+        if scenario not in baseline:
+            continue
+        before = baseline[scenario]
+        throughput = (summary["throughput_rps"] - before["throughput_rps"]) / before["throughput_rps"] * 100
+        p95 = (summary["p95_ms"] - before["p95_ms"]) / before["p95_ms"] * 100 if before["p95_ms"] else 0.0
+        print(f"{scenario:<20} throughput {throughput:+7.1f}%   p95 {p95:+7.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", default="10k", help="seeded dataset size: 10k, 1m, 10m or an integer")
+    parser.add_argument("--scenarios", default=",".join(SCENARIO_NAMES))
+    parser.add_argument("--requests", type=int, default=500, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--target", choices=("inprocess", "uvicorn"), default="inprocess")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers (uvicorn target)")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--save", help="write results JSON to this path")
+    parser.add_argument("--compare", help="baseline results JSON to compare against")
+    args = parser.parse_args()
+
+    scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = set(scenarios) - set(SCENARIO_NAMES)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    rows = parse_rows(args.rows)
+    seed = DATA_DIR / f"seed_{rows}.db"
+    # Scenarios insert checkouts and complete them, so every run gets its own copy of the
+    # seed (on the same disk, so timings match) and runs and branches start from the same data
+    DATA_DIR.mkdir(parents=True, exist_ok=True)
+    run_dir = Path(tempfile.mkdtemp(prefix="run_", dir=DATA_DIR))
+    database = run_dir / seed.name
+
+    # Configure the app before backend is first imported (seeding, in-process) or spawned (uvicorn)
+    os.environ.update({
+        "DATABASE_URL": f"sqlite:///{database}",
+        "WHOP_WEBHOOK_SECRET": WEBHOOK_SECRET,
+        "WHOP_CHECKOUT_LINK": "plan_bench",
+        "WHOP_PLAN_ID": "plan_bench",
+        "RATE_LIMIT_ENABLED": "false",
+    })
+
+    try:
+        if not seed.exists():
+            print(f"Seeding {rows:,} transactions into {seed} ...")
+            stats = bulk_load(str(seed), rows, workers=os.cpu_count() or 1)
+            print(f"Seeded in {stats['total_seconds']:.1f}s ({stats['rows_per_second']:,.0f} rows/s)")
+        shutil.copyfile(seed, database)
+        context = ScenarioContext(str(database), rows)
+        results = asyncio.run(run_suite(args, context, scenarios))
+    finally:
+        shutil.rmtree(run_dir, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "git_revision": git_revision(),
+            "rows": rows,
+            "target": args.target,
+            "workers": args.workers if args.target == "uvicorn" else 0,
+            "concurrency": args.concurrency,
+            "python": platform.python_version(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "scenarios": results,
+    }
+    if args.save:
+        Path(args.save).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.save).write_text(json.dumps(report, indent=2))
+        print(f"\nSaved results to {args.save}")
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Measure webhook throughput with application logging off, written
+synchronously by the request, and handed to the background queue.
+
+Each mode runs in a fresh interpreter against its own SQLite file and sends
+the same webhook mix through the in-process ASGI app: payment_succeeded for
+seeded pending checkouts (a DB write and an INFO record each) interleaved
+with the noisy payment_pending and membership_went_invalid events that
+LOG_SAMPLE_RATES thins out. Records go to a JSON-lines file. Modes alternate
+over --rounds and the best round of each is reported, since the SQLite
+commits dominate and drift between runs.
+
+Against a fast local file the writer thread only moves the formatting off
+the request (and competes with it for the GIL); the queue earns its keep when
+the sink stalls. --sink-delay-ms adds that much latency to every write of the
+log stream, like a slow disk or a stderr pipe the collector isn't draining.
+
+    python -m benchmarks.logging_overhead --requests 2000 --rounds 3
+    python -m benchmarks.logging_overhead --requests 2000 --sink-delay-ms 1
+"""
+
+import argparse
+import asyncio
+import hashlib
+import hmac
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+WEBHOOK_SECRET = "whsec_benchmark"
+
+# mode -> environment; "off" keeps only warnings, "sync" writes each record in the request
+MODES = {
+    "off": {"LOG_LEVEL": "WARNING"},
+    "sync": {"LOG_QUEUE_ENABLED": "false", "LOG_SAMPLE_RATES": ""},
+    "queue": {"LOG_QUEUE_ENABLED": "true", "LOG_SAMPLE_RATES": ""},
+    "queue+sampled": {"LOG_QUEUE_ENABLED": "true"},
+}
+
+
+def _webhook(i: int) -> bytes:
+    if i % 3 == 0:
+        payload = {"type": "payment_succeeded", "data": {
+            "id": f"pay_bench_{i}", "amount": 500, "metadata": {"checkout_reference": f"chk_bench_{i}"},
+            "customer": {"email": f"log{i}@example.com", "name": f"Log {i}"},
+        }}
+    elif i % 3 == 1:
+        payload = {"type": "payment_pending", "data": {"id": f"pay_pending_{i}", "amount": 500}}
+    else:
+        payload = {"type": "membership_went_invalid", "data": {"id": f"mem_{i}"}}
+    return json.dumps(payload).encode()
+
+
+class SlowStream:
+    """Log stream whose writes block for ``delay`` seconds"""
+
+    def __init__(self, stream, delay: float):
+        self.stream = stream
+        self.delay = delay
+
+    def write(self, text: str):
+        time.sleep(self.delay)
+        return self.stream.write(text)
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+async def _drive(requests: int, concurrency: int, sink_delay: float) -> dict:
+    import httpx
+    from backend.main import app
+    from backend.database import init_db, SessionLocal
+    from backend.models import Transaction
+    from backend.services.structured_logging import log_records_discarded, logging_setup
+
+    init_db()
+    db = SessionLocal()
+    db.add_all([
+        Transaction(plan_id="plan_bench", checkout_link="plan_bench", amount=5.0, status="pending",
+                    user_id=f"user_log_{i}", checkout_reference=f"chk_bench_{i}")
+        for i in range(0, requests, 3)
+    ])
+    db.commit()
+    db.close()
+
+    bodies = [_webhook(i) for i in range(requests)]
+    next_index = iter(range(requests))
+    errors = 0
+
+    async def client_loop(client):
+        nonlocal errors
+        for i in next_index:
+            signature = hmac.new(WEBHOOK_SECRET.encode(), bodies[i], hashlib.sha256).hexdigest()
+            response = await client.post("/api/webhooks/whop", content=bodies[i], headers={
+                "content-type": "application/json", "x-whop-signature": signature,
+            })
+            if response.status_code != 200:
+                errors += 1
+
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        if sink_delay:
+            output = logging_setup.writer.handler if logging_setup.writer else logging_setup.handler
+            output.stream = SlowStream(output.stream, sink_delay)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            start = time.perf_counter()
+            await asyncio.gather(*(client_loop(client) for _ in range(concurrency)))
+            elapsed = time.perf_counter() - start
+    return {"elapsed": elapsed, "errors": errors, "discarded": {
+        labels[0]: value for labels, value in log_records_discarded._values.items()
+    }}
+
+
+def run_mode(mode: str, args: argparse.Namespace, directory: str) -> dict:
+    log_file = Path(directory) / f"{mode}.jsonl"
+    database = Path(directory) / f"{mode}.db"
+    for path in (log_file, database):
+        if path.exists():
+            path.unlink()
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{database}", LOG_FILE=str(log_file),
+               WHOP_WEBHOOK_SECRET=WEBHOOK_SECRET, RATE_LIMIT_ENABLED="false", **MODES[mode])
+    output = subprocess.run(
+        [sys.executable, "-m", "benchmarks.logging_overhead", "--worker", "--requests", str(args.requests),
+         "--concurrency", str(args.concurrency), "--sink-delay-ms", str(args.sink_delay_ms)],
+        cwd=PROJECT_ROOT, env=env, check=True, capture_output=True, text=True
+    ).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    result["lines"] = sum(1 for _ in open(log_file)) if log_file.exists() else 0
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--sink-delay-ms", type=float, default=0)
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(asyncio.run(_drive(args.requests, args.concurrency, args.sink_delay_ms / 1000))))
+        return
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for _ in range(args.rounds):
+            for mode in MODES:
+                result = run_mode(mode, args, tmp)
+                if mode not in results or result["elapsed"] < results[mode]["elapsed"]:
+                    results[mode] = result
+
+    baseline = results["off"]["elapsed"]
+    for mode, result in results.items():
+        overhead = (result["elapsed"] - baseline) / baseline * 100
+        print(f"{mode:<14} {args.requests / result['elapsed']:>7,.0f} webhooks/s  overhead {overhead:+6.1f}%  "
+              f"lines {result['lines']:>6}  discarded {result['discarded']}  errors {result['errors']}")
+
+
+if __name__ == "__main__":
+    main()
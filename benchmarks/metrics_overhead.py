@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Measure the request overhead of the Prometheus instrumentation.
+
+Runs the same in-process request mix against the ASGI app with
+METRICS_ENABLED=true and =false (each in a fresh interpreter, since the
+middleware and engine listeners are attached at import time), alternating
+rounds and comparing the best round of each. Exits non-zero when the
+overhead exceeds the budget.
+
+    python -m benchmarks.metrics_overhead --requests 2000 --rounds 5
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+
+async def _drive(requests: int) -> float:
+    """Send ``requests`` requests through the app and return elapsed seconds"""
+    import httpx
+    from backend.main import app
+    from backend.database import init_db, SessionLocal
+    from backend.models import Transaction
+
+    init_db()
+    db = SessionLocal()
+    if db.query(Transaction).count() == 0:
+        db.add_all([
+            Transaction(plan_id="plan_bench", checkout_link="plan_bench", amount=5.0,
+                        status="completed" if i % 3 else "pending", user_id=f"user_{i:08x}")
+            for i in range(500)
+        ])
+        db.commit()
+    db.close()
+
+    paths = ["/api/transactions/1", "/api/transactions/?limit=20", "/api/admin/payment-status/2", "/payment/cancel"]
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for path in paths:  # warm-up
+            await client.get(path)
+        start = time.perf_counter()
+        for i in range(requests):
+            response = await client.get(paths[i % len(paths)])
+            assert response.status_code == 200, response.status_code
+        return time.perf_counter() - start
+
+
+def run_worker(requests: int):
+    elapsed = asyncio.run(_drive(requests))
+    print(json.dumps({"elapsed": elapsed}))
+
+
+def run_round(enabled: bool, requests: int, database_url: str) -> float:
+    env = dict(os.environ, METRICS_ENABLED="true" if enabled else "false", DATABASE_URL=database_url,
+               RATE_LIMIT_ENABLED="false")
+    output = subprocess.run(
+        [sys.executable, "-m", "benchmarks.metrics_overhead", "--worker", "--requests", str(requests)],
+        cwd=PROJECT_ROOT, env=env, check=True, capture_output=True, text=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])["elapsed"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--budget", type=float, default=2.0, help="maximum overhead in percent")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.requests)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database_url = f"sqlite:///{tmp}/metrics_bench.db"
+        timings = {True: [], False: []}
+        for round_number in range(args.rounds):
+            for enabled in (False, True):
+                timings[enabled].append(run_round(enabled, args.requests, database_url))
+            print(f"round {round_number + 1}: off={timings[False][-1]:.3f}s on={timings[True][-1]:.3f}s")
+
+    baseline, instrumented = min(timings[False]), min(timings[True])
+    overhead = (instrumented - baseline) / baseline * 100
+    print(f"metrics off: {args.requests / baseline:,.0f} req/s")
+    print(f"metrics on:  {args.requests / instrumented:,.0f} req/s")
+    print(f"overhead:    {overhead:+.2f}% (budget {args.budget:.1f}%)")
+    sys.exit(0 if overhead <= args.budget else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Memory per cached transaction: ORM instances vs. dict snapshots vs. TransactionSnapshot.
+
+Seeds a throwaway SQLite file with completed transactions carrying a
+realistic ``extra_data`` (the stored webhook, payment and customer payloads)
+and measures, with tracemalloc, what holding N of them costs in each form:
+
+  orm          Transaction instances kept in their session (identity map,
+               instance state and the full extra_data string)
+  dict         the previous cache entries: a snapshot dict of ISO strings plus
+               a separately cached receipt dict, each with its own headers
+  snapshot     the current cache entry: headers plus one TransactionSnapshot
+
+Also reports the size per entry the redis backend stores and
+build time per row (for orm that includes running its query).
+
+    python -m benchmarks.snapshot_memory --rows 20000
+"""
+
+import argparse
+import gc
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+
+def _extra_data(i: int) -> str:
+    customer = {"id": f"user_{i:08d}", "email": f"buyer{i}@example.com", "name": f"Buyer {i}", "username": f"buyer{i}"}
+    payment = {
+        "id": f"pay_{i:012d}", "amount": 500, "currency": "usd", "status": "paid", "invoice_id": f"inv_{i:010d}",
+        "plan_id": "plan_bench", "created_at": 1760000000 + i, "customer": customer,
+        "metadata": {"checkout_reference": f"chk_{i:032x}", "user_id": f"user_{i:08d}", "source": "cerebra_app"},
+    }
+    return json.dumps({
+        "user_fingerprint": f"{i:064x}",
+        "user_agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 Version/17.0 Safari/605.1.15",
+        "webhook_data": {"type": "payment_succeeded", "data": payment},
+        "payment_data": payment,
+        "customer_data": customer,
+        "whop_payment_id": payment["id"],
+        "whop_invoice_id": payment["invoice_id"],
+    })
+
+
+def _measure(build):
+    """Bytes still allocated after ``build()`` returns, and its wall time (timed without tracemalloc)"""
+    start = time.perf_counter()
+    discard = build()
+    elapsed = time.perf_counter() - start
+    if isinstance(discard, tuple):
+        discard[0].close()
+    del discard
+    gc.collect()
+    tracemalloc.start()
+    kept = build()
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return kept, size, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=20000)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    os.environ["DATABASE_URL"] = f"sqlite:///{tmp}/snapshots.db"
+    sys.path.insert(0, str(PROJECT_ROOT))
+    from backend.database import init_db, SessionLocal
+    from backend.models import Transaction, TransactionSnapshot, SNAPSHOT_COLUMNS
+    from backend.api.routes import transaction_cache_headers
+    from backend.services.invoice_service import invoice_service
+    from backend.services.cache import RedisCacheBackend
+
+    init_db()
+    db = SessionLocal()
+    db.add_all([
+        Transaction(plan_id="plan_bench", checkout_link="plan_bench", amount=5.0, status="completed",
+                    customer_email=f"buyer{i}@example.com", customer_name=f"Buyer {i}", user_id=f"user_{i:08d}",
+                    session_id=f"{i:032x}", ip_address="203.0.113.7", whop_checkout_url=f"https://whop.com/checkout/{i}",
+                    webhook_received=True, completed_at=datetime(2026, 1, 1), extra_data=_extra_data(i))
+        for i in range(args.rows)
+    ])
+    db.commit()
+    db.close()
+
+    db = SessionLocal()
+    rows = db.query(*SNAPSHOT_COLUMNS).all()
+    db.close()
+
+    def headers(transaction):
+        return transaction_cache_headers(transaction.id, transaction.updated_at, transaction.created_at, transaction.status)
+
+    def orm():
+        session = SessionLocal()
+        return session, session.query(Transaction).all()
+
+    def dicts():
+        entries = []
+        for row in rows:
+            snapshot = TransactionSnapshot.from_row(row)
+            entries.append((
+                {"headers": headers(snapshot), "transaction": {
+                    column.key: value.isoformat() if isinstance(value, datetime) else value
+                    for column, value in zip(SNAPSHOT_COLUMNS[:-1], row)
+                }},
+                {"headers": headers(snapshot), "receipt": invoice_service.get_receipt_data(snapshot)},
+            ))
+        return entries
+
+    def snapshots():
+        entries = []
+        for row in rows:
+            snapshot = TransactionSnapshot.from_row(row)
+            entries.append({"headers": headers(snapshot), "transaction": snapshot})
+        return entries
+
+    results = {}
+    for name, build in (("orm", orm), ("dict", dicts), ("snapshot", snapshots)):
+        kept, size, elapsed = _measure(build)
+        entries = kept[1] if name == "orm" else kept
+        stored = len(RedisCacheBackend.encode(entries[0])) if name != "orm" else None
+        results[name] = (size / args.rows, elapsed / args.rows * 1e6, stored)
+        if name == "orm":
+            kept[0].close()
+        del kept, entries
+
+    print(f"{args.rows:,} completed transactions, extra_data ~{len(_extra_data(0)):,} bytes each")
+    for name, (per_entry, build_us, stored) in results.items():
+        stored_text = f"{stored:>6,} B in redis" if stored else "      n/a in redis"
+        print(f"{name:<9} {per_entry:>8,.0f} B/transaction  {stored_text}  {build_us:>6.1f} us/row to build")
+
+
+if __name__ == "__main__":
+    main()
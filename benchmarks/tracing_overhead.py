@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Measure what request tracing costs.
+
+Each mode runs in a fresh interpreter against its own seeded SQLite file and
+sends the same mix through the in-process ASGI app: status polls, the
+transaction listing, the admin dashboard (a template render) and invoice
+data. Modes:
+
+  off        TRACING_ENABLED=false
+  dropped    tracing on, every trace recorded and discarded by the tail sampler
+  jsonl      tracing on, every trace kept and appended to a JSONL file
+  otlp       tracing on, every trace kept and posted to a stand-in OTLP/HTTP
+             collector run by this script (it only counts what it receives)
+
+    python -m benchmarks.tracing_overhead --requests 3000 --rounds 3
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+SEEDED = 200
+
+MODES = {
+    "off": {"TRACING_ENABLED": "false"},
+    "dropped": {"TRACING_ENABLED": "true", "TRACE_SLOW_MS": "60000"},
+    "jsonl": {"TRACING_ENABLED": "true", "TRACE_SLOW_MS": "0", "TRACE_EXPORTER": "jsonl"},
+    "otlp": {"TRACING_ENABLED": "true", "TRACE_SLOW_MS": "0", "TRACE_EXPORTER": "otlp"},
+}
+
+
+class StandInCollector(BaseHTTPRequestHandler):
+    """Accepts OTLP/HTTP JSON exports and counts their spans"""
+
+    spans = 0
+    requests = 0
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        StandInCollector.requests += 1
+        StandInCollector.spans += sum(
+            len(scope["spans"]) for resource in body["resourceSpans"] for scope in resource["scopeSpans"]
+        )
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.end_headers()
+        self.wfile.write(b"{}")
+
+    def log_message(self, format, *args):
+        pass
+
+
+async def _drive(requests: int, concurrency: int) -> dict:
+    import httpx
+    from backend.main import app
+    from backend.database import init_db, SessionLocal
+    from backend.models import Transaction
+    from backend.services.tracing import traces_total
+
+    init_db()
+    db = SessionLocal()
+    db.add_all([
+        Transaction(plan_id="plan_bench", checkout_link="plan_bench", amount=5.0,
+                    status="completed" if i % 2 else "pending", user_id=f"user_trace_{i}",
+                    customer_email=f"trace{i}@example.com", extra_data=json.dumps({"webhook_data": {"id": i}}))
+        for i in range(SEEDED)
+    ])
+    db.commit()
+    db.close()
+
+    paths = []
+    for i in range(requests):
+        kind = i % 4
+        if kind == 0:
+            paths.append(f"/api/transactions/{i % SEEDED + 1}")
+        elif kind == 1:
+            paths.append("/api/transactions/?limit=20")
+        elif kind == 2:
+            paths.append("/admin")
+        else:
+            paths.append(f"/api/invoice/{(i % (SEEDED // 2)) * 2 + 2}")
+    next_index = iter(range(requests))
+    errors = 0
+
+    async def client_loop(client):
+        nonlocal errors
+        for i in next_index:
+            response = await client.get(paths[i])
+            if response.status_code != 200:
+                errors += 1
+
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            start = time.perf_counter()
+            await asyncio.gather(*(client_loop(client) for _ in range(concurrency)))
+            elapsed = time.perf_counter() - start
+    return {"elapsed": elapsed, "errors": errors, "traces": {
+        labels[0]: value for labels, value in traces_total._values.items()
+    }}
+
+
+def run_mode(mode: str, args: argparse.Namespace, directory: str, collector_url: str) -> dict:
+    trace_file = Path(directory) / f"{mode}.jsonl"
+    database = Path(directory) / f"{mode}.db"
+    for path in (trace_file, database):
+        if path.exists():
+            path.unlink()
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{database}", TRACE_FILE=str(trace_file),
+               TRACE_OTLP_ENDPOINT=collector_url, RATE_LIMIT_ENABLED="false", LOG_LEVEL="WARNING",
+               CACHE_ENABLED="false", **MODES[mode])
+    output = subprocess.run(
+        [sys.executable, "-m", "benchmarks.tracing_overhead", "--worker",
+         "--requests", str(args.requests), "--concurrency", str(args.concurrency)],
+        cwd=PROJECT_ROOT, env=env, check=True, capture_output=True, text=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=3000)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(asyncio.run(_drive(args.requests, args.concurrency))))
+        return
+
+    collector = ThreadingHTTPServer(("127.0.0.1", 0), StandInCollector)
+    threading.Thread(target=collector.serve_forever, daemon=True).start()
+    collector_url = f"http://127.0.0.1:{collector.server_address[1]}/v1/traces"
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for _ in range(args.rounds):
+            for mode in MODES:
+                result = run_mode(mode, args, tmp, collector_url)
+                if mode not in results or result["elapsed"] < results[mode]["elapsed"]:
+                    results[mode] = result
+    collector.shutdown()
+
+    baseline = results["off"]["elapsed"]
+    for mode, result in results.items():
+        overhead = (result["elapsed"] - baseline) / baseline * 100
+        print(f"{mode:<8} {args.requests / result['elapsed']:>7,.0f} req/s  overhead {overhead:+6.1f}%  "
+              f"traces {result['traces']}  errors {result['errors']}")
+    print(f"stand-in collector: {StandInCollector.spans} spans in {StandInCollector.requests} exports")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+function refreshTransactions() {
+    location.reload();
+}
+
+function viewTransaction(transactionId) {
+    // Implement transaction details modal or redirect
+    alert(`View transaction ${transactionId} details`);
+}
+
+async function runBulkOperation(body) {
+    // Bulk operations run in the background; poll the job until it finishes
+    const response = await fetch('/api/admin/bulk', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify(body)
+    });
+    let job = await response.json();
+    if (!response.ok) {
+        throw new Error(job.detail || 'Bulk operation failed');
+    }
+    while (job.status === 'running') {
+        await new Promise(resolve => setTimeout(resolve, 500));
+        job = await (await fetch(`/api/admin/bulk/${job.id}`)).json();
+    }
+    if (job.status === 'failed') {
+        throw new Error(job.error || 'Bulk operation failed');
+    }
+    return job;
+}
+
+async function retryTransaction(transactionId) {
+    if (confirm('Are you sure you want to retry this transaction?')) {
+        try {
+            const job = await runBulkOperation({ operation: 'retry', ids: [transactionId] });
+            if (job.affected) {
+                location.reload();
+            } else {
+                alert(`Transaction ${transactionId} could not be reopened - it has changed or this customer already has an open checkout.`);
+            }
+        } catch (error) {
+            alert(`Retry failed: ${error.message}`);
+        }
+    }
+}
+
+function escapeHtml(value) {
+    const div = document.createElement('div');
+    div.textContent = value == null ? 'N/A' : String(value);
+    return div.innerHTML;
+}
+
+async function searchTransactions(event, offset = 0) {
+    if (event) {
+        event.preventDefault();
+    }
+    const query = document.getElementById('searchQuery').value.trim();
+    const container = document.getElementById('searchResults');
+    if (!query) {
+        container.style.display = 'none';
+        return;
+    }
+    const response = await fetch(`/api/admin/search?q=${encodeURIComponent(query)}&limit=20&offset=${offset}`);
+    const data = await response.json();
+    container.style.display = 'block';
+    if (!response.ok) {
+        container.innerHTML = `<div class="alert alert-warning mb-0">${escapeHtml(data.detail)}</div>`;
+        return;
+    }
+    const rows = data.results.map(t => `
+        <tr>
+            <td><strong>#${t.id}</strong></td>
+            <td>${escapeHtml(t.customer_name)}<br><small class="text-muted">${escapeHtml(t.customer_email)}</small></td>
+            <td><small class="text-muted">${escapeHtml(t.user_id)}</small></td>
+            <td><small class="text-muted">${escapeHtml(t.whop_payment_id)}</small></td>
+            <td>${escapeHtml(t.status)}</td>
+            <td>$${Number(t.amount).toFixed(2)}</td>
+        </tr>`).join('');
+    const pager = `
+        <button class="btn btn-sm btn-outline-secondary" ${offset === 0 ? 'disabled' : ''}
+            onclick="searchTransactions(null, ${Math.max(offset - 20, 0)})">Previous</button>
+        <button class="btn btn-sm btn-outline-secondary" ${data.has_more ? '' : 'disabled'}
+            onclick="searchTransactions(null, ${offset + 20})">Next</button>`;
+    container.innerHTML = `
+        <div class="d-flex justify-content-between align-items-center mb-2">
+            <small class="text-muted">${data.matches}${data.truncated ? '+' : ''} matches in ${data.took_ms} ms</small>
+            <div>${pager}</div>
+        </div>
+        <table class="table table-sm table-hover bg-white mb-0">
+            <thead><tr><th>ID</th><th>Customer</th><th>User ID</th><th>Payment ID</th><th>Status</th><th>Amount</th></tr></thead>
+            <tbody>${rows || '<tr><td colspan="6" class="text-center text-muted">No matches</td></tr>'}</tbody>
+        </table>`;
+}
+
+// Plan management functions removed - using single plan configuration
+
+// Auto-refresh every 30 seconds
+setInterval(function() {
+    // Only refresh if no user interaction
+    if (document.visibilityState === 'visible') {
+        location.reload();
+    }
+}, 30000);
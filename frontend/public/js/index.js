@@ -0,0 +1,155 @@
+async function initiateCheckout() {
+    const button = document.querySelector('.btn-checkout');
+    const btnText = button.querySelector('.btn-text');
+    const loading = button.querySelector('.loading');
+
+    // Show loading state
+    btnText.style.display = 'none';
+    loading.style.display = 'inline';
+    button.disabled = true;
+
+    try {
+        // Create checkout record and get URL
+        const response = await fetch('/api/create-cerebra-checkout', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify({
+                plan_id: window.WHOP_PLAN_ID || 'your_plan_id_here',
+                amount: parseFloat(window.PRODUCT_PRICE || '5.00'),
+                customer_email: null,
+                customer_name: null,
+                metadata: {
+                    plan_name: 'Premium Access',
+                    tier: 'premium'
+                }
+            })
+        });
+
+        if (!response.ok) {
+            const errorData = await response.json();
+            throw new Error(errorData.detail || 'Failed to create checkout');
+        }
+
+        const data = await response.json();
+
+        if (data.checkout_url) {
+            // The success page waits for this transaction's webhook instead of guessing
+            sessionStorage.setItem('cerebraTransactionId', data.transaction_id);
+
+            // Option 1: Direct redirect to Whop checkout (current method)
+            window.location.href = data.checkout_url;
+
+            // Option 2: Use Whop embed (uncomment to use instead)
+            // showWhopEmbed(data.checkout_url, data.transaction_id);
+        } else {
+            throw new Error('No checkout URL received');
+        }
+
+    } catch (error) {
+        console.error('Checkout error:', error);
+        showToast(error.message || 'Payment initialization failed. Please try again.', 'error');
+
+        // Reset button state
+        btnText.style.display = 'inline';
+        loading.style.display = 'none';
+        button.disabled = false;
+    }
+}
+
+// Optional: Whop Embed Function (if you prefer embedded checkout)
+// Uncomment and use this instead of redirect for embedded experience
+/*
+function showWhopEmbed(checkoutUrl, transactionId) {
+    // Load Whop embed script if not already loaded
+    if (!window.Whop) {
+        const script = document.createElement('script');
+        script.src = 'https://embed.whop.com/sdk.js';
+        script.onload = () => initializeEmbed(checkoutUrl, transactionId);
+        document.head.appendChild(script);
+    } else {
+        initializeEmbed(checkoutUrl, transactionId);
+    }
+}
+
+// Resolves with the status once the webhook has moved the transaction off pending
+async function waitForPayment(transactionId) {
+    while (true) {
+        const response = await fetch(`/api/transactions/${transactionId}/wait?status=pending`);
+        if (!response.ok) throw new Error('Payment status unavailable');
+        const result = await response.json();
+        if (result.changed) return result.status;
+    }
+}
+
+function initializeEmbed(checkoutUrl, transactionId) {
+    // Create embed container
+    const embedContainer = document.createElement('div');
+    embedContainer.id = 'whop-embed-container';
+    embedContainer.style.cssText = `
+        position: fixed; top: 0; left: 0; width: 100%; height: 100%;
+        background: rgba(0, 0, 0, 0.8); z-index: 10000;
+        display: flex; justify-content: center; align-items: center;
+    `;
+
+    const embedDiv = document.createElement('div');
+    embedDiv.id = 'whop-embed';
+    embedDiv.style.cssText = `
+        width: 90%; max-width: 500px; height: 80%;
+        background: white; border-radius: 10px; position: relative;
+    `;
+
+    embedContainer.appendChild(embedDiv);
+    document.body.appendChild(embedContainer);
+
+    // Initialize Whop embed
+    window.Whop.embed({
+        element: embedDiv,
+        checkoutUrl: checkoutUrl,
+        onSuccess: async () => {
+            showToast('Confirming your payment...', 'info');
+            // Redirect as soon as our webhook has recorded the payment
+            const status = await waitForPayment(transactionId);
+            if (status === 'completed') {
+                window.location.href = `/payment/success?transaction_id=${transactionId}`;
+            } else {
+                showToast('Payment failed. Please try again.', 'error');
+                document.body.removeChild(embedContainer);
+            }
+        },
+        onError: (error) => {
+            showToast('Payment failed. Please try again.', 'error');
+            document.body.removeChild(embedContainer);
+        }
+    });
+}
+*/
+
+function showToast(message, type = 'info') {
+    const toast = document.getElementById('paymentToast');
+    const toastMessage = document.getElementById('toastMessage');
+
+    toastMessage.textContent = message;
+
+    // Update toast styling based on type
+    const toastHeader = toast.querySelector('.toast-header');
+    const icon = toastHeader.querySelector('i');
+
+    if (type === 'error') {
+        icon.className = 'fas fa-exclamation-triangle text-danger me-2';
+    } else if (type === 'success') {
+        icon.className = 'fas fa-check-circle text-success me-2';
+    } else {
+        icon.className = 'fas fa-info-circle text-primary me-2';
+    }
+
+    const bsToast = new bootstrap.Toast(toast);
+    bsToast.show();
+}
+
+// Add fade-in animation
+document.addEventListener('DOMContentLoaded', function() {
+    const card = document.querySelector('.checkout-card');
+    card.style.animationDelay = '0.2s';
+});
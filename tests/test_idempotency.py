@@ -0,0 +1,86 @@
+import json
+
+import httpx
+import pytest
+
+from sqlalchemy import delete
+
+from backend.database import SessionLocal, init_db
+from backend.models import IdempotencyKey
+from backend.services.idempotency import IdempotencyMiddleware, IdempotencyStore
+from backend.services.user_tracking import SessionCookieMiddleware
+
+
+@pytest.fixture
+def client(monkeypatch):
+    """The middleware stack main.py builds, around an endpoint that counts its calls"""
+    monkeypatch.setenv("SECRET_KEY", "test-secret")
+    init_db()
+    with SessionLocal() as db:
+        db.execute(delete(IdempotencyKey))
+        db.commit()
+    calls = []
+
+    async def checkout(scope, receive, send):
+        if scope["path"] != "/api/create-cerebra-checkout":
+            # Any other page: just hands out the session cookie
+            await send({"type": "http.response.start", "status": 204, "headers": []})
+            await send({"type": "http.response.body", "body": b""})
+            return
+        calls.append(scope["state"]["session"]["session_id"])
+        body = json.dumps({"transaction_id": len(calls)}).encode()
+        await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"application/json")]})
+        await send({"type": "http.response.body", "body": body})
+
+    store = IdempotencyStore()
+    store.paths = ("/api/create-cerebra-checkout",)
+    app = SessionCookieMiddleware(IdempotencyMiddleware(checkout, store=store))
+    transport = httpx.ASGITransport(app=app)
+
+    def make():
+        return httpx.AsyncClient(transport=transport, base_url="http://test")
+
+    make.calls = calls
+    return make
+
+
+async def post(client, key):
+    return await client.post("/api/create-cerebra-checkout", json={"amount": 5.0}, headers={"Idempotency-Key": key})
+
+
+@pytest.mark.anyio
+async def test_retry_from_the_same_browser_is_replayed(client):
+    async with client() as browser:
+        await browser.get("/")
+        first = await post(browser, "key-1")
+        retry = await post(browser, "key-1")
+
+    assert retry.json() == first.json()
+    assert retry.headers["idempotent-replayed"] == "true"
+    assert len(client.calls) == 1
+
+
+@pytest.mark.anyio
+async def test_same_key_from_another_browser_is_not_replayed(client):
+    async with client() as first_browser, client() as second_browser:
+        await first_browser.get("/")
+        await second_browser.get("/")
+        first = await post(first_browser, "shared-key")
+        second = await post(second_browser, "shared-key")
+
+    assert first.json() == {"transaction_id": 1}
+    assert second.json() == {"transaction_id": 2}
+    assert "idempotent-replayed" not in second.headers
+    assert len(set(client.calls)) == 2
+
+
+@pytest.mark.anyio
+async def test_retry_without_a_cookie_is_replayed(client):
+    # An API client keeping no cookies: each attempt is issued a new session
+    async with client() as first_attempt, client() as retry_attempt:
+        first = await post(first_attempt, "key-1")
+        retry = await post(retry_attempt, "key-1")
+
+    assert retry.json() == first.json()
+    assert retry.headers["idempotent-replayed"] == "true"
+    assert len(client.calls) == 1
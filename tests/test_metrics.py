@@ -0,0 +1,67 @@
+import sys
+import threading
+
+from sqlalchemy import create_engine, text
+
+from backend.services.metrics import Counter, Gauge, Histogram, db_pool_checkout_wait, instrument_engine, metrics
+
+
+def hammer(update, threads=8, per_thread=20000):
+    def run():
+        for _ in range(per_thread):
+            update()
+
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        workers = [threading.Thread(target=run) for _ in range(threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+    finally:
+        sys.setswitchinterval(interval)
+    return threads * per_thread
+
+
+def test_concurrent_updates_are_not_lost():
+    counter = Counter("test_total", "test")
+    gauge = Gauge("test_gauge", "test")
+    histogram = Histogram("test_seconds", "test")
+
+    def update():
+        counter.inc("a")
+        gauge.dec("a")
+        histogram.observe(0.001)
+
+    total = hammer(update)
+    assert counter._values[("a",)] == total
+    assert gauge._values[("a",)] == -total
+    assert histogram._series[()][0] == total
+
+
+def checkout_count():
+    # Every bucket slot (the last item of a series is its sum)
+    return sum(sum(series[:-1]) for series in db_pool_checkout_wait._series.values())
+
+
+def test_pool_metrics_follow_a_disposed_pool(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'pool.db'}")
+    registered = len(metrics._metrics)
+    instrument_engine(engine)
+    gauges = metrics._metrics[registered:]
+    try:
+        before = checkout_count()
+        with engine.connect() as connection:
+            connection.execute(text("SELECT 1"))
+        assert checkout_count() == before + 1
+
+        engine.dispose()
+        with engine.connect() as connection:
+            connection.execute(text("SELECT 1"))
+            checked_out = next(gauge for gauge in gauges if gauge.name == "db_pool_checked_out")
+            assert checked_out.samples() == ["db_pool_checked_out 1"]
+        assert checkout_count() == before + 2
+    finally:
+        del metrics._metrics[registered:]
+        engine.dispose()
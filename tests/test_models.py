@@ -0,0 +1,28 @@
+import json
+
+from backend.models import TransactionSnapshot
+from backend.services.tracing import tracer
+
+
+def row(extra_data):
+    values = [None] * len(TransactionSnapshot.FIELDS)
+    values[0] = 1
+    return (*values, extra_data)
+
+
+def test_extra_data_parse_is_traced():
+    root = tracer.start_trace("GET /api/transactions/1")
+    try:
+        parsed = TransactionSnapshot.from_row(row(json.dumps({"whop_payment_id": "pay_1"})))
+        broken = TransactionSnapshot.from_row(row("{not json"))
+        TransactionSnapshot.from_row(row(None))
+    finally:
+        root.end()
+
+    assert parsed.payment_id == "pay_1"
+    assert broken.payment_id is None
+    spans = [span for span in root.trace.spans if span.name == "snapshot.parse_extra_data"]
+    assert len(spans) == 2
+    assert all(span.parent_id == root.span_id for span in spans)
+    assert spans[0].error is None
+    assert spans[1].error.startswith("JSONDecodeError")
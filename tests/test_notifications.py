@@ -0,0 +1,90 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+from sqlalchemy import update
+
+from backend.database import SessionLocal, engine, init_db
+from backend.models import Transaction
+from backend.services.cache import cache
+from backend.services.notifications import ChangeNotifier, change_notifier
+
+
+@pytest.mark.anyio
+async def test_probe_wakes_waiters_without_a_bus(monkeypatch):
+    monkeypatch.setattr(cache, "enabled", False)
+    statuses = {"1": "pending", "2": "pending"}
+    notifier = ChangeNotifier()
+    notifier.poll_interval = 0.01
+    notifier.register_probe("transactions", lambda keys: {key: statuses[key] for key in keys})
+
+    first = notifier.subscribe("transactions", 1)
+    second = notifier.subscribe("transactions", 2)
+    notifier.seen("transactions", 1, "pending")
+    notifier.seen("transactions", 2, "pending")
+    statuses["1"] = "completed"
+
+    assert await notifier.wait(first, 1)
+    assert not await notifier.wait(second, 0.05)
+    notifier.unsubscribe("transactions", 1, first)
+    notifier.unsubscribe("transactions", 2, second)
+
+
+@pytest.fixture
+def app(monkeypatch):
+    """The application with no invalidation bus, as with CACHE_BACKEND=redis"""
+    from backend.main import app
+
+    init_db()
+    monkeypatch.setattr(cache, "enabled", False)
+    monkeypatch.setattr(change_notifier, "poll_interval", 0.01)
+    db = SessionLocal()
+    transaction = Transaction(plan_id="plan_test", checkout_link="plan_test", amount=5.0, status="pending")
+    db.add(transaction)
+    db.commit()
+    app.state.transaction_id = transaction.id
+    db.close()
+    return app
+
+
+def complete_elsewhere(transaction_id):
+    """A webhook handled by another worker: no listener in this process hears the commit"""
+    with engine.begin() as connection:
+        connection.execute(update(Transaction).where(Transaction.id == transaction_id).values(status="completed"))
+
+
+@pytest.mark.anyio
+async def test_wait_sees_a_write_from_another_worker(app):
+    transaction_id = app.state.transaction_id
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        waiting = asyncio.ensure_future(client.get(f"/api/transactions/{transaction_id}/wait?timeout=5"))
+        await asyncio.sleep(0.1)
+        complete_elsewhere(transaction_id)
+        response = await asyncio.wait_for(waiting, 2)
+
+    assert response.json()["status"] == "completed"
+    assert response.json()["changed"] is True
+
+
+@pytest.mark.anyio
+async def test_event_stream_rereads_the_status_on_each_heartbeat(app, monkeypatch):
+    monkeypatch.setattr(change_notifier, "heartbeat_interval", 0.05)
+    monkeypatch.setattr(change_notifier, "stream_timeout", 5)
+    # Only the heartbeat re-read can notice the change
+    monkeypatch.setattr(change_notifier, "_probes", {})
+    transaction_id = app.state.transaction_id
+
+    async def complete_later():
+        await asyncio.sleep(0.2)
+        complete_elsewhere(transaction_id)
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        writer = asyncio.ensure_future(complete_later())
+        # ASGITransport hands over the body once the stream has ended
+        response = await asyncio.wait_for(client.get(f"/api/transactions/{transaction_id}/events"), 3)
+        await writer
+
+    events = [json.loads(line[6:])["status"] for line in response.text.splitlines() if line.startswith("data: ")]
+    assert events == ["pending", "completed"]
+    assert ": keep-alive" in response.text
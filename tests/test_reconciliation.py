@@ -0,0 +1,112 @@
+import pytest
+
+from backend.models import Transaction
+from backend.services.reconciliation import ReconciliationEngine
+from backend.services.whop_service import whop_service
+
+
+def payment(number, status="paid", reference=None, created_at=None):
+    return {
+        "id": f"pay_{number}",
+        "status": status,
+        "created_at": created_at if created_at is not None else 1760000000 + number,
+        "metadata": {"checkout_reference": reference} if reference else {},
+    }
+
+
+@pytest.fixture
+def engine_under_test(monkeypatch, whop):
+    monkeypatch.setattr(whop_service, "api", whop.client())
+    reconciliation = ReconciliationEngine()
+    reconciliation.page_size = 2
+    reconciliation.concurrency = 2
+    return reconciliation
+
+
+def add_transactions(session_factory, *statuses):
+    db = session_factory()
+    db.add_all([
+        Transaction(plan_id="plan_test", checkout_link="plan_test", amount=5.0, status=status,
+                    user_id=f"user_{index}", checkout_reference=f"chk_{index}")
+        for index, status in enumerate(statuses)
+    ])
+    db.commit()
+    db.close()
+
+
+def statuses(session_factory):
+    db = session_factory()
+    try:
+        return {row.checkout_reference: row.status for row in db.query(Transaction.checkout_reference, Transaction.status)}
+    finally:
+        db.close()
+
+
+@pytest.mark.anyio
+async def test_missed_webhooks_are_corrected(engine_under_test, whop, session_factory):
+    add_transactions(session_factory, "pending", "pending", "completed", "expired")
+    whop.payments = [
+        payment(5, "paid", "chk_3"),
+        payment(4, "paid", "chk_2"),
+        payment(3, "failed", "chk_1"),
+        payment(2, "paid", "chk_0"),
+        payment(1, "paid", "chk_unknown"),
+    ]
+
+    report = await engine_under_test.run(session_factory)
+
+    assert statuses(session_factory) == {"chk_0": "completed", "chk_1": "failed", "chk_2": "completed", "chk_3": "completed"}
+    assert report["pages"] == 3
+    # chk_2 was already completed; only its missing payment ID is filled in
+    assert report["corrected"] == 4
+    assert [item["fields"] for item in report["corrections"] if item["to"] == item["from"]] == [["whop_payment_id"]]
+    assert report["unmatched_payments"] == ["pay_1"]
+
+
+@pytest.mark.anyio
+async def test_dry_run_changes_nothing(engine_under_test, whop, session_factory):
+    add_transactions(session_factory, "pending")
+    whop.payments = [payment(1, "paid", "chk_0")]
+
+    report = await engine_under_test.run(session_factory, dry_run=True)
+
+    assert report["corrected"] == 1
+    assert statuses(session_factory) == {"chk_0": "pending"}
+
+
+@pytest.mark.anyio
+async def test_completed_rows_are_never_downgraded(engine_under_test, whop, session_factory):
+    add_transactions(session_factory, "completed", "pending")
+    whop.payments = [payment(2, "failed", "chk_1"), payment(1, "failed", "chk_0")]
+
+    def webhook_lands_between_read_and_write(db, row):
+        # The payment_succeeded webhook for chk_1 commits after reconciliation read it as pending
+        other = session_factory()
+        other.query(Transaction).filter(Transaction.id == row.id).update({"status": "completed"})
+        other.commit()
+        other.close()
+
+    report = await engine_under_test.run(session_factory, invalidate=webhook_lands_between_read_and_write)
+
+    assert statuses(session_factory) == {"chk_0": "completed", "chk_1": "completed"}
+    assert report["conflicts"] == 2
+    assert [item["transaction_id"] for item in report["corrections"]] == [1]  # payment ID only
+    assert {item["local_status"] for item in report["conflicting_payments"]} == {"completed"}
+
+
+@pytest.mark.anyio
+async def test_incremental_run_stops_at_the_high_water_mark(engine_under_test, whop, session_factory):
+    engine_under_test.overlap = 0
+    add_transactions(session_factory, "pending", "pending")
+    whop.payments = [payment(number, "paid", f"chk_{number}") for number in range(10, 0, -1)]
+    first = await engine_under_test.run(session_factory)
+    assert first["pages"] == 5
+
+    whop.payments.insert(0, payment(11, "paid", "chk_0"))
+    second = await engine_under_test.run(session_factory)
+
+    assert second["incremental"] is True
+    # Page 1 and the window of pages fetched alongside it, instead of all five
+    assert second["pages"] == 3
+    assert second["high_water_mark"] == 1760000011
+    assert statuses(session_factory)["chk_0"] == "completed"
@@ -0,0 +1,64 @@
+import sqlite3
+
+from sqlalchemy import create_engine
+
+from backend.models import Transaction
+from backend.services.search import SQLITE_SCHEMA, TransactionSearch
+
+
+def add_transaction(session_factory):
+    db = session_factory()
+    db.add(Transaction(plan_id="plan_test", checkout_link="plan_test", amount=5.0, status="completed",
+                       customer_email="buyer@example.com"))
+    db.commit()
+    db.close()
+
+
+def test_startup_builds_a_missing_index_in_the_background(engine, session_factory):
+    add_transaction(session_factory)
+    search = TransactionSearch()
+    search.install(engine)
+    assert search._builder is not None
+    search._builder.join(5)
+
+    db = session_factory()
+    result = search.search(db, "buyer@example")
+    db.close()
+    assert result["backend"] == "fts5"
+    assert [row["id"] for row in result["results"]] == [1]
+
+
+def test_existing_index_is_used_without_building(engine):
+    first = TransactionSearch()
+    first.install(engine)
+    first._builder.join(5)
+
+    second = TransactionSearch()
+    second.install(engine)
+    assert second.backend == "fts5"
+    assert second._builder is None
+
+
+def test_worker_locked_out_switches_once_the_build_commits(engine, session_factory):
+    add_transaction(session_factory)
+
+    # Another worker's build, still uncommitted (pysqlite would autocommit the DDL otherwise)
+    builder = sqlite3.connect(engine.url.database, isolation_level=None)
+    builder.execute("BEGIN")
+    for statement in SQLITE_SCHEMA:
+        builder.execute(statement)
+
+    impatient = create_engine(engine.url, connect_args={"check_same_thread": False, "timeout": 0.1})
+    search = TransactionSearch()
+    search.install(impatient)
+    search._builder.join(5)
+    assert search.backend == "like"
+
+    builder.execute("COMMIT")
+    builder.close()
+    db = session_factory()
+    result = search.search(db, "buyer@example")
+    db.close()
+    impatient.dispose()
+    assert result["backend"] == "fts5"
+    assert [row["id"] for row in result["results"]] == [1]
@@ -0,0 +1,53 @@
+from pathlib import Path
+
+import httpx
+import pytest
+from jinja2 import Environment, FileSystemLoader
+
+from backend.build_assets import PROJECT_ROOT, build
+from backend.services.static_assets import IMMUTABLE_CACHE_CONTROL, AssetManifest, PrecompressedStaticFiles
+
+PAGES = {"index.html": {}, "success.html": {}, "cancel.html": {}, "admin.html": {"transactions": []}}
+
+
+@pytest.fixture
+def built(tmp_path):
+    output = tmp_path / "dist"
+    build(PROJECT_ROOT / "frontend" / "public", output)
+    manifest = AssetManifest()
+    manifest.load(output)
+    return output, manifest
+
+
+def render(manifest: AssetManifest, template: str) -> str:
+    env = Environment(loader=FileSystemLoader(str(PROJECT_ROOT / "backend" / "templates")))
+    env.globals["asset_url"] = manifest.url
+    return env.get_template(template).render(PAGES[template])
+
+
+@pytest.mark.parametrize("template", sorted(PAGES))
+def test_pages_link_fingerprinted_assets(built, template):
+    output, manifest = built
+    html = render(manifest, template)
+    page = Path(template).stem
+
+    assert "<style>" not in html
+    assert f'href="/static/{manifest.entries[f"css/{page}.css"]}"' in html
+    if f"js/{page}.js" in manifest.entries:
+        assert f'src="/static/{manifest.entries[f"js/{page}.js"]}"' in html
+        assert "<script>" not in html
+
+
+@pytest.mark.anyio
+async def test_linked_assets_are_served_immutable_and_precompressed(built):
+    output, manifest = built
+    app = PrecompressedStaticFiles(directory=str(output), manifest=manifest)
+    url = manifest.url("js/success.js")[len("/static"):]
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        response = await client.get(url, headers={"Accept-Encoding": "gzip"})
+
+    assert response.status_code == 200
+    assert response.headers["cache-control"] == IMMUTABLE_CACHE_CONTROL
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.text == (PROJECT_ROOT / "frontend" / "public" / "js" / "success.js").read_text()
@@ -0,0 +1,35 @@
+import httpx
+import pytest
+
+from backend.services.user_tracking import SessionCookieMiddleware
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setenv("SECRET_KEY", "test-secret")
+
+    async def endpoint(scope, receive, send):
+        await send({"type": "http.response.start", "status": 204, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    transport = httpx.ASGITransport(app=SessionCookieMiddleware(endpoint))
+    return httpx.AsyncClient(transport=transport, base_url="http://test")
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("path", ["/", "/api/create-cerebra-checkout", "/api/transactions/1"])
+async def test_pages_and_browser_api_get_a_session(client, path):
+    async with client:
+        response = await client.get(path)
+    assert "cerebra_session=" in response.headers["set-cookie"]
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("path", [
+    "/static/app.js", "/metrics", "/api/webhooks/whop", "/api/admin/bulk",
+    "/api/transactions/1/wait", "/api/transactions/1/events",
+])
+async def test_machine_traffic_gets_no_session(client, path):
+    async with client:
+        response = await client.get(path)
+    assert "set-cookie" not in response.headers
@@ -0,0 +1,108 @@
+import asyncio
+
+import httpx
+import pytest
+
+from backend.services.cache import cache
+from backend.services.whop_service import WhopApiError, WhopService
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    cache.clear()
+    yield
+    cache.clear()
+
+
+@pytest.mark.anyio
+async def test_transient_failures_are_retried(whop):
+    whop.sessions["ch_1"] = {"id": "ch_1", "status": "completed"}
+    whop.failures = [503, httpx.ConnectError("connection refused")]
+    client = whop.client(max_retries=2)
+
+    assert (await client.get_checkout_session("ch_1"))["status"] == "completed"
+    assert len(whop.requests) == 3
+    await client.aclose()
+
+
+@pytest.mark.anyio
+async def test_concurrent_lookups_share_one_call_and_are_cached(whop):
+    whop.sessions["ch_1"] = {"id": "ch_1", "status": "pending"}
+    client = whop.client()
+
+    results = await asyncio.gather(*(client.get_checkout_session("ch_1") for _ in range(10)))
+    assert {result["status"] for result in results} == {"pending"}
+    assert len(whop.requests) == 1
+
+    await client.get_checkout_session("ch_1")
+    assert len(whop.requests) == 1
+    await client.aclose()
+
+
+@pytest.mark.anyio
+async def test_client_errors_are_not_retried(whop):
+    client = whop.client(max_retries=3)
+
+    with pytest.raises(WhopApiError) as error:
+        await client.get_payment("pay_missing")
+    assert error.value.status_code == 404
+    assert len(whop.requests) == 1
+    assert client.circuit.state == "closed"
+    await client.aclose()
+
+
+@pytest.mark.anyio
+async def test_circuit_opens_fails_fast_and_recovers(whop):
+    whop.payments = [{"id": "pay_1", "status": "paid"}]
+    client = whop.client(max_retries=0)
+    client.circuit.failure_threshold = 2
+    client.circuit.reset_timeout = 60
+
+    whop.failures = [500, 500]
+    for _ in range(2):
+        with pytest.raises(WhopApiError):
+            await client.get_payment("pay_1")
+    assert client.circuit.state == "open"
+
+    with pytest.raises(WhopApiError, match="circuit open"):
+        await client.get_payment("pay_1")
+    assert len(whop.requests) == 2
+
+    client.circuit.reset_timeout = 0
+    assert client.circuit.state == "half_open"
+    assert (await client.get_payment("pay_1"))["status"] == "paid"
+    assert client.circuit.state == "closed"
+    await client.aclose()
+
+
+@pytest.mark.anyio
+async def test_trial_that_raises_unexpectedly_does_not_wedge_the_circuit(whop):
+    whop.payments = [{"id": "pay_1", "status": "paid"}]
+    client = whop.client(max_retries=0)
+    client.circuit.failure_threshold = 1
+    client.circuit.reset_timeout = 0
+
+    whop.failures = [500, ValueError("undecodable answer")]
+    with pytest.raises(WhopApiError):
+        await client.get_payment("pay_1")
+    assert client.circuit.state == "half_open"
+    with pytest.raises(ValueError):
+        await client.get_payment("pay_1")
+
+    assert (await client.get_payment("pay_1"))["status"] == "paid"
+    assert client.circuit.state == "closed"
+    await client.aclose()
+
+
+@pytest.mark.anyio
+async def test_session_status_is_unknown_when_whop_cannot_answer(monkeypatch, whop):
+    service = WhopService()
+    monkeypatch.setattr(service, "api", whop.client(max_retries=0))
+
+    assert (await service.get_session_status("ch_missing"))["status"] == "unknown"
+    whop.sessions["ch_1"] = {"id": "ch_1", "status": "completed"}
+    assert (await service.get_session_status("ch_1"))["status"] == "completed"
+
+    service.api.api_key = None
+    assert await service.get_session_status("ch_1") == {"status": "unknown"}
+    await service.close()